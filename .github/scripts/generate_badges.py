@@ -6,61 +6,363 @@ y genera badges estáticos en formato SVG usando la biblioteca `pybadges`.
 Los badges se almacenan en la carpeta `docs/badges/` y el README se actualiza
 para referenciar los nuevos badges.
 
+Todas las métricas (versión, último commit, licencia, estrellas, tamaño, issues
+abiertas y estado de CI) se obtienen con una sola consulta GraphQL, así que
+cada ejecución cuesta una petición sin importar cuántos badges haya. Si la
+consulta falla se usa la API REST: las peticiones comparten una sesión con pool
+de conexiones, se hacen en paralelo y son condicionales (las ETags y las
+respuestas se guardan en `BADGES_CACHE` entre ejecuciones, así que si nada
+cambió GitHub responde 304, sin cuerpo y sin gastar cuota).
+
+Con `--local` la versión (última etiqueta), el último commit, el tamaño (almacén
+de objetos) y la licencia se leen del propio checkout de git; solo estrellas,
+issues y CI van a la API, y sin token (p. ej. en forks) o con `--offline` esos
+badges se dejan como están.
+
+`docs/badges/manifest.json` guarda etiqueta, valor, color y hash de cada badge:
+solo se vuelven a renderizar los que cambiaron, y ningún archivo se reescribe
+si su contenido es idéntico. Si nada cambió el script sale con
+`EXIT_UNCHANGED` (3) para que el workflow omita el commit.
+
 Uso:
-    python generate_badges.py <GITHUB_TOKEN>
+    GITHUB_TOKEN=... GITHUB_REPOSITORY=dueño/repo python generate_badges.py
+    python generate_badges.py --local [--offline]
+
+`GITHUB_API_URL` permite apuntar a otro servidor (p. ej. un stub local).
 """
 
+import argparse
+import hashlib
+import json
 import os
 import re
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
 
-from pybadges import badge
-import requests
+# pybadges y requests se importan al usarse: en modo --local sin red el script
+# no paga su carga (~200 ms).
 
 # Constantes
 REPO_NAME = os.getenv("GITHUB_REPOSITORY")
+API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com").rstrip("/")
 BADGES_DIR = "docs/badges"
 README_PATH = "README.md"
+MANIFEST_PATH = os.path.join(BADGES_DIR, "manifest.json")
+# Código de salida cuando no cambió nada (el workflow omite el commit).
+EXIT_UNCHANGED = 3
+CACHE_PATH = os.getenv("BADGES_CACHE", ".cache/badges/http-cache.json")
+TIMEOUT = (5, 15)  # Segundos para conectar y para leer
 
+METRICS_QUERY = """
+query($owner: String!, $name: String!) {
+  repository(owner: $owner, name: $name) {
+    latestRelease { tagName }
+    licenseInfo { spdxId }
+    stargazerCount
+    diskUsage
+    issues(states: OPEN) { totalCount }
+    defaultBranchRef {
+      target {
+        ... on Commit {
+          oid
+          statusCheckRollup { state }
+        }
+      }
+    }
+  }
+}
+"""
 
-def fetch_latest_release(token):
-    """Obtiene la última versión del repositorio."""
-    url = f"https://api.github.com/repos/{REPO_NAME}/releases/latest"
-    headers = {"Authorization": f"token {token}"}
-    response = requests.get(url, headers=headers)
+# Métricas que solo conoce la API (el resto se puede leer del checkout).
+REMOTE_METRICS = ("stars", "issues", "ci")
+
+# Primera línea de los textos de licencia más comunes → identificador SPDX.
+LICENSE_MARKERS = (
+    ("MIT License", "MIT"),
+    ("Apache License", "Apache-2.0"),
+    ("GNU LESSER GENERAL PUBLIC LICENSE", "LGPL-3.0"),
+    ("GNU AFFERO GENERAL PUBLIC LICENSE", "AGPL-3.0"),
+    ("GNU GENERAL PUBLIC LICENSE", "GPL-3.0"),
+    ("Mozilla Public License", "MPL-2.0"),
+    ("BSD 3-Clause License", "BSD-3-Clause"),
+    ("BSD 2-Clause License", "BSD-2-Clause"),
+    ("The Unlicense", "Unlicense"),
+)
+
+# Estado de los checks (GraphQL) o conclusión del último workflow (REST).
+CI_STATUS = {
+    "SUCCESS": "passing",
+    "FAILURE": "failing",
+    "ERROR": "failing",
+    "success": "passing",
+    "failure": "failing",
+    "timed_out": "failing",
+}
+
+
+class GitHubClient:
+    """Cliente de la API REST de GitHub con sesión compartida y caché de ETags.
 
-    if response.status_code == 404:
+    Cada respuesta se guarda con su `ETag`/`Last-Modified`; la siguiente
+    petición a la misma URL las envía y, si GitHub responde 304, se reutiliza
+    el cuerpo guardado. Es seguro usarlo desde varios hilos.
+    """
+
+    def __init__(self, token, cache_path=CACHE_PATH, base_url=API_URL):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        self.base_url = base_url
+        self.cache_path = cache_path
+        self.session = requests.Session()
+        retries = Retry(total=3, backoff_factor=0.5, status_forcelist=(502, 503, 504))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=8, max_retries=retries)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(
+            {
+                "Authorization": f"token {token}",
+                "Accept": "application/vnd.github+json",
+                "User-Agent": "sentu-badges",
+            }
+        )
+        self.stats = {"requests": 0, "not_modified": 0}
+        self._lock = threading.Lock()
+        try:
+            with open(cache_path, encoding="utf-8") as f:
+                self.cache = json.load(f)
+        except (OSError, ValueError):
+            self.cache = {}
+
+    def get(self, path):
+        """Devuelve `(estado, json)` de `GET path`; 404 no es un error."""
+        url = f"{self.base_url}{path}"
+        with self._lock:
+            cached = self.cache.get(url)
+        headers = {}
+        if cached and cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached and cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+        response = self.session.get(url, headers=headers, timeout=TIMEOUT)
+        with self._lock:
+            self.stats["requests"] += 1
+            if response.status_code == 304 and cached:
+                self.stats["not_modified"] += 1
+                return cached["status"], cached["body"]
+        if response.status_code != 404:
+            response.raise_for_status()
+        body = response.json() if response.status_code == 200 else None
+        with self._lock:
+            self.cache[url] = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "status": response.status_code,
+                "body": body,
+            }
+        return response.status_code, body
+
+    def graphql(self, query, variables):
+        """Ejecuta una consulta GraphQL; los errores de la consulta se elevan."""
+        response = self.session.post(
+            f"{self.base_url}/graphql",
+            json={"query": query, "variables": variables},
+            timeout=TIMEOUT,
+        )
+        with self._lock:
+            self.stats["requests"] += 1
+        response.raise_for_status()
+        data = response.json()
+        if data.get("errors"):
+            raise RuntimeError(data["errors"][0].get("message", data["errors"]))
+        return data["data"]
+
+    def save(self):
+        """Guarda la caché de forma atómica para la próxima ejecución."""
+        directory = os.path.dirname(self.cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.cache_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.cache, f)
+        os.replace(tmp, self.cache_path)
+
+
+def fetch_latest_release(client):
+    """Obtiene la última versión del repositorio."""
+    status, data = client.get(f"/repos/{REPO_NAME}/releases/latest")
+    if status == 404:
         # No hay releases disponibles
         return "No releases"
-
-    response.raise_for_status()  # Lanza una excepción para otros errores HTTP
-    return response.json()["tag_name"]
+    return data["tag_name"]
 
 
-def fetch_last_commit(token):
+def fetch_last_commit(client):
     """Obtiene el hash del último commit del repositorio."""
-    url = f"https://api.github.com/repos/{REPO_NAME}/commits"
-    headers = {"Authorization": f"token {token}"}
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    return response.json()[0]["sha"][:7]  # Retorna los primeros 7 caracteres
+    # Solo hace falta el más reciente.
+    _, data = client.get(f"/repos/{REPO_NAME}/commits?per_page=1")
+    return data[0]["sha"][:7]  # Retorna los primeros 7 caracteres
 
 
-def fetch_repo_info(token):
+def fetch_repo_info(client):
     """Obtiene información general del repositorio (licencia, estrellas, tamaño)."""
-    url = f"https://api.github.com/repos/{REPO_NAME}"
-    headers = {"Authorization": f"token {token}"}
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    data = response.json()
+    _, data = client.get(f"/repos/{REPO_NAME}")
     return {
         "license": data["license"]["spdx_id"] if data["license"] else "None",
         "stars": data["stargazers_count"],
         "size": f"{data['size']} KB",
+        "branch": data["default_branch"],
     }
 
 
-def generate_badge(label, value, filename, color=None):
-    """Genera un badge estático en formato SVG con un color específico."""
+def fetch_open_issues(client):
+    """Cuenta las issues abiertas (sin pull requests, que REST mezcla)."""
+    _, data = client.get(
+        f"/search/issues?q=repo:{REPO_NAME}+type:issue+state:open&per_page=1"
+    )
+    return data["total_count"]
+
+
+def fetch_ci_status(client, branch=None):
+    """Estado del último workflow terminado en `branch`: passing, failing o unknown.
+
+    Como la consulta GraphQL, mira la rama por defecto si no se indica otra. Solo
+    cuentan las ejecuciones terminadas: la más reciente suele ser este mismo
+    workflow, aún en curso y sin conclusión.
+    """
+    if branch is None:
+        _, repo = client.get(f"/repos/{REPO_NAME}")
+        branch = repo["default_branch"]
+    _, data = client.get(
+        f"/repos/{REPO_NAME}/actions/runs?branch={quote(branch)}"
+        "&status=completed&per_page=1"
+    )
+    runs = data.get("workflow_runs") or []
+    return CI_STATUS.get(runs[0].get("conclusion"), "unknown") if runs else "unknown"
+
+
+def fetch_all(client, keys=None):
+    """Métricas por REST: todas las consultas a la vez sobre la sesión compartida.
+
+    Con `keys` solo se hacen las peticiones que esas métricas necesitan. Si
+    también se pide el repositorio, el estado de CI espera a su rama por defecto
+    en lugar de pedirlo dos veces.
+    """
+    fetchers = {
+        "release": fetch_latest_release,
+        "commit": fetch_last_commit,
+        "repo": fetch_repo_info,
+        "issues": fetch_open_issues,
+        "ci": fetch_ci_status,
+    }
+    if keys is not None:
+        needed = {
+            "repo" if key in ("license", "stars", "size") else key for key in keys
+        }
+        fetchers = {key: fetch for key, fetch in fetchers.items() if key in needed}
+    ci_after_repo = "ci" in fetchers and "repo" in fetchers
+    if ci_after_repo:
+        del fetchers["ci"]
+    with ThreadPoolExecutor(max_workers=len(fetchers)) as pool:
+        futures = {key: pool.submit(fetch, client) for key, fetch in fetchers.items()}
+        results = {key: future.result() for key, future in futures.items()}
+    repo = results.pop("repo", {})
+    branch = repo.pop("branch", None)
+    if ci_after_repo:
+        results["ci"] = fetch_ci_status(client, branch)
+    metrics = {**results, **repo}
+    return {key: metrics[key] for key in keys} if keys is not None else metrics
+
+
+def fetch_graphql(client):
+    """Métricas con una única consulta GraphQL."""
+    owner, name = REPO_NAME.split("/", 1)
+    repo = client.graphql(METRICS_QUERY, {"owner": owner, "name": name})["repository"]
+    commit = (repo.get("defaultBranchRef") or {}).get("target") or {}
+    rollup = commit.get("statusCheckRollup") or {}
+    return {
+        "release": (repo.get("latestRelease") or {}).get("tagName", "No releases"),
+        "commit": commit.get("oid", "")[:7] or "unknown",
+        "license": (repo.get("licenseInfo") or {}).get("spdxId") or "None",
+        "stars": repo["stargazerCount"],
+        "size": f"{repo['diskUsage']} KB",
+        "issues": repo["issues"]["totalCount"],
+        "ci": CI_STATUS.get(rollup.get("state"), "unknown"),
+    }
+
+
+def collect_metrics(client, keys=None):
+    """Obtiene las métricas (o solo `keys`) por GraphQL y, si falla, por REST."""
+    import requests
+
+    try:
+        metrics = fetch_graphql(client)
+        return {key: metrics[key] for key in keys} if keys is not None else metrics
+    except (requests.RequestException, RuntimeError, KeyError, TypeError) as e:
+        print(f"GraphQL no disponible ({e}); se usa la API REST.")
+        return fetch_all(client, keys)
+
+
+def _git(*args):
+    result = subprocess.run(["git", *args], capture_output=True, text=True)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def detect_license(path="LICENSE"):
+    """Identificador SPDX a partir del texto del archivo de licencia."""
+    for candidate in (path, f"{path}.md", f"{path}.txt", "COPYING"):
+        try:
+            with open(candidate, encoding="utf-8") as f:
+                head = f.read(200)
+        except OSError:
+            continue
+        for marker, spdx_id in LICENSE_MARKERS:
+            if marker in head:
+                return spdx_id
+        return "Other"
+    return "None"
+
+
+def local_metrics():
+    """Métricas que el checkout ya tiene, sin red (requiere historial y tags)."""
+    commit = _git("rev-parse", "--short=7", "HEAD")
+    if commit is None:
+        raise RuntimeError("El directorio actual no es un repositorio git.")
+    # Como `size` de GitHub: KB del almacén de objetos (sueltos y empaquetados).
+    objects = dict(
+        line.split(": ", 1) for line in _git("count-objects", "-v").splitlines()
+    )
+    size = int(objects.get("size", 0)) + int(objects.get("size-pack", 0))
+    return {
+        "release": _git("describe", "--tags", "--abbrev=0") or "No releases",
+        "commit": commit,
+        "license": detect_license(),
+        "size": f"{size} KB",
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--local",
+        action="store_true",
+        help="Lee del checkout de git todo lo que no necesita la API.",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Con --local, no consulta la API aunque haya token.",
+    )
+    return parser.parse_args(argv)
+
+
+def badge_color(label, value, color=None):
+    """Color (hex sin `#`) de un badge según su etiqueta y su valor."""
     # Determinar el color basado en el valor del badge
     if label == "Coverage":
         if value == "unknown":
@@ -92,88 +394,161 @@ def generate_badge(label, value, filename, color=None):
             color = "DDB6F2"
         else:
             color = "CCCCCC"  # Color predeterminado
+    return color
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def write_if_changed(path, content):
+    """Escribe `content` solo si difiere (por hash) de lo que ya hay en `path`.
+
+    Returns:
+        bool: True si el archivo cambió.
+    """
+    data = content.encode("utf-8")
+    try:
+        with open(path, "rb") as f:
+            if _sha256(f.read()) == _sha256(data):
+                return False
+    except OSError:
+        pass
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return True
+
+
+def load_manifest(path=MANIFEST_PATH):
+    """`{archivo: {label, value, color, sha256}}` de la última ejecución."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def generate_badge(label, value, filename, color=None, manifest=None):
+    """Genera un badge estático en formato SVG con un color específico.
+
+    Con `manifest` el SVG solo se vuelve a renderizar si cambió su etiqueta,
+    valor o color, o si el archivo ya no coincide con el hash guardado.
+
+    Returns:
+        bool: True si el archivo cambió.
+    """
+    color = badge_color(label, value, color)
+    filepath = os.path.join(BADGES_DIR, filename)
+    inputs = {"label": label, "value": str(value), "color": color}
+    previous = (manifest or {}).get(filename)
+    if previous and {key: previous.get(key) for key in inputs} == inputs:
+        try:
+            with open(filepath, "rb") as f:
+                if _sha256(f.read()) == previous.get("sha256"):
+                    return False
+        except OSError:
+            pass
 
     # Generar el badge
+    from pybadges import badge
+
     badge_svg = badge(left_text=label, right_text=str(value), right_color=f"#{color}")
-    os.makedirs(BADGES_DIR, exist_ok=True)
-    filepath = os.path.join(BADGES_DIR, filename)
-    with open(filepath, "w", encoding="utf-8") as f:
-        f.write(badge_svg)
-    return filepath
+    changed = write_if_changed(filepath, badge_svg)
+    if manifest is not None:
+        manifest[filename] = {**inputs, "sha256": _sha256(badge_svg.encode("utf-8"))}
+    return changed
+
+
+# Una sola pasada: cada tipo de badge de shields.io → su SVG estático.
+SHIELDS_SRC = re.compile(
+    r'src="https://img\.shields\.io/github/'
+    r"(v/release|last-commit|license|stars|issues|repo-size|actions/workflow/status)"
+    r'/[^"]+"'
+)
+SHIELDS_FILES = {
+    "v/release": "version.svg",
+    "last-commit": "last-commit.svg",
+    "license": "license.svg",
+    "stars": "stars.svg",
+    "issues": "issues.svg",
+    "repo-size": "repo-size.svg",
+    "actions/workflow/status": "ci-status.svg",
+}
 
 
 def update_readme():
-    """Actualiza el README para usar los badges estáticos generados."""
+    """Actualiza el README para usar los badges estáticos generados.
+
+    Returns:
+        bool: True si el README cambió.
+    """
     with open(README_PATH, encoding="utf-8") as f:
         readme_content = f.read()
 
     # Reemplazar solo el atributo `src` de cada badge
-    readme_content = re.sub(
-        r'src="https://img\.shields\.io/github/v/release/[^"]+"',
-        'src="docs/badges/version.svg"',
-        readme_content,
-    )
-    readme_content = re.sub(
-        r'src="https://img\.shields\.io/github/last-commit/[^"]+"',
-        'src="docs/badges/last-commit.svg"',
-        readme_content,
-    )
-    readme_content = re.sub(
-        r'src="https://img\.shields\.io/github/license/[^"]+"',
-        'src="docs/badges/license.svg"',
-        readme_content,
-    )
-    readme_content = re.sub(
-        r'src="https://img\.shields\.io/github/stars/[^"]+"',
-        'src="docs/badges/stars.svg"',
-        readme_content,
-    )
-    readme_content = re.sub(
-        r'src="https://img\.shields\.io/github/issues/[^"]+"',
-        'src="docs/badges/issues.svg"',
-        readme_content,
-    )
-    readme_content = re.sub(
-        r'src="https://img\.shields\.io/github/repo-size/[^"]+"',
-        'src="docs/badges/repo-size.svg"',
-        readme_content,
-    )
-    readme_content = re.sub(
-        r'src="https://img\.shields\.io/github/actions/workflow/status/[^"]+"',
-        'src="docs/badges/ci-status.svg"',
-        readme_content,
+    readme_content = SHIELDS_SRC.sub(
+        lambda m: f'src="{BADGES_DIR}/{SHIELDS_FILES[m.group(1)]}"', readme_content
     )
+    return write_if_changed(README_PATH, readme_content)
 
-    with open(README_PATH, "w", encoding="utf-8") as f:
-        f.write(readme_content)
 
-
-def main():
+def main(argv=None):
     """Función principal del script."""
+    args = parse_args(argv)
     token = os.getenv("GITHUB_TOKEN")
-    print(f"Token obtenido: {token}")  # Depuración: Imprime el token obtenido
-    if not token:
+    if not token and not args.local:
         raise ValueError("El token GITHUB_TOKEN no está configurado.")
 
     try:
         # Obtener datos del repositorio
-        latest_release = fetch_latest_release(token)
-        last_commit = fetch_last_commit(token)
-        repo_info = fetch_repo_info(token)
-
-        # Generar badges con colores dinámicos
-        generate_badge("Versión", latest_release, "version.svg")
-        generate_badge("Último Commit", last_commit, "last-commit.svg")
-        generate_badge("Licencia", repo_info["license"], "license.svg")
-        generate_badge("Estrellas", str(repo_info["stars"]), "stars.svg")
-        generate_badge("Issues", "0", "issues.svg")  # TODO: Implementar conteo real
-        generate_badge("Tamaño", repo_info["size"], "repo-size.svg")
-
-        print("Badges generados y README actualizado correctamente.")
+        metrics = local_metrics() if args.local else {}
+        remote = REMOTE_METRICS if args.local else None
+        if args.local and (args.offline or not token or not REPO_NAME):
+            print("Sin API: se conservan los badges de estrellas, issues y CI.")
+        else:
+            client = GitHubClient(token)
+            metrics.update(collect_metrics(client, remote))
+            client.save()
+            print(
+                f"API de GitHub: {client.stats['requests']} peticiones, "
+                f"{client.stats['not_modified']} sin cambios (304)."
+            )
+
+        # Generar badges con colores dinámicos (solo los que cambiaron)
+        manifest = load_manifest()
+        changed = []
+        for key, label, filename in (
+            ("release", "Versión", "version.svg"),
+            ("commit", "Último Commit", "last-commit.svg"),
+            ("license", "Licencia", "license.svg"),
+            ("stars", "Estrellas", "stars.svg"),
+            ("issues", "Issues", "issues.svg"),
+            ("size", "Tamaño", "repo-size.svg"),
+            ("ci", "CI", "ci-status.svg"),
+        ):
+            if key in metrics and generate_badge(
+                label, str(metrics[key]), filename, manifest=manifest
+            ):
+                changed.append(filename)
+        if update_readme():
+            changed.append(README_PATH)
+        if write_if_changed(MANIFEST_PATH, json.dumps(manifest, indent=2) + "\n"):
+            changed.append(MANIFEST_PATH)
     except Exception as e:
         print(f"Error al generar badges: {e}")
         raise
 
+    if not changed:
+        print("Badges y README sin cambios.")
+        return EXIT_UNCHANGED
+    print(f"Actualizados: {', '.join(changed)}")
+    return 0
+
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""Callback de Ansible que anota el inicio y el fin de cada tarea.
+
+``sentu_install.py --trace`` lo activa (``callbacks_enabled``) y lee los
+eventos para incluir roles y tareas en la traza.
+"""
+
+import json
+import os
+import time
+
+from ansible.plugins.callback import CallbackBase
+
+DOCUMENTATION = r"""
+---
+name: sentu_trace
+type: aggregate
+short_description: Registra la duración de cada tarea para sentu_install.py --trace
+description:
+  - Escribe una línea JSON por tarea (role, nombre, inicio, fin y estado) en el
+    archivo indicado por la variable de entorno C(SENTU_TRACE_EVENTS).
+  - Sin esa variable no hace nada.
+"""
+
+
+class CallbackModule(CallbackBase):
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = "aggregate"
+    CALLBACK_NAME = "sentu_trace"
+    CALLBACK_NEEDS_ENABLED = True
+
+    def __init__(self):
+        super().__init__()
+        self._path = os.environ.get("SENTU_TRACE_EVENTS")
+        self._current = None
+
+    def _start(self, task):
+        self._finish("ok")
+        self._current = (task, time.time())
+
+    def _finish(self, status):
+        if self._current is None or not self._path:
+            return
+        task, start = self._current
+        self._current = None
+        event = {
+            "role": task._role.get_name() if task._role else "",
+            "task": task.get_name(),
+            "start": start,
+            "end": time.time(),
+            "status": status,
+            "pid": os.getpid(),
+        }
+        with open(self._path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(event) + "\n")
+
+    def v2_playbook_on_task_start(self, task, is_conditional):
+        self._start(task)
+
+    def v2_playbook_on_handler_task_start(self, task):
+        self._start(task)
+
+    def v2_runner_on_ok(self, result):
+        self._finish("changed" if result._result.get("changed") else "ok")
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        self._finish("failed")
+
+    def v2_runner_on_skipped(self, result):
+        self._finish("skipped")
+
+    def v2_runner_on_unreachable(self, result):
+        self._finish("unreachable")
+
+    def v2_playbook_on_stats(self, stats):
+        self._finish("ok")
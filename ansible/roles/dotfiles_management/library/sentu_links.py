@@ -0,0 +1,94 @@
+#!/usr/bin/python
+"""Módulo de Ansible que reconcilia los enlaces de los dotfiles en una sola invocación.
+
+Reutiliza el motor de enlaces de ``sentu_install.py`` desde el propio checkout.
+"""
+
+import sys
+from pathlib import Path
+
+from ansible.module_utils.basic import AnsibleModule
+
+DOCUMENTATION = r"""
+---
+module: sentu_links
+short_description: Reconcilia los enlaces simbólicos de los dotfiles
+description:
+  - Calcula los enlaces deseados para C(config/), los archivos de C(home/) y
+    C(home/local/share), los compara con el estado actual con un solo C(lstat)
+    por destino y aplica únicamente las diferencias.
+  - Los archivos o directorios reales que ocupan un destino se mueven a un
+    respaldo C(.sentu-backup-*) antes de enlazar.
+options:
+  repo:
+    description: Checkout de los dotfiles (contiene C(sentu_install.py)).
+    type: path
+    required: true
+  home:
+    description: Directorio personal donde se crean los enlaces.
+    type: path
+    required: true
+  profile:
+    description: Perfil con las claves C(config) y C(local_share) ("*" o lista).
+    type: dict
+    default: {config: "*", local_share: "*"}
+"""
+
+RETURN = r"""
+counts:
+  description: Número de enlaces creados, sin cambios, reparados y respaldados.
+  type: dict
+  returned: always
+created:
+  description: Destinos enlazados por primera vez.
+  type: list
+  returned: always
+repaired:
+  description: Enlaces que apuntaban a otro origen o estaban rotos.
+  type: list
+  returned: always
+backed_up:
+  description: Destinos reales respaldados antes de enlazar.
+  type: list
+  returned: always
+"""
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec={
+            "repo": {"type": "path", "required": True},
+            "home": {"type": "path", "required": True},
+            "profile": {
+                "type": "dict",
+                "default": {"config": "*", "local_share": "*"},
+            },
+        },
+        supports_check_mode=True,
+    )
+    repo = Path(module.params["repo"])
+    sys.path.insert(0, str(repo))
+    try:
+        import sentu_install
+    except ImportError as e:
+        module.fail_json(msg=f"No se pudo importar sentu_install.py desde {repo}: {e}")
+
+    links = sentu_install.desired_links(
+        repo, Path(module.params["home"]), module.params["profile"]
+    )
+    try:
+        report = sentu_install.reconcile_links(links, dry_run=module.check_mode)
+    except OSError as e:
+        module.fail_json(msg=f"Error al reconciliar los enlaces: {e}")
+
+    module.exit_json(
+        changed=report.changed,
+        counts=report.counts(),
+        created=report.created,
+        repaired=report.repaired,
+        backed_up=report.backed_up,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""Benchmark del emparejador de iconos de ``ranger_devicons``.
+
+Compara, sobre una lista de nombres de archivo sintética, tres formas de
+resolver el icono de un archivo:
+
+- ``dict``: la búsqueda original (nombre exacto y, si no, última extensión);
+  no reconoce extensiones compuestas (``.tar.gz``) ni patrones.
+- ``globs``: la misma búsqueda más una lista de patrones ``fnmatch`` probada
+  en orden, lo obvio para añadir patrones sin trie.
+- ``trie``: ``SuffixTrie``, el trie de sufijos invertidos que usa el plugin.
+
+Cada escenario añade ``N`` reglas sintéticas (extensiones, nombres exactos y
+patrones a partes iguales) para ver cómo escala cada método con el número de
+reglas. Se mide el tiempo por búsqueda (sin la caché LRU del plugin, que
+oculta el coste real en directorios enormes) y la cobertura: el porcentaje de
+nombres que reciben un icono.
+
+Uso::
+
+    python3 benchmarks/devicons.py
+    python3 benchmarks/devicons.py --names 100000 --rules 0 1000 10000
+"""
+
+import argparse
+import fnmatch
+import importlib.util
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DEVICONS = REPO_ROOT / "config/ranger/plugins/ranger_devicons/devicons.py"
+
+# Nombres que aparecen en un directorio de exportaciones típico, además de
+# todas las claves de las tablas del plugin.
+STEMS = ["data", "part-00042", "report", "main", "index", "backup", "Export"]
+SUFFIXES = [
+    ".py",
+    ".PY",
+    ".tar.gz",
+    ".tar.zst",
+    ".parquet",
+    ".parquet.snappy",
+    ".csv",
+    ".json",
+    ".log",
+    ".min.js",
+    ".bin",
+    "",
+]
+PATTERNED = ["test_{}.py", "{}_test.go", "{}.spec.ts", "Dockerfile.{}"]
+
+
+def load_devicons():
+    spec = importlib.util.spec_from_file_location("devicons", DEVICONS)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_names(devicons, count, seed):
+    rng = random.Random(seed)
+    known = list(devicons.file_node_exact_matches)
+    known += [f"file.{ext}" for ext in devicons.file_node_extensions]
+    names = []
+    for _ in range(count):
+        roll = rng.random()
+        stem = f"{rng.choice(STEMS)}{rng.randrange(10_000)}"
+        if roll < 0.2:
+            names.append(rng.choice(known))
+        elif roll < 0.35:
+            names.append(rng.choice(PATTERNED).format(stem))
+        else:
+            names.append(stem + rng.choice(SUFFIXES))
+    return names
+
+
+def synthetic_rules(count):
+    """`count` reglas extra repartidas entre extensiones, nombres y patrones."""
+    third = count // 3
+    extensions = {f"x{i}": "?" for i in range(third)}
+    exact = {f"Name{i}.conf": "?" for i in range(third)}
+    patterns = {f"gen{i}_*.t{i}": "?" for i in range(count - 2 * third)}
+    return exact, extensions, patterns
+
+
+def dict_matcher(exact, extensions):
+    def match(name):
+        extension = name.rsplit(".", 1)[1].lower() if "." in name else None
+        return exact.get(name, extensions.get(extension))
+
+    return match
+
+
+def globs_matcher(exact, extensions, patterns):
+    by_dict = dict_matcher(exact, extensions)
+    compiled = [
+        (re.compile(fnmatch.translate(pattern.casefold())), icon)
+        for pattern, icon in patterns.items()
+    ]
+
+    def match(name):
+        if name in exact:
+            return exact[name]
+        folded = name.casefold()
+        for regex, icon in compiled:
+            if regex.match(folded):
+                return icon
+        return by_dict(name)
+
+    return match
+
+
+def measure(match, names, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for name in names:
+            match(name)
+        best = min(best, time.perf_counter() - start)
+    hits = sum(1 for name in names if match(name))
+    return best / len(names) * 1e9, 100.0 * hits / len(names)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--names", type=int, default=20_000, help="nombres por escenario"
+    )
+    parser.add_argument(
+        "--rules",
+        type=int,
+        nargs="+",
+        default=[0, 1_000, 10_000],
+        help="reglas sintéticas extra de cada escenario",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="repeticiones (mejor)")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    devicons = load_devicons()
+    names = make_names(devicons, args.names, args.seed)
+
+    print(f"{len(names)} nombres, mejor de {args.repeat} repeticiones")
+    print(
+        f"{'reglas':>8}{'método':>8}{'ns/búsqueda':>14}{'cobertura':>12}{'montaje':>10}"
+    )
+    for extra in args.rules:
+        exact, extensions, patterns = synthetic_rules(extra)
+        exact = {**devicons.file_node_exact_matches, **exact}
+        extensions = {**devicons.file_node_extensions, **extensions}
+        patterns = {**devicons.file_node_patterns, **patterns}
+        rules = len(exact) + len(extensions) + len(patterns)
+
+        start = time.perf_counter()
+        trie = devicons.SuffixTrie(exact, extensions, patterns)
+        build = time.perf_counter() - start
+        for label, match, setup in (
+            ("dict", dict_matcher(exact, extensions), None),
+            ("globs", globs_matcher(exact, extensions, patterns), None),
+            ("trie", trie.match, build),
+        ):
+            per_lookup, coverage = measure(match, names, args.repeat)
+            setup = f"{setup * 1e3:.0f} ms" if setup is not None else "-"
+            print(
+                f"{rules:>8}{label:>8}{per_lookup:>14.0f}{coverage:>11.1f}%{setup:>10}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
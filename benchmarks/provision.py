@@ -0,0 +1,495 @@
+#!/usr/bin/env python3
+"""Benchmark hermético de extremo a extremo de ``sentu_install.py``.
+
+Ejecuta el instalador completo (clonado, roles y post-instalación) en un
+directorio temporal que hace de ``HOME``, simulando Fedora y sin red:
+
+- ``git``, ``sudo``, ``dnf``, ``rpm``, ``curl``, ``fc-cache``, ``cargo`` y
+  ``go`` (más ``gem``, ``flatpak`` y ``usermod``) se sustituyen por stubs en
+  ``PATH`` que registran cada llamada y esperan ``--latency`` segundos.
+  ``sudo`` cambia ``HOME`` al de root, como el real, así que los roles con
+  ``become`` solo ven la caché del usuario si se les pasa explícitamente.
+- El repositorio se clona desde una copia local (``file://``) del commit
+  actual y las descargas se sirven desde una caché de artefactos sembrada
+  con contenido falso (``--offline``).
+
+Se mide una ejecución en frío y otra en caliente (repetición sobre el mismo
+``HOME``): tiempo de reloj, procesos lanzados, llamadas a cada herramienta,
+bytes escritos (``wchar`` de ``/proc/<pid>/io``, que incluye a los procesos
+hijos ya recogidos, así que reescribir un archivo igual también cuenta) y los
+pasos más lentos según ``--trace``. El resultado se
+guarda en JSON (por defecto ``benchmarks/results/<commit>.json``) para
+compararlo entre commits con ``--baseline``.
+
+Uso::
+
+    python3 benchmarks/provision.py --latency 0.05
+    python3 benchmarks/provision.py --baseline benchmarks/results/abc1234.json
+"""
+
+import argparse
+import io
+import json
+import os
+import pwd
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+import sentu_install
+
+FEDORA_VERSION = "41"
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+# Lanza el instalador y, cuando termina (y con él todos sus hijos, que ya se
+# han recogido), copia su ``/proc/self/io``: el kernel suma a cada proceso la
+# E/S de los hijos que espera.
+IO_WRAPPER = """import subprocess, sys
+code = subprocess.call(sys.argv[2:])
+with open("/proc/self/io") as f, open(sys.argv[1], "w") as out:
+    out.write(f.read())
+sys.exit(code)
+"""
+
+# Cabecera común: registra la llamada y simula la latencia de la herramienta.
+STUB_HEADER = """#!/bin/sh
+printf '%s\\t%s\\n' "${0##*/}" "$*" >> "$SENTU_BENCH_LOG"
+case "${SENTU_BENCH_LATENCY:-0}" in 0|0.0) ;; *) sleep "$SENTU_BENCH_LATENCY" ;; esac
+"""
+
+STUBS = {
+    # Las operaciones de red no se ejecutan: un clone solo crea el destino.
+    "git": """command=$1
+[ "$command" = -C ] && command=$3
+case "$command" in
+  clone|fetch|pull|push|ls-remote)
+    for arg; do
+      case "$arg" in http://*|https://*|ssh://*|git@*) network=1 ;; esac
+    done ;;
+esac
+if [ -z "$network" ]; then
+  exec {real_git} "$@"
+fi
+if [ "$1" = clone ]; then
+  eval "dest=\\${{$#}}"
+  case "$dest" in *://*|git@*) dest=$(basename "$dest" .git) ;; esac
+  mkdir -p "$dest"
+fi
+""",
+    # Como el sudo real: HOME pasa a ser el de root y la caché del usuario
+    # solo llega si se pasa explícitamente (--preserve-env o `env VAR=...`).
+    "sudo": """preserve=
+while [ $# -gt 0 ]; do
+  case "$1" in
+    -u|-g) shift 2 ;;
+    --preserve-env=*) preserve="${{1#--preserve-env=}}" ; shift ;;
+    -*) shift ;;
+    *) break ;;
+  esac
+done
+for var in XDG_CACHE_HOME SENTU_ARTIFACT_CACHE SENTU_OFFLINE; do
+  case ",$preserve," in *,"$var",*) ;; *) unset "$var" ;; esac
+done
+export HOME="$SENTU_BENCH_ROOT_HOME"
+[ $# -eq 0 ] || exec "$@"
+""",
+    # Base de datos RPM simulada: un nombre por línea en $SENTU_BENCH_RPMDB.
+    # Todo lo que se pide existe en los repositorios; los RPM locales
+    # declaran su nombre en una línea "Name: ...".
+    "dnf": """db="$SENTU_BENCH_RPMDB"
+command=$1
+shift
+case "$command" in
+  repoquery)
+    skip=
+    for arg; do
+      if [ -n "$skip" ]; then
+        # --whatprovides a,b: cada capacidad la ofrece un paquete homónimo.
+        [ "$skip" = provides ] && printf '@%s\\n' $(echo "$arg" | tr , ' ')
+        skip=
+        continue
+      fi
+      case "$arg" in
+        --qf) skip=1 ;;
+        --whatprovides) skip=provides ;;
+        -*) ;;
+        *) echo "$arg" ;;
+      esac
+    done ;;
+  install)
+    for arg; do
+      case "$arg" in
+        -*) ;;
+        */*) sed -n 's/^Name: //p' "$arg" >> "$db" ;;
+        *) echo "$arg" >> "$db" ;;
+      esac
+    done
+    echo "Complete!" ;;
+  upgrade) echo "Nothing to do." ;;
+esac
+""",
+    "rpm": """db="$SENTU_BENCH_RPMDB"
+touch "$db"
+case "$1" in
+  -qa) cat "$db" ;;
+  -qf)
+    shift 3
+    for path; do echo "file $path is not owned by any package"; done
+    exit 1 ;;
+  -q)
+    shift
+    [ "$1" = --qf ] && shift 2
+    status=0
+    for name; do
+      if grep -qx "$name" "$db"; then
+        echo "$name 0:1.0-1.fc{version}.x86_64"
+      else
+        echo "package $name is not installed"
+        status=1
+      fi
+    done
+    exit $status ;;
+esac
+""",
+}
+GENERIC_STUBS = ("curl", "fc-cache", "cargo", "go", "gem", "flatpak", "usermod")
+
+# Cuenta los procesos que lanza Python (instalador y subcomandos).
+SITECUSTOMIZE = """import os
+import sys
+
+_log = os.environ.get("SENTU_BENCH_SPAWNS")
+if _log:
+
+    def _audit(event, args):
+        if event in ("subprocess.Popen", "os.posix_spawn", "os.exec", "os.system"):
+            with open(_log, "a") as f:
+                f.write(event + "\\n")
+
+    sys.addaudithook(_audit)
+"""
+
+
+def write_stubs(bin_dir: Path):
+    """Crea los ejecutables falsos en ``bin_dir``."""
+    bin_dir.mkdir(parents=True)
+    real_git = shutil.which("git")
+    if real_git is None:
+        raise SystemExit("El benchmark necesita git instalado.")
+    for name in (*STUBS, *GENERIC_STUBS):
+        body = STUBS.get(name, "").format(real_git=real_git, version=FEDORA_VERSION)
+        stub = bin_dir / name
+        stub.write_text(STUB_HEADER + body, encoding="utf-8")
+        stub.chmod(0o755)
+
+
+def fake_artifact(url: str, config: dict) -> bytes:
+    """Contenido falso pero válido para cada URL de ``installer_config.yaml``."""
+    name = url.rstrip("/").rsplit("/", 1)[-1]
+    if name.endswith(".zip"):
+        archive = next(
+            entry for entry in config["fonts"]["archives"] if entry["url"] == url
+        )
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as zf:
+            for pattern in archive.get("include", []):
+                zf.writestr(pattern.replace("*", "Regular"), b"\0" * 4096)
+        return buffer.getvalue()
+    if name.endswith(".rpm"):
+        for entry in config["package_managers"]["fedora"].get("repo", {}).values():
+            if (
+                entry.get("release_rpm")
+                and sentu_install.render_vars(
+                    entry["release_rpm"], {"fedora_version": FEDORA_VERSION}
+                )
+                == url
+            ):
+                return f"Name: {entry.get('package', name)}\n".encode()
+        return f"Name: {name}\n".encode()
+    if name.endswith(".repo"):
+        repo_id = name.removesuffix(".repo")
+        return f"[{repo_id}]\nname={repo_id}\nbaseurl=file:///dev/null\n".encode()
+    return f"#!/bin/sh\necho 'sentu-bench: {url}'\n".encode()
+
+
+def read_io(path: Path) -> dict:
+    """Contadores de ``/proc/<pid>/io`` guardados por :data:`IO_WRAPPER`."""
+    counters = {}
+    try:
+        for line in path.read_text(encoding="utf-8").splitlines():
+            key, _, value = line.partition(":")
+            counters[key.strip()] = int(value)
+    except (OSError, ValueError):
+        pass
+    return counters
+
+
+class Sandbox:
+    """``HOME`` temporal con stubs, origen local y caché de artefactos."""
+
+    def __init__(self, root: Path, latency: float):
+        self.root = root
+        self.home = root / "home"
+        self.state = root / "state"
+        self.bin = root / "bin"
+        self.log = root / "tools.log"
+        self.spawns = root / "spawns.log"
+        self.origin = root / "origin.git"
+        self.artifacts = self.home / ".cache" / "sentu" / "artifacts"
+        self.home.mkdir()
+        (root / "root-home").mkdir()
+        self.state.mkdir()
+        write_stubs(self.bin)
+        site = root / "site"
+        site.mkdir()
+        (site / "sitecustomize.py").write_text(SITECUSTOMIZE, encoding="utf-8")
+        os_release = self.state / "os-release"
+        os_release.write_text(
+            f'ID=fedora\nVERSION_ID={FEDORA_VERSION}\nNAME="Fedora Linux"\n',
+            encoding="utf-8",
+        )
+        self.env = {
+            **os.environ,
+            "HOME": str(self.home),
+            "USER": _current_user(),
+            "XDG_CACHE_HOME": str(self.home / ".cache"),
+            "PATH": f"{self.bin}{os.pathsep}{os.environ.get('PATH', '')}",
+            "PYTHONPATH": str(site),
+            "SENTU_OS_RELEASE": str(os_release),
+            "SENTU_UPGRADE_STAMP": str(self.state / "upgrade.json"),
+            "SENTU_DNF_RUN_MARKER": str(self.state / "dnf-metadata"),
+            "SENTU_REPOS_DIR": str(self.state / "yum.repos.d"),
+            "SENTU_BENCH_LOG": str(self.log),
+            "SENTU_BENCH_SPAWNS": str(self.spawns),
+            "SENTU_BENCH_RPMDB": str(self.state / "rpmdb"),
+            "SENTU_BENCH_LATENCY": str(latency),
+            "SENTU_BENCH_ROOT_HOME": str(root / "root-home"),
+            "GIT_CONFIG_GLOBAL": str(root / "gitconfig"),
+            "GIT_CONFIG_NOSYSTEM": "1",
+        }
+        (self.state / "yum.repos.d").mkdir()
+        (self.state / "rpmdb").touch()
+
+    def prepare(self):
+        """Crea el origen del repositorio y siembra la caché de artefactos."""
+        # El origen contiene el árbol de trabajo (con cambios sin confirmar),
+        # que es lo que se quiere medir.
+        revision = _working_tree_commit()
+        for command in (
+            ["git", "init", "--quiet", "--bare", str(self.origin)],
+            ["git", "-C", str(self.origin), "config", "uploadpack.allowFilter", "true"],
+            ["git", "-C", str(self.origin), "symbolic-ref", "HEAD", "refs/heads/main"],
+            [
+                "git",
+                "-C",
+                str(REPO_ROOT),
+                "push",
+                "--quiet",
+                str(self.origin),
+                f"{revision}:refs/heads/main",
+            ],
+        ):
+            subprocess.run(command, check=True, env=self.env)
+        config = sentu_install.load_yaml(REPO_ROOT / sentu_install.CONFIG_RELPATH)
+        config = config["sentu_install"]
+        cache = sentu_install.ArtifactCache(self.artifacts)
+        urls = sentu_install.artifact_urls(config, {"fedora_version": FEDORA_VERSION})
+        for url in urls:
+            cache.put(url, io.BytesIO(fake_artifact(url, config)))
+        self.log.write_text("", encoding="utf-8")
+
+    def run(self, label: str, engine: str) -> dict:
+        """Ejecuta el instalador y devuelve sus métricas."""
+        trace = self.root / f"trace-{label}.json"
+        for log in (self.log, self.spawns):
+            log.write_text("", encoding="utf-8")
+        io_file = self.root / f"io-{label}.txt"
+        command = [
+            sys.executable,
+            "-c",
+            IO_WRAPPER,
+            str(io_file),
+            sys.executable,
+            str(REPO_ROOT / "sentu_install.py"),
+            "--update",
+            "--repo-url",
+            f"file://{self.origin}",
+            "--offline",
+            "--engine",
+            engine,
+            "--trace",
+            str(trace),
+        ]
+        start = time.perf_counter()
+        result = subprocess.run(
+            command,
+            env=self.env,
+            cwd=self.home,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
+        wall = time.perf_counter() - start
+        io_counters = read_io(io_file)
+
+        calls = {}
+        for line in self.log.read_text(encoding="utf-8").splitlines():
+            tool = line.partition("\t")[0]
+            calls[tool] = calls.get(tool, 0) + 1
+        spawns = len(self.spawns.read_text(encoding="utf-8").splitlines())
+        try:
+            slowest = json.loads(trace.read_text(encoding="utf-8"))["otherData"][
+                "slowest"
+            ]
+        except (OSError, ValueError, KeyError):
+            slowest = []
+        (self.root / f"output-{label}.log").write_text(result.stdout, encoding="utf-8")
+        return {
+            "returncode": result.returncode,
+            "wall_s": round(wall, 3),
+            "spawns": spawns,
+            "tool_calls": dict(sorted(calls.items())),
+            # Bytes pasados a write() por el instalador y sus hijos (archivos y
+            # tuberías); ``disk_bytes`` es lo que llegó a la caché de páginas.
+            "bytes_written": io_counters.get("wchar"),
+            "disk_bytes": io_counters.get("write_bytes"),
+            "slowest": slowest[:10],
+            "output_tail": result.stdout.splitlines()[-15:]
+            if result.returncode
+            else [],
+        }
+
+
+def _current_user() -> str:
+    return pwd.getpwuid(os.getuid()).pw_name
+
+
+def _git(*args: str) -> str:
+    result = subprocess.run(
+        ["git", "-C", str(REPO_ROOT), *args], capture_output=True, text=True
+    )
+    return result.stdout.strip()
+
+
+def _working_tree_commit() -> str:
+    """Commit con el árbol de trabajo actual (``HEAD`` si no hay cambios)."""
+    return _git("stash", "create") or _git("rev-parse", "HEAD")
+
+
+def _commit() -> str:
+    commit = _git("rev-parse", "--short", "HEAD") or "unknown"
+    return f"{commit}-dirty" if _git("status", "--porcelain", "-uno") else commit
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Métricas que empeoran más de ``tolerance`` (fracción) frente a ``baseline``."""
+    regressions = []
+    for run in ("cold", "warm"):
+        for metric in ("wall_s", "spawns", "bytes_written"):
+            old = baseline.get(run, {}).get(metric)
+            new = results[run][metric]
+            if old and new is not None and new > old * (1 + tolerance):
+                regressions.append(f"{run}.{metric}: {old} → {new}")
+    return regressions
+
+
+def print_report(results: dict):
+    print(f"{'':8}{'tiempo':>10}{'procesos':>10}{'escrito':>14}")
+    for run in ("cold", "warm"):
+        data = results[run]
+        print(
+            f"{run:8}{data['wall_s']:>9.2f}s{data['spawns']:>10}"
+            f"{data['bytes_written'] or 0:>13,}B"
+        )
+    for run in ("cold", "warm"):
+        calls = ", ".join(f"{k}={v}" for k, v in results[run]["tool_calls"].items())
+        print(f"{run} herramientas: {calls or '-'}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Segundos que tarda cada llamada a una herramienta simulada.",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=("native", "ansible"),
+        default="native",
+        help="Motor con el que se ejecuta el playbook.",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        help="Archivo JSON de resultados (por defecto results/<commit>.json).",
+    )
+    parser.add_argument(
+        "--baseline", type=Path, help="Resultados previos con los que comparar."
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Empeoramiento admitido frente a --baseline (fracción, 0.2 = 20%%).",
+    )
+    parser.add_argument(
+        "--keep", action="store_true", help="Conserva el directorio temporal."
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    root = Path(tempfile.mkdtemp(prefix="sentu-bench-"))
+    try:
+        sandbox = Sandbox(root, args.latency)
+        sandbox.prepare()
+        results = {
+            "commit": _commit(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "engine": args.engine,
+            "latency": args.latency,
+            "python": sys.version.split()[0],
+        }
+        for label in ("cold", "warm"):
+            results[label] = sandbox.run(label, args.engine)
+    finally:
+        if args.keep:
+            print(f"Directorio del benchmark: {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+    output = args.output or RESULTS_DIR / f"{results['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+    print_report(results)
+    print(f"Resultados en {output}")
+
+    status = 0
+    for label in ("cold", "warm"):
+        if results[label]["returncode"]:
+            print(f"La ejecución '{label}' falló:", file=sys.stderr)
+            print("\n".join(results[label]["output_tail"]), file=sys.stderr)
+            status = 1
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"Regresión: {regression}", file=sys.stderr)
+        if regressions:
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
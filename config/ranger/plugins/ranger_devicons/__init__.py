@@ -1,9 +1,22 @@
 import os
 import ranger.api
+from ranger.api.commands import Command
 from ranger.core.linemode import LinemodeBase
 from .devicons import *
 
-SEPARATOR = os.getenv('RANGER_DEVICONS_SEPARATOR', ' ')
+# Opt-in: resolve every icon as soon as a directory finishes loading, so the
+# first scroll through a huge listing is already served from the cache.
+PRECOMPUTE = os.getenv('RANGER_DEVICONS_PRECOMPUTE', '') not in ('', '0')
+
+HOOK_INIT_OLD = ranger.api.hook_init
+
+def hook_init(fm):
+  if PRECOMPUTE:
+    fm.signal_bind('finished_loading_dir',
+                   lambda signal: precompute(signal.directory.files_all))
+  return HOOK_INIT_OLD(fm)
+
+ranger.api.hook_init = hook_init
 
 @ranger.api.register_linemode
 class DevIconsLinemode(LinemodeBase):
@@ -12,4 +25,13 @@ class DevIconsLinemode(LinemodeBase):
   uses_metadata = False
 
   def filetitle(self, file, metadata):
-    return devicon(file) + SEPARATOR + file.relative_path
+    return devicon_title(file)
+
+class devicons_stats(Command):
+  """:devicons_stats
+
+  Show the hit/miss counters of the devicons cache.
+  """
+
+  def execute(self):
+    self.fm.notify(cache_stats())
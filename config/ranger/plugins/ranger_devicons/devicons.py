@@ -4,8 +4,10 @@
 # has been copied from the vimscript code that is present in
 # https://github.com/ryanoasis/vim-devicons
 
+import fnmatch
 import re
 import os
+from functools import lru_cache
 
 
 # Get the XDG_USER_DIRS directory names from environment variables
@@ -152,6 +154,8 @@ file_node_extensions = {
     'nix'      : '',
     'o'        : '',
     'ogg'      : '',
+    'parquet'  : '',
+    'parquet.snappy' : '',
     'part'     : '',
     'pdf'      : '',
     'php'      : '',
@@ -196,6 +200,10 @@ file_node_extensions = {
     'swift'    : '',
     't'        : '',
     'tar'      : '',
+    'tar.bz2'  : '',
+    'tar.gz'   : '',
+    'tar.xz'   : '',
+    'tar.zst'  : '',
     'tex'      : 'ﭨ',
     'tgz'      : '',
     'toml'     : '',
@@ -381,12 +389,10 @@ file_node_exact_matches = {
     'ini'                              : '',
     'known_hosts'                      : '',
     'ledger'                           : '',
-    'license'                          : '',
     'LICENSE'                          : '',
     'LICENSE.md'                       : '',
     'LICENSE.txt'                      : '',
     'Makefile'                         : '',
-    'makefile'                         : '',
     'Makefile.ac'                      : '',
     'Makefile.in'                      : '',
     'mimeapps.list'                    : '',
@@ -397,7 +403,6 @@ file_node_exact_matches = {
     'playlists'                        : '',
     'procfile'                         : '',
     'Rakefile'                         : '',
-    'rakefile'                         : '',
     'react.jsx'                        : '',
     'README'                           : '',
     'README.markdown'                  : '',
@@ -410,8 +415,170 @@ file_node_exact_matches = {
 }
 
 
+# Glob patterns (fnmatch syntax, case-insensitive) for names that neither an
+# exact match nor an extension can describe.  Add your own here or with
+# add_pattern(); each one is indexed by the literal text after its last
+# wildcard, so keep that tail as specific as possible.
+file_node_patterns = {
+    '*.spec.js'          : '',
+    '*.spec.ts'          : '',
+    '*.test.js'          : '',
+    '*.test.ts'          : '',
+    '*_test.go'          : '',
+    '*_test.py'          : '',
+    'dockerfile.*'       : '',
+    'test_*.py'          : '',
+}
+
+
+class _Node:
+    __slots__ = ('children', 'exact', 'extension', 'patterns')
+
+    def __init__(self):
+        self.children = {}
+        self.exact = None
+        self.extension = None
+        self.patterns = []
+
+
+class SuffixTrie:
+    """File name rules in a trie keyed by the reversed, case-folded name.
+
+    A single walk from the last character backwards meets every rule that can
+    apply, so a lookup costs O(len(name)) however many rules are loaded (plus
+    an fnmatch for each glob that shares the name's tail):
+
+    - exact names end where the whole name is consumed; the exact spelling
+      beats other case variants (`Dockerfile` vs `dockerfile`);
+    - extensions (`gz`, `tar.gz`) are stored as `.ext`; the longest wins;
+    - globs sit under their literal tail (`.py` for `test_*.py`) and are
+      tried longest tail first.
+
+    Precedence is exact name > glob > extension.
+    """
+
+    def __init__(self, exact=None, extensions=None, patterns=None):
+        self.root = _Node()
+        for name, icon in (exact or {}).items():
+            self.add_exact(name, icon)
+        for extension, icon in (extensions or {}).items():
+            self.add_extension(extension, icon)
+        for pattern, icon in (patterns or {}).items():
+            self.add_pattern(pattern, icon)
+
+    def _insert(self, key):
+        node = self.root
+        for char in reversed(key.casefold()):
+            node = node.children.setdefault(char, _Node())
+        return node
+
+    def add_exact(self, name, icon):
+        node = self._insert(name)
+        if node.exact is None:
+            node.exact = {}
+        node.exact[name] = icon
+
+    def add_extension(self, extension, icon):
+        self._insert('.' + extension).extension = icon
+
+    def add_pattern(self, pattern, icon):
+        folded = pattern.casefold()
+        tail = re.search(r'[^*?\]]*$', folded).group()
+        self._insert(tail).patterns.append((re.compile(fnmatch.translate(folded)), icon))
+
+    def match(self, name):
+        folded = name.casefold()
+        node = self.root
+        extension = None
+        globs = [node.patterns] if node.patterns else []
+        for char in reversed(folded):
+            node = node.children.get(char)
+            if node is None:
+                break
+            if node.extension is not None:
+                extension = node.extension
+            if node.patterns:
+                globs.append(node.patterns)
+        else:
+            if node.exact:
+                return node.exact.get(name) or next(iter(node.exact.values()))
+        for patterns in reversed(globs):
+            for regex, icon in patterns:
+                if regex.match(folded):
+                    return icon
+        return extension
+
+
+# Built once at import; lookups never touch the dicts above, so editing them
+# afterwards has no effect.  Use the add_* helpers below instead.
+file_node_matcher = SuffixTrie(file_node_exact_matches, file_node_extensions,
+                               file_node_patterns)
+
+
+def add_exact(name, icon):
+    """Register an exact file name at runtime (e.g. from another plugin)."""
+    file_node_exact_matches[name] = icon
+    file_node_matcher.add_exact(name, icon)
+    resolve.cache_clear()
+
+
+def add_extension(extension, icon):
+    """Register a (possibly compound, e.g. `tar.gz`) extension at runtime."""
+    file_node_extensions[extension] = icon
+    file_node_matcher.add_extension(extension, icon)
+    resolve.cache_clear()
+
+
+def add_pattern(pattern, icon):
+    """Register a glob at runtime (e.g. from another plugin)."""
+    file_node_patterns[pattern] = icon
+    file_node_matcher.add_pattern(pattern, icon)
+    resolve.cache_clear()
+
+
+SEPARATOR = os.getenv('RANGER_DEVICONS_SEPARATOR', ' ')
+
+# ranger asks for the icon of every visible file on every redraw, so icons
+# and titles are memoized per (name, is_directory).  The LRU bound
+# keeps memory flat in directories with hundreds of thousands of entries.
+CACHE_SIZE = int(os.getenv('RANGER_DEVICONS_CACHE_SIZE', '65536'))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def resolve(name, is_directory):
+    """Return (icon, title) for a file name; title is what the linemode shows."""
+    if is_directory:
+        icon = dir_node_exact_matches.get(name, '')
+    else:
+        icon = file_node_matcher.match(os.path.basename(name)) or ''
+    return icon, icon + SEPARATOR + name
+
+
 def devicon(file):
-    if file.is_directory:
-        return dir_node_exact_matches.get(file.relative_path, '')
-    return file_node_exact_matches.get(os.path.basename(file.relative_path),
-                                       file_node_extensions.get(file.extension, ''))
+    return resolve(file.relative_path, file.is_directory)[0]
+
+
+def devicon_title(file):
+    return resolve(file.relative_path, file.is_directory)[1]
+
+
+def precompute(files):
+    """Warm the cache for a freshly loaded directory.
+
+    Only the first CACHE_SIZE entries (where ranger opens the listing) are
+    resolved: going past the LRU bound would evict them again.
+    """
+    if not files:
+        return 0
+    files = files[:CACHE_SIZE]
+    for file in files:
+        resolve(file.relative_path, file.is_directory)
+    return len(files)
+
+
+def cache_stats():
+    info = resolve.cache_info()
+    lookups = info.hits + info.misses
+    ratio = 100.0 * info.hits / lookups if lookups else 0.0
+    return ('devicons: {0} hits, {1} misses ({2:.1f}% hit rate), {3}/{4} cached'
+            .format(info.hits, info.misses, ratio, info.currsize, info.maxsize))
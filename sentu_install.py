@@ -1,7 +1,39 @@
 #!/usr/bin/env python3
+import argparse
+import ast
+import configparser
+import contextlib
+import ctypes
+import ctypes.util
+import fcntl
+import fnmatch
+import functools
+import getpass
+import glob
+import hashlib
+import io
+import json
 import platform
+import pwd
+import re
+import resource
+import select
+import shlex
+import shutil
+import stat
+import struct
 import subprocess
 import sys
+import tarfile
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
 from pathlib import Path
 import os  # Importamos el módulo os
 
@@ -9,6 +41,33 @@ import os  # Importamos el módulo os
 REPO_URL = "https://github.com/SENTUstudio/dotfiles.git"
 DOTFILES_DIR = Path.home() / "dotfiles"
 REPO_NAME = "dotfiles"
+CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "sentu"
+HOST_CACHE_FILE = CACHE_DIR / "host.json"
+FACTS_DIR = CACHE_DIR / "facts.d"
+CONFIG_RELPATH = "ansible/vars/installer_config.yaml"
+STATE_FILE = CACHE_DIR / "state.json"
+# Los roles con become la reciben como ruta absoluta (su HOME es el de root).
+ARTIFACT_CACHE_DIR = Path(
+    os.environ.get("SENTU_ARTIFACT_CACHE") or CACHE_DIR / "artifacts"
+).absolute()
+ARTIFACT_CACHE_MAX_BYTES = 2 * 1024**3
+FONTS_DIR = Path.home() / ".local" / "share" / "fonts"
+FONTS_MANIFEST = ".sentu-fonts.json"
+ANSIBLE_CONFIG_FILE = CACHE_DIR / "ansible.cfg"
+# Estado del sistema (no del usuario): lo escriben roles que corren como root.
+UPGRADE_STAMP = Path(
+    os.environ.get("SENTU_UPGRADE_STAMP", "/var/lib/sentu/upgrade.json")
+)
+REPOS_DIR = Path(os.environ.get("SENTU_REPOS_DIR", "/etc/yum.repos.d"))
+DNF_RUN_MARKER = Path(
+    os.environ.get("SENTU_DNF_RUN_MARKER", "/var/cache/sentu/dnf-metadata")
+)
+FACT_CACHE_DIR = CACHE_DIR / "ansible-facts"
+BUNDLE_NAME = "sentu-bundle.tar.gz"
+BUNDLE_FORMAT = 1
+ANSIBLE_REQUIREMENT = "ansible"
+# Orden de preferencia al detectar el gestor de paquetes
+PACKAGE_MANAGERS = ("apt-get", "dnf", "pacman", "yum")
 
 
 def show(message: str = "con Python 🐍"):
@@ -35,255 +94,5434 @@ def show(message: str = "con Python 🐍"):
     print(logo)
 
 
+@dataclass
+class HostSnapshot:
+    """Capacidades del equipo, detectadas una sola vez y guardadas en disco.
+
+    Attributes:
+        path (str): Valor de ``PATH`` con el que se construyó la instantánea.
+        path_mtimes (dict): ``mtime_ns`` de cada entrada de ``PATH``; si alguno
+            cambia, la instantánea deja de ser válida.
+        executables (list): Nombres de los ejecutables encontrados en ``PATH``.
+        os_name (str): Sistema operativo (``platform.system()``).
+        distribution (str): ``ID`` de ``/etc/os-release`` (p. ej. ``fedora``).
+        distribution_version (str): ``VERSION_ID`` de ``/etc/os-release``.
+        package_manager (str | None): Primer gestor de paquetes conocido.
+        python_version (str): Versión del intérprete que ejecuta el script.
+    """
+
+    path: str
+    path_mtimes: dict
+    executables: list
+    os_name: str
+    distribution: str = ""
+    distribution_version: str = ""
+    package_manager: str | None = None
+    python_version: str = field(default_factory=platform.python_version)
+
+    def __post_init__(self):
+        self._executables = frozenset(self.executables)
+
+    def has(self, command: str) -> bool:
+        """Indica si ``command`` es un ejecutable disponible en ``PATH``."""
+        return command in self._executables
+
+    def is_current(self) -> bool:
+        """Comprueba que ``PATH`` y sus directorios no hayan cambiado."""
+        current_path = os.environ.get("PATH", "")
+        return self.path == current_path and self.path_mtimes == _path_mtimes(
+            current_path
+        )
+
+
+def _path_mtimes(path: str) -> dict:
+    mtimes = {}
+    for entry in path.split(os.pathsep):
+        if not entry or entry in mtimes:
+            continue
+        try:
+            mtimes[entry] = os.stat(entry).st_mtime_ns
+        except OSError:
+            mtimes[entry] = None
+    return mtimes
+
+
+def _scan_executables(path_mtimes: dict) -> list:
+    executables = set()
+    for entry, mtime in path_mtimes.items():
+        if mtime is None:
+            continue
+        try:
+            with os.scandir(entry) as it:
+                for item in it:
+                    try:
+                        if item.is_file() and os.access(item.path, os.X_OK):
+                            executables.add(item.name)
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+    return sorted(executables)
+
+
+def _read_os_release() -> dict:
+    # SENTU_OS_RELEASE permite simular otra distribución (p. ej. en benchmarks).
+    candidates = ("/etc/os-release", "/usr/lib/os-release")
+    if os.environ.get("SENTU_OS_RELEASE"):
+        candidates = (os.environ["SENTU_OS_RELEASE"],)
+    for candidate in candidates:
+        try:
+            with open(candidate, encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except OSError:
+            continue
+        release = {}
+        for line in lines:
+            key, sep, value = line.partition("=")
+            if sep and not key.startswith("#"):
+                release[key.strip()] = value.strip().strip('"').strip("'")
+        return release
+    return {}
+
+
+def build_host_snapshot() -> HostSnapshot:
+    """Construye la instantánea del equipo recorriendo ``PATH`` directamente."""
+    path = os.environ.get("PATH", "")
+    path_mtimes = _path_mtimes(path)
+    executables = _scan_executables(path_mtimes)
+    release = _read_os_release()
+    available = set(executables)
+    return HostSnapshot(
+        path=path,
+        path_mtimes=path_mtimes,
+        executables=executables,
+        os_name=platform.system(),
+        distribution=release.get("ID", ""),
+        distribution_version=release.get("VERSION_ID", ""),
+        package_manager=next((pm for pm in PACKAGE_MANAGERS if pm in available), None),
+    )
+
+
+_host_snapshot = None
+
+
+def host_snapshot(refresh: bool = False) -> HostSnapshot:
+    """Devuelve la instantánea del equipo, reutilizando la caché en disco.
+
+    La caché se invalida cuando cambia ``PATH`` o el ``mtime`` de alguno de sus
+    directorios (p. ej. tras instalar un paquete).
+
+    Args:
+        refresh (bool): Fuerza la reconstrucción aunque la caché sea válida.
+
+    Returns:
+        HostSnapshot: Las capacidades actuales del equipo.
+    """
+    global _host_snapshot
+    if not refresh and _host_snapshot is not None and _host_snapshot.is_current():
+        return _host_snapshot
+
+    if not refresh:
+        try:
+            with open(HOST_CACHE_FILE, encoding="utf-8") as f:
+                cached = HostSnapshot(**json.load(f))
+            if cached.is_current():
+                _host_snapshot = cached
+                return cached
+        except (OSError, ValueError, TypeError):
+            pass
+
+    _host_snapshot = build_host_snapshot()
+    try:
+        HOST_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        tmp = HOST_CACHE_FILE.with_suffix(".tmp")
+        tmp.write_text(json.dumps(asdict(_host_snapshot)), encoding="utf-8")
+        os.replace(tmp, HOST_CACHE_FILE)
+    except OSError:
+        pass  # La caché es una optimización; sin ella el instalador sigue.
+    return _host_snapshot
+
+
+def export_ansible_facts(fact_dir: Path = FACTS_DIR) -> Path:
+    """Escribe la instantánea como hecho local de Ansible (``sentu.fact``).
+
+    El playbook lo lee desde ``ansible_local.sentu`` usando ``fact_path``.
+
+    Args:
+        fact_dir (Path): Directorio donde se escribe el archivo ``.fact``.
+
+    Returns:
+        Path: Ruta del archivo generado.
+    """
+    snapshot = host_snapshot()
+    facts = asdict(snapshot)
+    del facts["path_mtimes"], facts["executables"]
+    fact_dir.mkdir(parents=True, exist_ok=True)
+    fact_file = fact_dir / "sentu.fact"
+    fact_file.write_text(json.dumps(facts, indent=2), encoding="utf-8")
+    return fact_file
+
+
 def check_command(command):
     """Verifica si un comando está disponible en el sistema.
 
-    Args:
-        command (str): El nombre del comando a verificar.
+    Args:
+        command (str): El nombre del comando a verificar.
+
+    Returns:
+        bool: True si el comando está disponible, False en caso contrario.
+    """
+    return host_snapshot().has(command)
+
+
+def run_command(command_list: list):
+    try:
+        subprocess.run(command_list, check=True)
+    except subprocess.CalledProcessError as e:
+        error(f"Error al ejecutar el comando '{' '.join(command_list)}': {e}")
+        sys.exit(1)
+
+
+def info(message: str):
+    print(f"\033[1;34m[INFO]\033[0m {message}")
+
+
+def error(message: str):
+    print(f"\033[1;31m[ERROR]\033[0m {message}")
+
+
+class Tracer:
+    """Registra spans (fases, roles, tareas) para ``--trace``.
+
+    Cada span guarda la duración de reloj, el tiempo de CPU y los subprocesos
+    lanzados por este proceso (no los nietos). Las fases (``phase``) cuentan
+    los de todo el proceso, incluidos los hilos de los roles en paralelo. Los
+    demás spans (roles, tareas, equipos) cuentan los de su hilo; su CPU suma la
+    de los procesos hijos recogidos durante el span, que es de todo el proceso,
+    así que si otro hilo tenía un span abierto a la vez se marca como
+    aproximada (``cpu_approximate``). Las tareas de ``ansible-playbook`` llegan
+    a través del callback ``sentu_trace`` (:attr:`ansible_events`).
+    """
+
+    def __init__(self):
+        self.events = []
+        self.origin = time.perf_counter()
+        self.epoch = time.time()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._spawns = 0
+        # Spans no de fase abiertos: [hilo, ¿se solapó con otro hilo?].
+        self._active = []
+        self._popen = None
+        fd, path = tempfile.mkstemp(prefix="sentu-trace-", suffix=".jsonl")
+        os.close(fd)
+        self.ansible_events = Path(path)
+
+    def install(self):
+        """Cuenta los subprocesos sustituyendo ``subprocess.Popen``."""
+        tracer = self
+        self._popen = subprocess.Popen
+
+        class CountingPopen(self._popen):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                tracer._local.spawns = getattr(tracer._local, "spawns", 0) + 1
+                with tracer._lock:
+                    tracer._spawns += 1
+
+        subprocess.Popen = CountingPopen
+
+    def uninstall(self):
+        if self._popen is not None:
+            subprocess.Popen = self._popen
+            self._popen = None
+
+    def _record(self, name, category, start, wall, cpu, spawns, tid, args=None):
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": round(start * 1e6),
+            "dur": round(wall * 1e6),
+            "pid": os.getpid(),
+            "tid": tid,
+            "args": {"cpu_ms": cpu, "subprocesses": spawns, **(args or {})},
+        }
+        with self._lock:
+            self.events.append(event)
+
+    def span(self, name: str, category: str = "phase", **args):
+        """Context manager que mide un span; ``args`` se añaden al evento."""
+        phase = category == "phase"
+
+        def spawned():
+            if phase:
+                return self._spawns
+            return getattr(self._local, "spawns", 0)
+
+        @contextlib.contextmanager
+        def measure():
+            tid = threading.get_native_id()
+            active = [tid, False]
+            if not phase:
+                with self._lock:
+                    for other in self._active:
+                        if other[0] != tid:
+                            other[1] = active[1] = True
+                    self._active.append(active)
+            clock = time.process_time if phase else time.thread_time
+            spawns = spawned()
+            children = resource.getrusage(resource.RUSAGE_CHILDREN)
+            cpu = clock()
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                wall = time.perf_counter() - start
+                after = resource.getrusage(resource.RUSAGE_CHILDREN)
+                cpu = (
+                    clock()
+                    - cpu
+                    + (after.ru_utime - children.ru_utime)
+                    + (after.ru_stime - children.ru_stime)
+                )
+                extra = dict(args)
+                if not phase:
+                    with self._lock:
+                        self._active = [a for a in self._active if a is not active]
+                    if active[1]:
+                        extra["cpu_approximate"] = True
+                self._record(
+                    name,
+                    category,
+                    start - self.origin,
+                    wall,
+                    round(cpu * 1000, 1),
+                    spawned() - spawns,
+                    tid,
+                    extra,
+                )
+
+        return measure()
+
+    def _load_ansible_events(self, skip_roles: set):
+        try:
+            lines = self.ansible_events.read_text(encoding="utf-8").splitlines()
+        except OSError:
+            return
+        roles = {}
+        for line in lines:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            start, end = event["start"] - self.epoch, event["end"] - self.epoch
+            self._record(
+                event["task"],  # Ansible ya lo nombra "role : tarea".
+                "task",
+                start,
+                end - start,
+                None,
+                None,
+                event["pid"],
+                {"status": event["status"]},
+            )
+            if event["role"]:
+                first, last, _ = roles.get(event["role"], (start, end, 0))
+                roles[event["role"]] = (min(first, start), max(last, end), event["pid"])
+        for role, (start, end, pid) in roles.items():
+            if role not in skip_roles:
+                # Con un único ansible-playbook el role abarca sus tareas.
+                self._record(role, "role", start, end - start, None, None, pid)
+
+    def summary(self, limit: int = 10) -> list:
+        """Los ``limit`` spans más lentos, de mayor a menor duración."""
+        return sorted(self.events, key=lambda e: e["dur"], reverse=True)[:limit]
+
+    def write(self, path: Path):
+        """Escribe la traza (formato *Chrome trace event*) en ``path``."""
+        recorded = {e["name"] for e in self.events if e["cat"] == "role"}
+        self._load_ansible_events(skip_roles=recorded)
+        self.ansible_events.unlink(missing_ok=True)
+        slowest = [
+            {
+                "name": e["name"],
+                "cat": e["cat"],
+                "wall_ms": round(e["dur"] / 1000, 1),
+                **e["args"],
+            }
+            for e in self.summary()
+        ]
+        path.write_text(
+            json.dumps(
+                {
+                    "traceEvents": self.events,
+                    "displayTimeUnit": "ms",
+                    "otherData": {"slowest": slowest},
+                },
+                ensure_ascii=False,
+                indent=1,
+            ),
+            encoding="utf-8",
+        )
+
+    def print_summary(self, limit: int = 10):
+        rows = [
+            (
+                e["cat"],
+                e["name"],
+                f"{e['dur'] / 1e6:.2f}",
+                "-"
+                if e["args"]["cpu_ms"] is None
+                else ("~" if e["args"].get("cpu_approximate") else "")
+                + f"{e['args']['cpu_ms'] / 1000:.2f}",
+                "-"
+                if e["args"]["subprocesses"] is None
+                else str(e["args"]["subprocesses"]),
+            )
+            for e in self.summary(limit)
+        ]
+        _print_table(("tipo", "paso", "reloj (s)", "CPU (s)", "subprocesos"), rows)
+        if any(row[3].startswith("~") for row in rows):
+            print("~: CPU aproximada (incluye hijos de roles que corrían a la vez).")
+
+
+def _print_table(header: tuple, rows: list, text_columns: int = 2):
+    """Imprime ``rows`` alineadas; las primeras ``text_columns`` a la izquierda."""
+    widths = [max(len(row[i]) for row in [header, *rows]) for i in range(len(header))]
+    for row in [header, *rows]:
+        print(
+            "  ".join(
+                cell.ljust(w) if i < text_columns else cell.rjust(w)
+                for i, (cell, w) in enumerate(zip(row, widths))
+            )
+        )
+
+
+_tracer = None
+
+
+def trace_span(name: str, category: str = "phase", **args):
+    """Span de la traza activa (``--trace``) o un contexto vacío si no la hay."""
+    if _tracer is None:
+        return contextlib.nullcontext()
+    return _tracer.span(name, category, **args)
+
+
+class YamlSubsetError(ValueError):
+    """El documento usa construcciones YAML fuera del subconjunto soportado."""
+
+
+_YAML_BOOLS = {
+    "true": True,
+    "yes": True,
+    "on": True,
+    "false": False,
+    "no": False,
+    "off": False,
+}
+
+
+def _yaml_strip_comment(line: str) -> str:
+    quote = None
+    for i, char in enumerate(line):
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "\"'" and (i == 0 or line[i - 1] in " [{,:-"):
+            quote = char
+        elif char == "#" and (i == 0 or line[i - 1] in " \t"):
+            return line[:i].rstrip()
+    return line.rstrip()
+
+
+def _yaml_split_key(text: str):
+    """Separa ``clave: valor``; devuelve ``None`` si no es un par clave-valor."""
+    if text[0] in "\"'":
+        end = text.find(text[0], 1)
+        if end == -1 or not text[end + 1 :].startswith(":"):
+            return None
+        key, rest = text[1:end], text[end + 2 :]
+        return key, rest.strip()
+    if text[0] in "[{":
+        return None
+    for i, char in enumerate(text):
+        if char == ":" and (i + 1 == len(text) or text[i + 1] == " "):
+            return text[:i].strip(), text[i + 1 :].strip()
+    return None
+
+
+def _yaml_split_flow(text: str) -> list:
+    items, depth, quote, start = [], 0, None, 0
+    for i, char in enumerate(text):
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "\"'":
+            quote = char
+        elif char in "[{":
+            depth += 1
+        elif char in "]}":
+            depth -= 1
+        elif char == "," and depth == 0:
+            items.append(text[start:i].strip())
+            start = i + 1
+    if text[start:].strip():
+        items.append(text[start:].strip())
+    return items
+
+
+def _yaml_scalar(text: str):
+    if text == "":
+        return None
+    if text[0] == '"':
+        if not text.endswith('"') or len(text) < 2:
+            raise YamlSubsetError(f"Cadena sin cerrar: {text}")
+        return json.loads(text)
+    if text[0] == "'":
+        if not text.endswith("'") or len(text) < 2:
+            raise YamlSubsetError(f"Cadena sin cerrar: {text}")
+        return text[1:-1].replace("''", "'")
+    if text[0] == "[":
+        return [_yaml_scalar(item) for item in _yaml_split_flow(text[1:-1])]
+    if text[0] == "{":
+        mapping = {}
+        for item in _yaml_split_flow(text[1:-1]):
+            key, value = _yaml_split_key(item)
+            mapping[key] = _yaml_scalar(value)
+        return mapping
+    if text[0] in "|>&*!":
+        raise YamlSubsetError(f"Construcción YAML no soportada: {text}")
+    lowered = text.lower()
+    if lowered in ("~", "null"):
+        return None
+    if lowered in _YAML_BOOLS:
+        return _YAML_BOOLS[lowered]
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+def _yaml_block(tokens: list, i: int, indent: int):
+    if tokens[i][1] == "-" or tokens[i][1].startswith("- "):
+        return _yaml_sequence(tokens, i, indent)
+    return _yaml_mapping(tokens, i, indent)
+
+
+def _yaml_nested(tokens: list, i: int, indent: int, allow_same_indent_seq: bool):
+    """Valor de bloque anidado bajo la línea ``i - 1`` (o ``None`` si no hay)."""
+    if i < len(tokens):
+        next_indent, next_text = tokens[i]
+        if next_indent > indent:
+            return _yaml_block(tokens, i, next_indent)
+        if (
+            allow_same_indent_seq
+            and next_indent == indent
+            and (next_text == "-" or next_text.startswith("- "))
+        ):
+            return _yaml_sequence(tokens, i, indent)
+    return None, i
+
+
+def _yaml_sequence(tokens: list, i: int, indent: int):
+    items = []
+    while i < len(tokens) and tokens[i][0] == indent:
+        text = tokens[i][1]
+        if not (text == "-" or text.startswith("- ")):
+            break
+        rest = text[1:].lstrip()
+        if not rest:
+            value, i = _yaml_nested(tokens, i + 1, indent, False)
+        elif _yaml_split_key(rest) is not None:
+            # "- clave: valor" abre un mapeo alineado con la clave.
+            tokens[i] = (indent + len(text) - len(rest), rest)
+            value, i = _yaml_mapping(tokens, i, tokens[i][0])
+        else:
+            value, i = _yaml_scalar(rest), i + 1
+        items.append(value)
+    return items, i
+
+
+def _yaml_mapping(tokens: list, i: int, indent: int):
+    mapping = {}
+    while i < len(tokens) and tokens[i][0] == indent:
+        text = tokens[i][1]
+        if text == "-" or text.startswith("- "):
+            break
+        pair = _yaml_split_key(text)
+        if pair is None:
+            raise YamlSubsetError(f"Se esperaba 'clave: valor': {text}")
+        key, rest = pair
+        if rest:
+            mapping[key], i = _yaml_scalar(rest), i + 1
+        else:
+            mapping[key], i = _yaml_nested(tokens, i + 1, indent, True)
+    return mapping, i
+
+
+def parse_yaml_subset(text: str):
+    """Interpreta el subconjunto de YAML usado por los archivos de ``ansible/``.
+
+    Soporta mapeos y secuencias en bloque, colecciones en línea sencillas y
+    escalares con o sin comillas. Permite leer la configuración antes de que
+    exista PyYAML en el equipo.
+
+    Raises:
+        YamlSubsetError: Ante construcciones no soportadas (p. ej. ``|``).
+    """
+    tokens = []
+    for line in text.splitlines():
+        if line.strip() in ("---", "..."):
+            continue
+        stripped = _yaml_strip_comment(line)
+        if stripped.strip():
+            content = stripped.lstrip(" ")
+            if content.startswith("\t"):
+                raise YamlSubsetError("Tabulaciones no soportadas en la indentación.")
+            tokens.append((len(stripped) - len(content), content))
+    if not tokens:
+        return None
+    value, i = _yaml_block(tokens, 0, tokens[0][0])
+    if i != len(tokens):
+        raise YamlSubsetError(f"Indentación inesperada: {tokens[i][1]}")
+    return value
+
+
+def parse_yaml(text: str):
+    """Interpreta YAML con PyYAML si está disponible, o con el subconjunto propio."""
+    try:
+        import yaml
+    except ImportError:
+        return parse_yaml_subset(text)
+    return yaml.safe_load(text)
+
+
+def load_yaml(path: Path):
+    """Carga un archivo YAML (ver :func:`parse_yaml`)."""
+    return parse_yaml(Path(path).read_text(encoding="utf-8"))
+
+
+def _object_store_size(repo_dir: Path) -> int:
+    """Suma en bytes del almacén de objetos de ``repo_dir`` (sueltos y packs)."""
+    total = 0
+    for root, _, files in os.walk(repo_dir / ".git" / "objects"):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                continue
+    return total
+
+
+def _format_bytes(size: int) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+def fresh_clone(
+    repo_url: str = REPO_URL, dest: Path = DOTFILES_DIR, sparse: bool = False
+) -> int:
+    """Clona ``repo_url`` en ``dest`` de forma superficial y sin blobs.
+
+    Solo se descarga el último commit; los blobs llegan bajo demanda al
+    hacer el checkout, así que el historial no se transfiere nunca.
+
+    Args:
+        repo_url (str): URL del repositorio (admite ``file://`` para pruebas).
+        dest (Path): Directorio de destino; no debe existir.
+        sparse (bool): Inicia un sparse checkout con solo los archivos de la
+            raíz; :func:`apply_profile` añade después los directorios.
+
+    Returns:
+        int: Bytes transferidos (tamaño del almacén de objetos resultante).
+
+    Raises:
+        subprocess.CalledProcessError: Si ``git clone`` falla.
+    """
+    subprocess.run(
+        [
+            "git",
+            "clone",
+            "--depth",
+            "1",
+            "--filter=blob:none",
+            "--single-branch",
+            *(["--sparse"] if sparse else []),
+            repo_url,
+            str(dest),
+        ],
+        check=True,
+    )
+    return _object_store_size(dest)
+
+
+def update_checkout(dest: Path = DOTFILES_DIR) -> int:
+    """Actualiza ``dest`` descargando solo los objetos nuevos y avanza en fast-forward.
+
+    Nunca reescribe el historial local: si la rama local divergió del remoto,
+    ``git merge --ff-only`` falla y el checkout queda intacto.
+
+    Args:
+        dest (Path): Checkout existente de los dotfiles.
+
+    Returns:
+        int: Bytes transferidos (crecimiento del almacén de objetos).
+
+    Raises:
+        subprocess.CalledProcessError: Si ``git fetch`` o el fast-forward fallan.
+    """
+    before = _object_store_size(dest)
+    git = ["git", "-C", str(dest)]
+    # Sin --depth, un fetch sobre un clon superficial conserva el límite
+    # existente y trae únicamente los commits nuevos.
+    subprocess.run([*git, "fetch", "--filter=blob:none", "origin"], check=True)
+    subprocess.run([*git, "merge", "--ff-only", "@{upstream}"], check=True)
+    return max(_object_store_size(dest) - before, 0)
+
+
+class OfflineCacheMiss(LookupError):
+    """Modo sin conexión y el artefacto no está en la caché."""
+
+
+@dataclass
+class Artifact:
+    """Artefacto servido por :class:`ArtifactCache`.
+
+    Attributes:
+        url (str): URL de origen.
+        path (Path): Archivo en la caché (nombrado por su SHA-256).
+        sha256 (str): Hash del contenido.
+        status (str): ``"downloaded"`` (contenido nuevo), ``"revalidated"``
+            (el servidor respondió 304 o el mismo contenido) o ``"cached"``
+            (servido sin red).
+    """
+
+    url: str
+    path: Path
+    sha256: str
+    status: str
+
+
+class ArtifactCache:
+    """Caché local de descargas direccionada por contenido.
+
+    Los archivos se guardan en ``objects/<sha256>`` y un índice asocia cada
+    URL con su hash, ``ETag`` y ``Last-Modified``, de modo que las siguientes
+    descargas son peticiones condicionales (304 si no cambió). Las descargas
+    interrumpidas se reanudan con ``Range``. Al superar ``max_bytes`` se
+    eliminan los objetos usados hace más tiempo (LRU).
+
+    Los roles con ``become`` usan la caché del usuario: lo que root crea en
+    ella pasa a ser del dueño del directorio, que puede seguir usándola.
+
+    Args:
+        root (Path): Directorio de la caché.
+        max_bytes (int): Tamaño máximo de los objetos guardados.
+        offline (bool): Sirve solo desde la caché, sin tocar la red.
+    """
+
+    CHUNK = 256 * 1024
+
+    def __init__(
+        self,
+        root: Path = ARTIFACT_CACHE_DIR,
+        max_bytes: int = ARTIFACT_CACHE_MAX_BYTES,
+        offline: bool = False,
+    ):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.objects = self.root / "objects"
+        self.partial = self.root / "partial"
+        self.index_file = self.root / "index.json"
+
+    def _adopt(self, *paths: Path):
+        """Da a ``paths`` el dueño de la caché si los creó root en la de otro."""
+        if os.geteuid() != 0:
+            return
+        try:
+            owner = self.root.stat()
+        except OSError:
+            return
+        if owner.st_uid == 0:
+            return
+        for path in paths:
+            try:
+                os.chown(path, owner.st_uid, owner.st_gid)
+            except OSError:
+                pass
+
+    # -- índice ---------------------------------------------------------------
+
+    def _locked(self, name: str):
+        """Bloqueo entre procesos (varios roles pueden descargar a la vez)."""
+
+        @contextlib.contextmanager
+        def lock():
+            self.root.mkdir(parents=True, exist_ok=True)
+            with open(self.root / f"{name}.lock", "a") as f:
+                self._adopt(self.root / f"{name}.lock")
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+        return lock()
+
+    def _read_index(self) -> dict:
+        try:
+            with open(self.index_file, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_index(self, index: dict):
+        tmp = self.index_file.with_suffix(".tmp")
+        tmp.write_text(json.dumps(index, indent=1, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, self.index_file)
+        self._adopt(self.index_file)
+
+    def _update_entry(self, url: str, **values):
+        with self._locked("index"):
+            index = self._read_index()
+            index.setdefault(url, {}).update(values, used=time.time())
+            self._write_index(index)
+            return index
+
+    # -- descarga -------------------------------------------------------------
+
+    def _object_path(self, sha256: str) -> Path:
+        return self.objects / sha256
+
+    def fetch(self, url: str, sha256: str | None = None) -> Artifact:
+        """Devuelve el artefacto de ``url``, descargándolo solo si cambió.
+
+        Args:
+            url (str): URL a descargar.
+            sha256 (str | None): Hash esperado; si el objeto ya está en la caché
+                se sirve sin consultar la red.
+
+        Raises:
+            OfflineCacheMiss: En modo sin conexión si la URL no está en caché.
+            urllib.error.URLError: Si la descarga falla.
+            ValueError: Si el contenido no coincide con ``sha256``.
+        """
+        entry = self._read_index().get(url, {})
+        known = entry.get("sha256")
+        if sha256 and self._object_path(sha256).exists():
+            self._update_entry(url, sha256=sha256)
+            return Artifact(url, self._object_path(sha256), sha256, "cached")
+        if known and not self._object_path(known).exists():
+            entry, known = {}, None
+        if self.offline:
+            if known is None:
+                raise OfflineCacheMiss(
+                    f"'{url}' no está en la caché (modo sin conexión)."
+                )
+            self._update_entry(url)
+            return Artifact(url, self._object_path(known), known, "cached")
+
+        url_key = hashlib.sha256(url.encode()).hexdigest()
+        with self._locked(url_key):
+            self.partial.mkdir(parents=True, exist_ok=True)
+            self._adopt(self.partial)
+            part = self.partial / f"{url_key}.part"
+            part_meta_file = self.partial / f"{url_key}.json"
+            try:
+                part_meta = json.loads(part_meta_file.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                part_meta = {}
+
+            while True:
+                headers = {"User-Agent": "sentu-install"}
+                offset = part.stat().st_size if part.exists() else 0
+                validator = part_meta.get("etag") or part_meta.get("last_modified")
+                if offset and validator:
+                    headers["Range"] = f"bytes={offset}-"
+                    headers["If-Range"] = validator
+                elif known:
+                    if entry.get("etag"):
+                        headers["If-None-Match"] = entry["etag"]
+                    if entry.get("last_modified"):
+                        headers["If-Modified-Since"] = entry["last_modified"]
+
+                request = urllib.request.Request(url, headers=headers)
+                try:
+                    response = urllib.request.urlopen(request, timeout=60)
+                    break
+                except urllib.error.HTTPError as e:
+                    if e.code == 304 and known:
+                        self._update_entry(url)
+                        return Artifact(
+                            url, self._object_path(known), known, "revalidated"
+                        )
+                    if e.code != 416 or "Range" not in headers:
+                        raise
+                    # El parcial ya no es válido: se descarta y se pide entero
+                    # sin soltar el bloqueo (reentrar en ``fetch`` lo bloquearía).
+                    part.unlink(missing_ok=True)
+                    part_meta_file.unlink(missing_ok=True)
+                    part_meta = {}
+
+            with response:
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+                resumed = response.status == 206
+                if not resumed:
+                    offset = 0
+                part_meta_file.write_text(
+                    json.dumps({"etag": etag, "last_modified": last_modified}),
+                    encoding="utf-8",
+                )
+                with open(part, "ab" if resumed else "wb") as f:
+                    while chunk := response.read(self.CHUNK):
+                        f.write(chunk)
+
+            digest = hashlib.sha256()
+            with open(part, "rb") as f:
+                while chunk := f.read(self.CHUNK):
+                    digest.update(chunk)
+            actual = digest.hexdigest()
+            if sha256 and actual != sha256:
+                part.unlink()
+                part_meta_file.unlink(missing_ok=True)
+                raise ValueError(f"SHA-256 inesperado para '{url}': {actual}")
+
+            self.objects.mkdir(parents=True, exist_ok=True)
+            os.replace(part, self._object_path(actual))
+            self._adopt(self.objects, self._object_path(actual))
+            part_meta_file.unlink(missing_ok=True)
+
+        self._update_entry(
+            url,
+            sha256=actual,
+            etag=etag,
+            last_modified=last_modified,
+            size=self._object_path(actual).stat().st_size,
+        )
+        self.evict(keep=actual)
+        status = "revalidated" if actual == known else "downloaded"
+        return Artifact(url, self._object_path(actual), actual, status)
+
+    def put(self, url: str, source, sha256: str | None = None) -> Artifact:
+        """Guarda el contenido de ``source`` como artefacto de ``url``, sin red.
+
+        Permite sembrar la caché (p. ej. desde un paquete sin conexión).
+
+        Args:
+            url (str): URL a la que se asocia el contenido.
+            source: Archivo binario abierto; se copia por bloques.
+            sha256 (str | None): Hash esperado del contenido.
+
+        Raises:
+            ValueError: Si el contenido no coincide con ``sha256``.
+        """
+        self.objects.mkdir(parents=True, exist_ok=True)
+        digest = hashlib.sha256()
+        fd, tmp = tempfile.mkstemp(dir=self.objects, prefix=".put-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while chunk := source.read(self.CHUNK):
+                    digest.update(chunk)
+                    f.write(chunk)
+            actual = digest.hexdigest()
+            if sha256 and actual != sha256:
+                raise ValueError(
+                    f"El hash de '{url}' no coincide: {actual} (esperado {sha256})"
+                )
+            os.replace(tmp, self._object_path(actual))
+            self._adopt(self.objects, self._object_path(actual))
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        self._update_entry(
+            url,
+            sha256=actual,
+            etag=None,
+            last_modified=None,
+            size=self._object_path(actual).stat().st_size,
+        )
+        self.evict(keep=actual)
+        return Artifact(url, self._object_path(actual), actual, "cached")
+
+    def evict(self, keep: str | None = None) -> list:
+        """Elimina los objetos menos usados hasta quedar bajo ``max_bytes``.
+
+        Args:
+            keep (str | None): Hash que no se elimina nunca (el que se acaba de
+                guardar), aunque él solo supere ``max_bytes``.
+        """
+        with self._locked("index"):
+            index = self._read_index()
+            last_used, sizes = {}, {}
+            for entry in index.values():
+                digest = entry.get("sha256")
+                if digest and self._object_path(digest).exists():
+                    last_used[digest] = max(
+                        last_used.get(digest, 0), entry.get("used", 0)
+                    )
+                    sizes[digest] = self._object_path(digest).stat().st_size
+            total, evicted = sum(sizes.values()), []
+            for digest in sorted(last_used, key=last_used.get):
+                if total <= self.max_bytes:
+                    break
+                if digest == keep:
+                    continue
+                self._object_path(digest).unlink()
+                total -= sizes[digest]
+                evicted.append(digest)
+            if evicted:
+                self._write_index(
+                    {u: e for u, e in index.items() if e.get("sha256") not in evicted}
+                )
+            return evicted
+
+
+def _is_artifact_url(arg: str) -> bool:
+    return arg.startswith(("https://", "http://")) and " " not in arg
+
+
+def artifact_cache(offline: bool | None = None) -> ArtifactCache:
+    """Caché por defecto; ``SENTU_OFFLINE=1`` activa el modo sin conexión."""
+    if offline is None:
+        offline = os.environ.get("SENTU_OFFLINE", "") not in ("", "0", "false")
+    return ArtifactCache(offline=offline)
+
+
+@dataclass
+class FontReport:
+    """Resultado de :func:`install_fonts`.
+
+    Attributes:
+        written (list): Archivos de fuente extraídos (nuevos o cambiados).
+        unchanged (list): Archivos que ya coincidían con el zip.
+        removed (list): Fuentes instaladas antes que ya no se piden.
+        cache_refreshed (bool): Si se ejecutó ``fc-cache``.
+    """
+
+    written: list = field(default_factory=list)
+    unchanged: list = field(default_factory=list)
+    removed: list = field(default_factory=list)
+    cache_refreshed: bool = False
+
+
+def _wanted_members(archive, include: list, exclude: list) -> list:
+    members = []
+    for member in archive.infolist():
+        name = Path(member.filename).name
+        if member.is_dir() or not name:
+            continue
+        if any(fnmatch.fnmatch(name, p) for p in exclude):
+            continue
+        if any(fnmatch.fnmatch(name, p) for p in include or ["*"]):
+            members.append(member)
+    return members
+
+
+def install_fonts(
+    fonts_config: dict,
+    dest: Path = FONTS_DIR,
+    cache: ArtifactCache | None = None,
+) -> FontReport:
+    """Instala solo las caras pedidas de cada zip y refresca fontconfig si hace falta.
+
+    Cada miembro se compara con el archivo instalado por tamaño y por el CRC
+    del directorio central del zip (guardado en ``.sentu-fonts.json``), así
+    que una reinstalación sin cambios no descomprime nada. Los miembros que
+    faltan o cambiaron se extraen en streaming, uno a uno. ``fc-cache`` se
+    ejecuta solo sobre ``dest`` y solo si su contenido cambió.
+
+    Args:
+        fonts_config (dict): Subárbol ``sentu_install.fonts``.
+        dest (Path): Directorio de fuentes del usuario.
+        cache (ArtifactCache | None): Caché de la que se obtienen los zip.
+    """
+    cache = cache or artifact_cache()
+    exclude = fonts_config.get("exclude", [])
+    manifest_file = dest / FONTS_MANIFEST
+    try:
+        manifest = json.loads(manifest_file.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        manifest = {}
+
+    report, installed = FontReport(), {}
+    dest.mkdir(parents=True, exist_ok=True)
+    for spec in fonts_config.get("archives", []):
+        artifact = cache.fetch(spec["url"])
+        with zipfile.ZipFile(artifact.path) as archive:
+            for member in _wanted_members(archive, spec.get("include"), exclude):
+                name = Path(member.filename).name
+                target = dest / name
+                installed[name] = member.CRC
+                try:
+                    same = (
+                        manifest.get(name) == member.CRC
+                        and target.stat().st_size == member.file_size
+                    )
+                except FileNotFoundError:
+                    same = False
+                if same:
+                    report.unchanged.append(name)
+                    continue
+                tmp = target.with_name(f".{name}.tmp")
+                with archive.open(member) as src, open(tmp, "wb") as out:
+                    while chunk := src.read(256 * 1024):
+                        out.write(chunk)
+                os.replace(tmp, target)
+                report.written.append(name)
+
+    for name in manifest:
+        if name not in installed:
+            (dest / name).unlink(missing_ok=True)
+            report.removed.append(name)
+
+    if report.written or report.removed:
+        tmp = manifest_file.with_suffix(".tmp")
+        tmp.write_text(
+            json.dumps(installed, indent=1, sort_keys=True), encoding="utf-8"
+        )
+        os.replace(tmp, manifest_file)
+        if check_command("fc-cache"):
+            subprocess.run(["fc-cache", str(dest)], check=True)
+            report.cache_refreshed = True
+    return report
+
+
+def read_profile(repo_dir: Path, name: str) -> dict:
+    """Lee el perfil ``name`` de ``installer_config.yaml`` en ``repo_dir``.
+
+    El archivo se lee desde ``HEAD`` y no desde el árbol de trabajo, porque
+    tras un clon ``--sparse`` el directorio ``ansible/`` aún no existe.
+
+    Raises:
+        KeyError: Si el perfil no está declarado.
+    """
+    text = subprocess.run(
+        ["git", "-C", str(repo_dir), "show", f"HEAD:{CONFIG_RELPATH}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    profiles = (parse_yaml(text) or {}).get("sentu_install", {}).get("profiles", {})
+    if name not in profiles:
+        raise KeyError(
+            f"Perfil '{name}' desconocido. Disponibles: {', '.join(sorted(profiles))}"
+        )
+    return profiles[name]
+
+
+def config_directories(repo_dir: Path) -> set:
+    """Nombres de los directorios de ``config/`` en ``HEAD`` de ``repo_dir``.
+
+    Se leen del árbol de ``HEAD`` porque en un sparse checkout ``config/``
+    puede no estar en el árbol de trabajo.
+    """
+    listing = subprocess.run(
+        ["git", "-C", str(repo_dir), "ls-tree", "-d", "--name-only", "HEAD:config"],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return set(listing.split())
+
+
+def sparse_paths(profile: dict, directories: set):
+    """Directorios (modo cono) que necesita ``profile``, o ``None`` si son todos.
+
+    Args:
+        profile (dict): Perfil de :func:`read_profile`.
+        directories (set): Directorios de ``config/`` (ver
+            :func:`config_directories`); ``git sparse-checkout set --cone``
+            rechaza los archivos.
+    """
+    config = profile.get("config", "*")
+    if config == "*":
+        return None
+    # ansible/ siempre es necesario para provisionar y home/ son unos pocos
+    # archivos pequeños, así que solo se recorta config/. El modo cono incluye
+    # además los archivos sueltos de la raíz y de config/ (p. ej. konsolerc).
+    return [
+        "ansible",
+        "home",
+        *(f"config/{name}" for name in config if name in directories),
+    ]
+
+
+def apply_profile(dest: Path, name: str) -> int:
+    """Ajusta el sparse checkout de ``dest`` al perfil ``name``.
+
+    Returns:
+        int: Bytes transferidos al traer los blobs que el perfil añade.
+    """
+    before = _object_store_size(dest)
+    paths = sparse_paths(read_profile(dest, name), config_directories(dest))
+    git = ["git", "-C", str(dest), "sparse-checkout"]
+    if paths is None:
+        subprocess.run([*git, "disable"], check=True)
+    else:
+        subprocess.run([*git, "set", "--cone", *paths], check=True)
+    return max(_object_store_size(dest) - before, 0)
+
+
+def clone_repo(
+    mode: str = "ask",
+    repo_url: str = REPO_URL,
+    dest: Path = DOTFILES_DIR,
+    profile: str | None = None,
+):
+    """Obtiene o actualiza el checkout de los dotfiles.
+
+    Args:
+        mode (str): Qué hacer si ``dest`` ya existe: ``"ask"`` pregunta,
+            ``"update"`` descarga los cambios y avanza en fast-forward,
+            ``"reclone"`` elimina el directorio y clona de nuevo, y
+            ``"skip"`` lo deja como está.
+        repo_url (str): URL del repositorio.
+        dest (Path): Directorio del checkout.
+        profile (str | None): Perfil de ``installer_config.yaml`` que limita el
+            sparse checkout; ``None`` conserva el checkout completo (o el
+            sparse checkout ya configurado).
+    """
+    if dest.exists():
+        if mode == "ask":
+            info(
+                f"El directorio '{dest}' ya existe. ¿Deseas actualizarlo (a), eliminarlo y clonar de nuevo (s) u omitirlo (N)?"
+            )
+            mode = {"a": "update", "s": "reclone"}.get(input().lower(), "skip")
+
+        match mode:
+            case "update":
+                info(f"Actualizando '{dest}' desde '{repo_url}'...")
+                try:
+                    transferred = update_checkout(dest)
+                    if profile is not None:
+                        transferred += apply_profile(dest, profile)
+                except subprocess.CalledProcessError as e:
+                    error(f"Error al actualizar el repositorio: {e}")
+                    sys.exit(1)
+                except KeyError as e:
+                    error(e.args[0])
+                    sys.exit(1)
+                info(
+                    f"Repositorio actualizado ({_format_bytes(transferred)} transferidos)."
+                )
+                return
+            case "reclone":
+                try:
+                    info(f"Eliminando '{dest}'...")
+                    subprocess.run(["rm", "-rf", str(dest)], check=True)
+                except subprocess.CalledProcessError as e:
+                    error(f"Error al eliminar el directorio: {e}")
+                    sys.exit(1)
+            case _:
+                info("Omitiendo la clonación del repositorio.")
+                if profile is not None:
+                    try:
+                        apply_profile(dest, profile)
+                    except (subprocess.CalledProcessError, KeyError) as e:
+                        error(f"Error al aplicar el perfil '{profile}': {e}")
+                        sys.exit(1)
+                return
+
+    info(f"Clonando el repositorio '{REPO_NAME}' desde '{repo_url}' a '{dest}'...")
+    try:
+        transferred = fresh_clone(repo_url, dest, sparse=profile is not None)
+        if profile is not None:
+            info(f"Aplicando el perfil '{profile}' (sparse checkout)...")
+            transferred += apply_profile(dest, profile)
+        info(
+            f"Repositorio clonado exitosamente ({_format_bytes(transferred)} transferidos)."
+        )
+    except subprocess.CalledProcessError as e:
+        error(f"Error al clonar el repositorio: {e}")
+        sys.exit(1)
+    except KeyError as e:
+        error(e.args[0])
+        sys.exit(1)
+
+
+@dataclass
+class LinkReport:
+    """Resultado de reconciliar los enlaces simbólicos de los dotfiles.
+
+    Cada lista contiene las rutas de destino afectadas.
+
+    Attributes:
+        created (list): Enlaces nuevos (el destino no existía).
+        unchanged (list): Enlaces que ya apuntaban al origen correcto.
+        repaired (list): Enlaces que apuntaban a otro sitio o estaban rotos.
+        backed_up (list): Archivos o directorios reales que se movieron a un
+            respaldo ``.sentu-backup-*`` antes de enlazar.
+        removed (list): Enlaces cuyo origen desapareció del checkout.
+    """
+
+    created: list = field(default_factory=list)
+    unchanged: list = field(default_factory=list)
+    repaired: list = field(default_factory=list)
+    backed_up: list = field(default_factory=list)
+    removed: list = field(default_factory=list)
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.created or self.repaired or self.backed_up or self.removed)
+
+    def counts(self) -> dict:
+        return {
+            "created": len(self.created),
+            "unchanged": len(self.unchanged),
+            "repaired": len(self.repaired),
+            "backed_up": len(self.backed_up),
+            "removed": len(self.removed),
+        }
+
+
+def load_link_profile(repo_dir: Path, name: str | None = None) -> dict:
+    """Lee de ``installer_config.yaml`` el perfil que limita los enlaces.
+
+    Args:
+        repo_dir (Path): Checkout de los dotfiles.
+        name (str | None): Perfil; ``None`` usa ``default_profile``.
+
+    Raises:
+        KeyError: Si el perfil no está declarado.
+    """
+    config = (load_yaml(repo_dir / CONFIG_RELPATH) or {}).get("sentu_install", {})
+    profiles = config.get("profiles", {})
+    name = name or config.get("default_profile")
+    if name is None:
+        return {"config": "*", "local_share": "*"}
+    if name not in profiles:
+        raise KeyError(
+            f"Perfil '{name}' desconocido. Disponibles: {', '.join(sorted(profiles))}"
+        )
+    return profiles[name]
+
+
+def _scan_sources(directory: Path, kinds: tuple, allowed="*") -> list:
+    try:
+        with os.scandir(directory) as it:
+            entries = list(it)
+    except FileNotFoundError:
+        return []
+    sources = []
+    for entry in entries:
+        if allowed != "*" and entry.name not in allowed:
+            continue
+        if ("dir" in kinds and entry.is_dir(follow_symlinks=False)) or (
+            "file" in kinds and entry.is_file(follow_symlinks=False)
+        ):
+            sources.append(Path(entry.path))
+    return sources
+
+
+def desired_links(repo_dir: Path, home: Path, profile: dict) -> dict:
+    """Calcula los enlaces deseados como ``{destino: origen}``.
+
+    - ``config/*`` (directorios y archivos) → ``~/.config/``
+    - ``home/*`` (solo archivos, incluidos los ocultos) → ``~/``
+    - ``home/local/share/*`` (directorios) → ``~/.local/share/``
+
+    Args:
+        repo_dir (Path): Checkout de los dotfiles.
+        home (Path): Directorio personal del usuario.
+        profile (dict): Perfil con las claves ``config`` y ``local_share``.
+    """
+    repo_dir = repo_dir.absolute()
+    stages = (
+        (repo_dir / "config", home / ".config", ("dir", "file"), "config"),
+        (repo_dir / "home", home, ("file",), None),
+        (
+            repo_dir / "home" / "local" / "share",
+            home / ".local" / "share",
+            ("dir",),
+            "local_share",
+        ),
+    )
+    links = {}
+    for source_dir, target_dir, kinds, profile_key in stages:
+        allowed = profile.get(profile_key, "*") if profile_key else "*"
+        for source in _scan_sources(source_dir, kinds, allowed):
+            links[target_dir / source.name] = source
+    return links
+
+
+def reconcile_links(links: dict, dry_run: bool = False) -> LinkReport:
+    """Aplica ``links`` comparándolo con el estado actual en una sola pasada.
+
+    Cada destino se examina con un único ``lstat``; solo se tocan los que no
+    apuntan ya a su origen.
+
+    Args:
+        links (dict): ``{destino: origen}`` calculado por :func:`desired_links`.
+        dry_run (bool): Solo informa de los cambios, sin aplicarlos.
+
+    Returns:
+        LinkReport: Qué enlaces se crearon, se repararon o ya estaban bien.
+    """
+    report = LinkReport()
+    stamp = time.strftime("%Y%m%d%H%M%S")
+    ready_parents = set()
+    for dest, src in sorted(links.items()):
+        try:
+            st = os.lstat(dest)
+        except FileNotFoundError:
+            st = None
+
+        if st is None:
+            bucket = report.created
+        elif stat.S_ISLNK(st.st_mode):
+            if os.readlink(dest) == str(src):
+                report.unchanged.append(str(dest))
+                continue
+            bucket = report.repaired
+        else:
+            bucket = report.backed_up
+        bucket.append(str(dest))
+        if dry_run:
+            continue
+
+        if dest.parent not in ready_parents:
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            ready_parents.add(dest.parent)
+        if bucket is report.backed_up:
+            os.rename(dest, dest.with_name(f"{dest.name}.sentu-backup-{stamp}"))
+        # Enlace temporal + rename: el reemplazo es atómico.
+        tmp = dest.with_name(f".{dest.name}.sentu-tmp")
+        if os.path.lexists(tmp):
+            os.unlink(tmp)
+        os.symlink(src, tmp)
+        os.replace(tmp, dest)
+    return report
+
+
+def link_dotfiles(
+    repo_dir: Path = DOTFILES_DIR,
+    home: Path | None = None,
+    profile: str | None = None,
+    dry_run: bool = False,
+) -> LinkReport:
+    """Enlaza los dotfiles de ``repo_dir`` en ``home`` según el perfil indicado."""
+    home = home or Path.home()
+    links = desired_links(repo_dir, home, load_link_profile(repo_dir, profile))
+    return reconcile_links(links, dry_run=dry_run)
+
+
+def remove_stale_links(dests, repo_dir: Path, report: LinkReport) -> LinkReport:
+    """Elimina los enlaces de ``dests`` que apuntan dentro de ``repo_dir``.
+
+    Solo se borran enlaces simbólicos creados a partir del checkout; cualquier
+    otro archivo se deja intacto.
+    """
+    prefix = str(repo_dir.absolute()) + os.sep
+    for dest in sorted(dests):
+        try:
+            target = os.readlink(dest)
+        except OSError:
+            continue  # No existe o no es un enlace.
+        if target.startswith(prefix):
+            os.unlink(dest)
+            report.removed.append(str(dest))
+    return report
+
+
+class _Inotify:
+    """Envoltorio mínimo de inotify(7) vía ``ctypes`` (solo Linux)."""
+
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_ISDIR = 0x40000000
+    ENTRY_EVENTS = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+    _EVENT = struct.Struct("iIII")
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(
+            ctypes.util.find_library("c") or "libc.so.6", use_errno=True
+        )
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError("inotify no está disponible en este sistema.")
+        self.fd = self._libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 falló")
+        self.watches = {}
+
+    def add_watch(self, path: Path, mask: int) -> bool:
+        wd = self._libc.inotify_add_watch(
+            self.fd, os.fsencode(path), mask | self.IN_MOVE_SELF | self.IN_ONLYDIR
+        )
+        if wd < 0:
+            return False
+        self.watches[wd] = path
+        return True
+
+    def read_events(self):
+        """Devuelve ``[(directorio, nombre, máscara)]`` de los eventos pendientes.
+
+        Un directorio vigilado que se borra o se mueve pierde su vigilancia
+        (un movido ya no está en su ruta): llega un evento ``IN_IGNORED`` con
+        nombre vacío y deja de estar en :attr:`watches`.
+        """
+        events = []
+        while True:
+            try:
+                buf = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(buf):
+                wd, mask, _, length = self._EVENT.unpack_from(buf, offset)
+                offset += self._EVENT.size
+                name = os.fsdecode(buf[offset : offset + length].rstrip(b"\0"))
+                offset += length
+                if mask & self.IN_MOVE_SELF:
+                    self._libc.inotify_rm_watch(self.fd, wd)
+                    continue
+                path = self.watches.get(wd)
+                if mask & self.IN_IGNORED:
+                    self.watches.pop(wd, None)
+                events.append((path, name, mask))
+
+    def close(self):
+        os.close(self.fd)
+
+
+def watch_dotfiles(
+    repo_dir: Path = DOTFILES_DIR,
+    home: Path | None = None,
+    profile: str | None = None,
+    debounce: float = 0.5,
+    on_report=None,
+):
+    """Vigila el checkout y enlaza o desenlaza solo las entradas afectadas.
+
+    Observa con inotify ``config/``, ``home/`` y ``home/local/share`` del
+    checkout. El proceso duerme en ``select`` mientras no haya eventos; tras
+    el primero espera ``debounce`` segundos sin actividad (p. ej. durante un
+    ``git pull``) y aplica todos los cambios acumulados de una vez.
+
+    También se vigilan sus directorios padre: si una de esas raíces se crea
+    después de empezar, o se borra y se vuelve a crear, se vigila de nuevo y
+    se reconcilia todo; los enlaces hacia una raíz borrada se eliminan.
+
+    Args:
+        repo_dir (Path): Checkout de los dotfiles.
+        home (Path | None): Directorio personal; por defecto ``Path.home()``.
+        profile (str | None): Perfil de ``installer_config.yaml``.
+        debounce (float): Segundos de inactividad antes de aplicar cambios.
+        on_report (callable | None): Recibe cada :class:`LinkReport` aplicado.
+    """
+    home = home or Path.home()
+    repo_dir = repo_dir.absolute()
+    link_profile = load_link_profile(repo_dir, profile)
+    targets = {
+        repo_dir / "config": home / ".config",
+        repo_dir / "home": home,
+        repo_dir / "home" / "local" / "share": home / ".local" / "share",
+    }
+
+    # Raíces y sus padres, de fuera adentro: un padre avisa (IN_CREATE con
+    # IN_ISDIR) cuando aparece la raíz que aún no existía.
+    watched_dirs = [
+        repo_dir,
+        repo_dir / "config",
+        repo_dir / "home",
+        repo_dir / "home" / "local",
+        repo_dir / "home" / "local" / "share",
+    ]
+
+    inotify = _Inotify()
+
+    def arm() -> bool:
+        """Vigila los directorios que existan y aún no lo estén.
+
+        Returns:
+            bool: True si se empezó a vigilar alguna raíz.
+        """
+        current = set(inotify.watches.values())
+        added = False
+        for directory in watched_dirs:
+            if directory not in current and inotify.add_watch(
+                directory, inotify.ENTRY_EVENTS
+            ):
+                added = added or directory in targets
+        return added
+
+    def links_into(source_dir: Path) -> set:
+        """Enlaces del destino de ``source_dir`` que apuntan a esa raíz."""
+        prefix = str(source_dir) + os.sep
+        found = set()
+        try:
+            entries = list(os.scandir(targets[source_dir]))
+        except OSError:
+            return found
+        for entry in entries:
+            try:
+                if entry.is_symlink() and os.readlink(entry.path).startswith(prefix):
+                    found.add(Path(entry.path))
+            except OSError:
+                pass
+        return found
+
+    try:
+        arm()
+        if repo_dir not in inotify.watches.values():
+            raise FileNotFoundError(f"No hay directorios que vigilar en '{repo_dir}'.")
+
+        pending, full_resync = set(), False
+        while True:
+            timeout = debounce if (pending or full_resync) else None
+            ready, _, _ = select.select([inotify.fd], [], [], timeout)
+            if ready:
+                rearm = False
+                for source_dir, name, mask in inotify.read_events():
+                    if mask & inotify.IN_Q_OVERFLOW:
+                        full_resync = rearm = True
+                    elif mask & inotify.IN_IGNORED:
+                        # Raíz borrada o movida: sus enlaces quedan huérfanos.
+                        if source_dir in targets:
+                            pending.update(links_into(source_dir))
+                        rearm = True
+                    else:
+                        if mask & inotify.IN_ISDIR and mask & (
+                            inotify.IN_CREATE | inotify.IN_MOVED_TO
+                        ):
+                            rearm = True
+                        if source_dir in targets and name:
+                            pending.add(targets[source_dir] / name)
+                # Una raíz nueva se reescanea entera: pudo llenarse antes de
+                # empezar a vigilarla.
+                if rearm and arm():
+                    full_resync = True
+                continue
+
+            links = desired_links(repo_dir, home, link_profile)
+            if not full_resync:
+                links = {dest: src for dest, src in links.items() if dest in pending}
+            report = reconcile_links(links)
+            remove_stale_links(pending - links.keys(), repo_dir, report)
+            pending, full_resync = set(), False
+            if on_report is not None and report.changed:
+                on_report(report)
+    finally:
+        inotify.close()
+
+
+def _lookup(tree: dict, dotted: str):
+    """Devuelve ``tree[a][b]...`` para ``"a.b..."`` o ``None`` si falta algún nivel."""
+    for key in dotted.split("."):
+        if not isinstance(tree, dict) or key not in tree:
+            return None
+        tree = tree[key]
+    return tree
+
+
+def playbook_roles(repo_dir: Path = DOTFILES_DIR) -> list:
+    """Nombres de los roles de ``ansible/playbook.yml``, en orden."""
+    plays = load_yaml(repo_dir / "ansible" / "playbook.yml") or []
+    return [
+        entry["role"] if isinstance(entry, dict) else entry
+        for play in plays
+        for entry in play.get("roles", [])
+    ]
+
+
+def _hash_tree(digest, directory: Path):
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+        for name in sorted(files):
+            path = Path(root, name)
+            digest.update(str(path.relative_to(directory)).encode() + b"\0")
+            digest.update(path.read_bytes() + b"\0")
+
+
+def _installed_versions(packages: set) -> dict:
+    """``{paquete: versiones}`` desde la base de datos RPM, en una sola consulta."""
+    if not packages or not check_command("rpm"):
+        return {}
+    result = subprocess.run(
+        [
+            "rpm",
+            "-q",
+            "--qf",
+            "%{NAME} %{EPOCH}:%{VERSION}-%{RELEASE}.%{ARCH}\\n",
+            *sorted(packages),
+        ],
+        capture_output=True,
+        text=True,
+        env=c_locale_env(),
+    )
+    versions = {}
+    for line in result.stdout.splitlines():
+        # Los ausentes aparecen como "package X is not installed"; un paquete
+        # puede tener varias versiones instaladas (p. ej. kernel-devel).
+        name, _, version = line.partition(" ")
+        if name in packages:
+            versions.setdefault(name, []).append(version)
+    return {name: sorted(found) for name, found in versions.items()}
+
+
+def role_fingerprints(repo_dir: Path = DOTFILES_DIR, profile: str | None = None):
+    """Calcula un hash de las entradas de cada role del playbook.
+
+    Las entradas se declaran en ``sentu_install.roles`` de
+    ``installer_config.yaml``: los archivos del role, los subárboles de
+    variables que usa, las versiones instaladas de sus paquetes y, si
+    procede, el commit de los dotfiles y el perfil o el propio
+    ``sentu_install.py`` del checkout (``script: true``, para los roles que lo
+    ejecutan o lo importan).
+
+    Returns:
+        dict: ``{role: sha256}`` para cada role de ``playbook.yml``.
+    """
+    config = (load_yaml(repo_dir / CONFIG_RELPATH) or {}).get("sentu_install", {})
+    role_inputs = config.get("roles", {})
+    roles = playbook_roles(repo_dir)
+
+    packages = set()
+    for role in roles:
+        for dotted in (role_inputs.get(role) or {}).get("packages", []):
+            packages.update(_lookup(config, dotted) or [])
+    versions = _installed_versions(packages)
+
+    snapshot = host_snapshot()
+    commit = script = None
+    fingerprints = {}
+    for role in roles:
+        inputs = role_inputs.get(role) or {}
+        digest = hashlib.sha256()
+        _hash_tree(digest, repo_dir / "ansible" / "roles" / role)
+        state = {
+            "host": [snapshot.distribution, snapshot.distribution_version],
+            "vars": {
+                dotted: _lookup(config, dotted) for dotted in inputs.get("vars", [])
+            },
+            "packages": {
+                name: versions.get(name)
+                for dotted in inputs.get("packages", [])
+                for name in _lookup(config, dotted) or []
+            },
+        }
+        if inputs.get("upgrade"):
+            # Cambia cuando vence el intervalo de la política de actualización.
+            state["upgrade_due"] = upgrade_due(config.get("upgrade") or {})
+        if inputs.get("checkout"):
+            if commit is None:
+                commit = subprocess.run(
+                    ["git", "-C", str(repo_dir), "rev-parse", "HEAD"],
+                    capture_output=True,
+                    text=True,
+                ).stdout.strip()
+            state["checkout"] = [commit, profile]
+        if inputs.get("script"):
+            # El script puede cambiar sin commit (árbol de trabajo, --skip-clone).
+            if script is None:
+                try:
+                    script = _file_digest(repo_dir / "sentu_install.py")["sha256"]
+                except OSError:
+                    script = ""
+            state["script"] = script
+        digest.update(json.dumps(state, sort_keys=True).encode())
+        fingerprints[role] = digest.hexdigest()
+    return fingerprints
+
+
+def load_state() -> dict:
+    """Manifiesto de la última ejecución correcta (``{role: sha256}``)."""
+    try:
+        with open(STATE_FILE, encoding="utf-8") as f:
+            return json.load(f).get("roles", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(fingerprints: dict, only: list | None = None):
+    """Guarda el manifiesto.
+
+    Args:
+        fingerprints (dict): ``{role: sha256}`` calculado tras la ejecución.
+        only (list | None): Si se indica, solo se actualizan esos roles (los
+            que terminaron bien) y el resto conserva su valor anterior.
+    """
+    roles = fingerprints
+    if only is not None:
+        roles = load_state()
+        roles.update({role: fingerprints[role] for role in only})
+    STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp = STATE_FILE.with_suffix(".tmp")
+    tmp.write_text(
+        json.dumps({"updated": time.time(), "roles": roles}, indent=2),
+        encoding="utf-8",
+    )
+    os.replace(tmp, STATE_FILE)
+
+
+def changed_roles(fingerprints: dict, state: dict) -> list:
+    """Roles cuyas entradas difieren del manifiesto, en orden del playbook."""
+    return [role for role, digest in fingerprints.items() if state.get(role) != digest]
+
+
+@dataclass
+class PackagePlan:
+    """Plan de instalación de un grupo de paquetes.
+
+    Attributes:
+        group (str): Nombre del grupo en ``sentu_install.package_plan``.
+        present (list): Paquetes ya instalados (por nombre, capacidad o ejecutable).
+        to_install (list): Paquetes disponibles que faltan.
+        unavailable (list): Paquetes que ningún repositorio ofrece.
+        options (list): Opciones extra de ``dnf install`` para el grupo.
+        duplicates (list): Entradas repetidas descartadas al unir las listas.
+    """
+
+    group: str
+    present: list = field(default_factory=list)
+    to_install: list = field(default_factory=list)
+    unavailable: list = field(default_factory=list)
+    options: list = field(default_factory=list)
+    duplicates: list = field(default_factory=list)
+
+
+def package_groups(config: dict) -> list:
+    """Une las listas de ``package_plan`` sin duplicados.
+
+    Returns:
+        list: ``[(grupo, paquetes, opciones, duplicados)]`` en orden; cada
+        paquete aparece solo en el primer grupo que lo incluye.
+    """
+    seen, groups = set(), []
+    for group in config.get("package_plan", []):
+        names, duplicates = [], []
+        for dotted in group.get("lists", []):
+            for name in _lookup(config, dotted) or []:
+                if name in seen:
+                    duplicates.append(name)
+                else:
+                    seen.add(name)
+                    names.append(name)
+        groups.append((group["name"], names, group.get("options", []), duplicates))
+    return groups
+
+
+def c_locale_env() -> dict:
+    """Entorno actual con ``LC_ALL=C`` para analizar la salida de rpm y dnf.
+
+    Sus mensajes se traducen según el idioma del usuario; con la
+    configuración regional ``C`` siempre salen en inglés.
+    """
+    return {**os.environ, "LC_ALL": "C"}
+
+
+def installed_capabilities() -> set:
+    """Nombres y capacidades (``Provides``) de todo lo instalado, en una consulta."""
+    result = subprocess.run(
+        ["rpm", "-qa", "--qf", "[%{PROVIDENAME}\\n]"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return set(result.stdout.split())
+
+
+def rpm_owned_executables(names: list) -> set:
+    """Subconjunto de ``names`` cuyo ejecutable en ``PATH`` pertenece a un RPM.
+
+    Para capacidades de archivo (``g++``, ``java``) que ``PROVIDENAME`` no
+    lista. Se sigue el enlace (alternatives) y se pregunta a la base RPM por
+    todos en una sola llamada; un ``cargo`` de rustup en ``~/.cargo/bin`` no
+    cuenta.
+    """
+    paths = {}
+    for name in names:
+        executable = shutil.which(name)
+        if executable:
+            paths[name] = os.path.realpath(executable)
+    if not paths:
+        return set()
+    result = subprocess.run(
+        ["rpm", "-qf", "--qf", "%{NAME}\\n", *paths.values()],
+        capture_output=True,
+        text=True,
+        env=c_locale_env(),
+    )
+    # Los archivos sin dueño (o inexistentes) aparecen en los mensajes de rpm.
+    unowned = result.stdout + result.stderr
+    return {
+        name
+        for name, path in paths.items()
+        if f"file {path} is not owned" not in unowned
+        and f"file {path}: No such file" not in unowned
+    }
+
+
+def available_packages(names: list) -> set:
+    """Subconjunto de ``names`` que ofrece algún repositorio configurado.
+
+    Una consulta por nombre de paquete para todos y, para los que no
+    coinciden por nombre (p. ej. ``g++``), otra por capacidad para todos a la
+    vez (``--whatprovides a,b,c``). Como esa respuesta no dice qué pidió cada
+    paquete, se piden sus ``provides`` y archivos y se atribuye cada nombre
+    por paquete, capacidad o ejecutable (``/usr/bin/<nombre>``).
+    """
+    if not names:
+        return set()
+    repoquery = [
+        "dnf",
+        "repoquery",
+        "--quiet",
+        "--available",
+        *dnf_metadata_options(),
+    ]
+    result = subprocess.run(
+        [*repoquery, "--qf", "%{name}\\n", *names], capture_output=True, text=True
+    )
+    found = set(result.stdout.split())
+    if result.returncode == 0:
+        # Si falló (p. ej. sin red), la siguiente consulta vuelve a refrescar.
+        mark_dnf_metadata_fresh()
+    available = {name for name in names if name in found}
+    pending = [name for name in names if name not in available]
+    if not pending:
+        return available
+    result = subprocess.run(
+        [
+            *repoquery,
+            "--qf",
+            "@%{name}\\n%{provides}\\n%{files}\\n",
+            "--whatprovides",
+            ",".join(pending),
+        ],
+        capture_output=True,
+        text=True,
+    )
+    offered = set()
+    for line in result.stdout.splitlines():
+        line = line.strip()
+        if line:
+            # "@paquete", "capacidad = versión" o una ruta.
+            offered.add(line.removeprefix("@").split(" ", 1)[0])
+    for name in pending:
+        if name in offered or any(
+            f"{directory}/{name}" in offered
+            for directory in ("/usr/bin", "/usr/sbin", "/bin", "/sbin")
+        ):
+            available.add(name)
+    return available
+
+
+def plan_packages(config: dict, groups: list | None = None) -> list:
+    """Calcula el plan de cada grupo de ``package_plan`` contra la base RPM.
+
+    Args:
+        config (dict): Subárbol ``sentu_install`` de ``installer_config.yaml``.
+        groups (list | None): Grupos a planificar; ``None`` para todos.
+
+    Returns:
+        list: Un :class:`PackagePlan` por grupo.
+    """
+    installed = installed_capabilities()
+    plans = []
+    for name, packages, options, duplicates in package_groups(config):
+        if groups is not None and name not in groups:
+            continue
+        plan = PackagePlan(name, options=list(options), duplicates=duplicates)
+        # Algunos nombres son capacidades de archivo (g++, java) que
+        # PROVIDENAME no lista: cuentan si su ejecutable es de un RPM.
+        unlisted = [package for package in packages if package not in installed]
+        owned = rpm_owned_executables(unlisted)
+        missing = []
+        for package in packages:
+            if package in installed or package in owned:
+                plan.present.append(package)
+            else:
+                missing.append(package)
+        available = available_packages(missing)
+        plan.to_install = [p for p in missing if p in available]
+        plan.unavailable = [p for p in missing if p not in available]
+        plans.append(plan)
+    return plans
+
+
+def install_planned(plan: PackagePlan, dry_run: bool = False) -> bool:
+    """Instala ``plan.to_install`` en una única transacción de dnf."""
+    if not plan.to_install or dry_run:
+        return True
+    command = [
+        "dnf",
+        "install",
+        "-y",
+        *dnf_metadata_options(),
+        *plan.options,
+        *plan.to_install,
+    ]
+    if os.geteuid() != 0:
+        command.insert(0, "sudo")
+    try:
+        subprocess.run(command, check=True)
+    except subprocess.CalledProcessError as e:
+        error(f"Error en la transacción del grupo '{plan.group}': {e}")
+        return False
+    mark_dnf_metadata_fresh()
+    return True
+
+
+def dnf_metadata_options() -> list:
+    """Opciones de dnf para reutilizar los metadatos dentro de una ejecución.
+
+    El primer comando de dnf de una ejecución del instalador (``SENTU_RUN_ID``)
+    refresca los metadatos caducados y lo anota con
+    :func:`mark_dnf_metadata_fresh`; los siguientes roles ya no los
+    revalidan.
+    """
+    run_id = os.environ.get("SENTU_RUN_ID")
+    try:
+        if run_id and DNF_RUN_MARKER.read_text(encoding="utf-8") == run_id:
+            return ["--setopt=metadata_expire=never"]
+    except OSError:
+        pass
+    return []
+
+
+def mark_dnf_metadata_fresh():
+    """Anota que los metadatos de dnf ya se refrescaron en esta ejecución."""
+    run_id = os.environ.get("SENTU_RUN_ID")
+    if not run_id or os.geteuid() != 0:
+        return  # La caché de dnf de un usuario sin privilegios no se comparte.
+    try:
+        DNF_RUN_MARKER.parent.mkdir(parents=True, exist_ok=True)
+        DNF_RUN_MARKER.write_text(run_id, encoding="utf-8")
+    except OSError:
+        pass
+
+
+@dataclass
+class RepoPlan:
+    """Plan de :func:`plan_repositories`.
+
+    Attributes:
+        present (list): Repositorios ya configurados (se omiten).
+        release_rpms (dict): ``{nombre: url}`` de RPM de release a instalar,
+            todos en una sola transacción.
+        repo_files (dict): ``{nombre: (url, archivo)}`` de archivos ``.repo``
+            a copiar en el directorio de repositorios (sin pasar por dnf).
+    """
+
+    present: list = field(default_factory=list)
+    release_rpms: dict = field(default_factory=dict)
+    repo_files: dict = field(default_factory=dict)
+
+
+def configured_repos(repos_dir: Path = REPOS_DIR) -> set:
+    """Ids de todos los repositorios definidos en ``repos_dir/*.repo``."""
+    ids = set()
+    for path in sorted(repos_dir.glob("*.repo")):
+        parser = configparser.ConfigParser(interpolation=None, strict=False)
+        try:
+            parser.read(path, encoding="utf-8")
+        except (OSError, configparser.Error):
+            continue
+        ids.update(parser.sections())
+    return ids
+
+
+def _resolve_repo(entry: dict, variables: dict) -> tuple:
+    """Plantilla una entrada de repositorio y traduce ``copr`` a su ``.repo``.
+
+    Returns:
+        tuple: ``(entrada, ids de repositorio)``.
+    """
+    entry = {
+        key: render_vars(value, variables) if isinstance(value, str) else value
+        for key, value in entry.items()
+    }
+    repo_ids = list(entry.get("repos", []))
+    if "copr" in entry:
+        owner, project = entry["copr"].split("/", 1)
+        version = variables.get("fedora_version", "")
+        host = "copr.fedorainfracloud.org"
+        entry["repofile"] = (
+            f"https://{host}/coprs/{owner}/{project}/repo/fedora-{version}/"
+            f"{owner}-{project}-fedora-{version}.repo"
+        )
+        entry.setdefault("file", f"_copr:{host}:{owner}:{project}.repo")
+        repo_ids.append(f"copr:{host}:{owner}:{project}")
+    return entry, repo_ids
+
+
+def plan_repositories(
+    repos: dict, repos_dir: Path = REPOS_DIR, variables: dict | None = None
+) -> RepoPlan:
+    """Decide qué repositorios de ``package_managers.fedora.repo`` faltan.
+
+    ``repos_dir`` y los paquetes instalados se indexan una sola vez. Un
+    repositorio está presente si alguno de sus ``repos`` (ids) ya está
+    definido, si existe su archivo ``.repo`` o si su ``package`` (el RPM de
+    release) está instalado. Cada entrada declara ``release_rpm``,
+    ``repofile`` o ``copr`` (``dueño/proyecto``).
+
+    Args:
+        repos (dict): ``{nombre: entrada}`` de ``installer_config.yaml``.
+        repos_dir (Path): Directorio de archivos ``.repo``.
+        variables (dict | None): Valores para ``{{ nombre }}`` (p. ej.
+            ``fedora_version``).
+
+    Returns:
+        RepoPlan: Lo presente y lo que falta instalar.
+
+    Raises:
+        ValueError: Si una entrada no declara cómo añadir el repositorio.
+    """
+    variables = variables or {}
+    defined = configured_repos(repos_dir)
+    installed = None
+    plan = RepoPlan()
+    for name, entry in repos.items():
+        entry, repo_ids = _resolve_repo(entry, variables)
+        if "repofile" in entry:
+            filename = entry.get("file") or Path(entry["repofile"]).name
+            if defined.intersection(repo_ids) or (repos_dir / filename).exists():
+                plan.present.append(name)
+            else:
+                plan.repo_files[name] = (entry["repofile"], filename)
+        elif "release_rpm" in entry:
+            if installed is None:
+                installed = installed_capabilities()
+            if defined.intersection(repo_ids) or entry.get("package") in installed:
+                plan.present.append(name)
+            else:
+                plan.release_rpms[name] = entry["release_rpm"]
+        else:
+            raise ValueError(f"El repositorio '{name}' no declara cómo añadirse.")
+    return plan
+
+
+def _artifact_link(cache, url: str, directory: Path) -> Path:
+    """Enlaza el artefacto de ``url`` en ``directory`` con su nombre original.
+
+    Herramientas como dnf deciden por la extensión (``*.rpm``) si un argumento
+    es un archivo local.
+    """
+    artifact = cache.fetch(url)
+    name = Path(urllib.parse.urlsplit(url).path).name or "artifact"
+    directory.mkdir(parents=True, exist_ok=True)
+    view = directory / name
+    view.symlink_to(artifact.path)
+    return view
+
+
+def apply_repositories(
+    plan: RepoPlan, repos_dir: Path = REPOS_DIR, cache=None, dry_run: bool = False
+) -> bool:
+    """Añade los repositorios de ``plan``.
+
+    Los archivos ``.repo`` se copian directamente en ``repos_dir`` y los RPM de
+    release se instalan en una única transacción de dnf. Todas las descargas
+    pasan por la caché de artefactos.
+    """
+    if dry_run or not (plan.release_rpms or plan.repo_files):
+        return True
+    cache = cache or artifact_cache()
+    with tempfile.TemporaryDirectory(prefix="sentu-repos-") as workdir:
+        try:
+            for name, (url, filename) in plan.repo_files.items():
+                content = cache.fetch(url).path.read_bytes()
+                tmp = repos_dir / f".{filename}.tmp"
+                tmp.write_bytes(content)
+                tmp.chmod(0o644)
+                os.replace(tmp, repos_dir / filename)
+                info(f"Repositorio añadido: {name} ({filename})")
+            rpms = [
+                _artifact_link(cache, url, Path(workdir, str(i)))
+                for i, url in enumerate(plan.release_rpms.values())
+            ]
+        except (OfflineCacheMiss, urllib.error.URLError, ValueError, OSError) as e:
+            error(f"No se pudo descargar un repositorio: {e}")
+            return False
+        if not rpms:
+            return True
+        command = ["dnf", "install", "-y", *dnf_metadata_options(), *map(str, rpms)]
+        if os.geteuid() != 0:
+            command.insert(0, "sudo")
+        try:
+            subprocess.run(command, check=True)
+        except subprocess.CalledProcessError as e:
+            error(f"Error al instalar los RPM de release: {e}")
+            return False
+    mark_dnf_metadata_fresh()
+    info(f"Repositorios añadidos: {', '.join(plan.release_rpms)}")
+    return True
+
+
+def artifact_urls(config: dict, variables: dict | None = None) -> list:
+    """URLs que descargan los roles según ``installer_config.yaml``.
+
+    Incluye los archivos de fuentes, ``install_scripts``, las URLs de los
+    comandos de post-instalación que pasan por ``cached-run`` y todos los
+    repositorios de Fedora (RPM de release, ``.repo`` y copr).
+
+    Args:
+        config (dict): Subárbol ``sentu_install``.
+        variables (dict | None): Valores para ``{{ nombre }}`` (p. ej.
+            ``fedora_version``).
+    """
+    variables = variables or {}
+    urls = {entry["url"] for entry in _lookup(config, "fonts.archives") or []}
+    urls.update((config.get("install_scripts") or {}).values())
+    for entry in config.get("install_post_install_commands") or []:
+        if "cached-run" in entry.get("command", ""):
+            urls.update(re.findall(r"https?://\S+", entry["command"]))
+    for entry in (_lookup(config, "package_managers.fedora.repo") or {}).values():
+        entry, _ = _resolve_repo(entry, variables)
+        urls.update(entry[key] for key in ("release_rpm", "repofile") if key in entry)
+    return sorted(render_vars(url, variables) for url in urls)
+
+
+class BundleError(ValueError):
+    """El paquete sin conexión está dañado o no es de un formato conocido."""
+
+
+@dataclass
+class BundleContents:
+    """Resultado de :func:`provision_from_bundle`.
+
+    Attributes:
+        manifest (dict): Manifiesto del paquete (``manifest.json``).
+        checkout (Path | None): Checkout extraído, si se pidió.
+        wheels (Path | None): Directorio con las wheels de Ansible, si las hay.
+        artifacts (int): Artefactos añadidos a la caché.
+        reused (int): Artefactos que la caché ya tenía.
+    """
+
+    manifest: dict
+    checkout: Path | None = None
+    wheels: Path | None = None
+    artifacts: int = 0
+    reused: int = 0
+
+
+class _HashingReader:
+    """Envuelve un archivo y calcula el SHA-256 y el tamaño de lo leído."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.raw.read(size)
+        self.digest.update(data)
+        self.size += len(data)
+        return data
+
+    def check(self, name: str, expected: dict):
+        while self.read(ArtifactCache.CHUNK):
+            pass
+        if (self.digest.hexdigest(), self.size) != (
+            expected["sha256"],
+            expected["size"],
+        ):
+            raise BundleError(f"'{name}' no coincide con el manifiesto.")
+
+
+def _file_digest(path: Path) -> dict:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(ArtifactCache.CHUNK):
+            digest.update(chunk)
+    return {"sha256": digest.hexdigest(), "size": path.stat().st_size}
+
+
+def find_bundle(explicit: Path | None = None) -> Path | None:
+    """Paquete sin conexión a usar: ``--bundle``, ``SENTU_BUNDLE`` o un
+    ``sentu-bundle.tar.gz`` junto al script.
+
+    No se busca en el directorio actual: es donde ``bundle`` deja el paquete
+    por defecto y una ejecución normal pasaría sin avisar a modo sin conexión.
+    Por lo mismo, tampoco se busca nada si el script llega por la entrada
+    estándar (``python3 -``, como en ``fleet``): no tiene directorio propio.
+    """
+    if explicit:
+        return explicit
+    if os.environ.get("SENTU_BUNDLE"):
+        return Path(os.environ["SENTU_BUNDLE"])
+    if __file__ == "<stdin>":
+        return None
+    candidate = Path(__file__).resolve().parent / BUNDLE_NAME
+    if candidate.is_file():
+        info(
+            f"Usando el paquete sin conexión {candidate} (detectado junto al "
+            "script; bórralo o muévelo para clonar desde la red)."
+        )
+        return candidate
+    return None
+
+
+def create_bundle(
+    repo: Path,
+    output: Path,
+    fedora_version: str,
+    with_ansible: bool = False,
+    repo_url: str = REPO_URL,
+    cache: ArtifactCache | None = None,
+) -> dict:
+    """Empaqueta todo lo necesario para aprovisionar sin red.
+
+    El archivo (tar comprimido con gzip) contiene, en este orden:
+
+    - ``manifest.json``: commit, versión de Fedora, hash y tamaño de cada
+      miembro y la URL de cada artefacto. Va primero para poder verificar el
+      resto mientras se lee el flujo.
+    - ``artifacts/<sha256>``: fuentes, scripts de instalación y RPM/``.repo``
+      de los repositorios, tomados de la caché de artefactos.
+    - ``wheels/``: Ansible y sus dependencias (solo con ``with_ansible``; el
+      ejecutor nativo no las necesita).
+    - ``dotfiles/``: clon superficial y completo (con ``.git`` y todos los
+      blobs) del commit actual de ``repo``, con ``origin`` apuntando a
+      ``repo_url``.
+
+    Args:
+        repo (Path): Checkout de los dotfiles.
+        output (Path): Archivo a crear.
+        fedora_version (str): Versión para las URLs de los repositorios.
+        with_ansible (bool): Incluye las wheels de Ansible (``pip download``).
+        repo_url (str): Remoto ``origin`` del checkout empaquetado.
+        cache (ArtifactCache | None): Caché de la que salen los artefactos.
+
+    Returns:
+        dict: El manifiesto escrito.
+
+    Raises:
+        subprocess.CalledProcessError: Si falla git o pip.
+        OfflineCacheMiss, urllib.error.URLError: Si un artefacto no se puede
+            descargar.
+    """
+    cache = cache or artifact_cache()
+    config = (load_yaml(repo / CONFIG_RELPATH) or {}).get("sentu_install", {})
+    with tempfile.TemporaryDirectory(prefix="sentu-bundle-") as workdir:
+        checkout = Path(workdir) / "dotfiles"
+        # Un clon superficial sin filtro tiene todos los blobs del commit, así
+        # que el checkout extraído no necesita volver a la red.
+        subprocess.run(
+            [
+                "git",
+                "clone",
+                "--quiet",
+                "--depth",
+                "1",
+                "--no-local",
+                f"file://{repo.resolve()}",
+                str(checkout),
+            ],
+            check=True,
+        )
+        subprocess.run(
+            ["git", "-C", str(checkout), "remote", "set-url", "origin", repo_url],
+            check=True,
+        )
+        commit = subprocess.run(
+            ["git", "-C", str(checkout), "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+
+        members = {}
+        urls = {}
+        for url in artifact_urls(config, {"fedora_version": fedora_version}):
+            artifact = cache.fetch(url)
+            urls[url] = artifact.sha256
+            members[f"artifacts/{artifact.sha256}"] = artifact.path
+        if with_ansible:
+            wheels = Path(workdir) / "wheels"
+            subprocess.run(
+                [
+                    sys.executable,
+                    "-m",
+                    "pip",
+                    "download",
+                    "--quiet",
+                    "--only-binary=:all:",
+                    "--dest",
+                    str(wheels),
+                    ANSIBLE_REQUIREMENT,
+                ],
+                check=True,
+            )
+            for wheel in sorted(wheels.iterdir()):
+                members[f"wheels/{wheel.name}"] = wheel
+        for directory, dirnames, filenames in os.walk(checkout):
+            dirnames.sort()
+            for name in sorted(filenames):
+                path = Path(directory) / name
+                if not path.is_symlink():
+                    members[f"dotfiles/{path.relative_to(checkout)}"] = path
+
+        manifest = {
+            "format": BUNDLE_FORMAT,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "commit": commit,
+            "fedora_version": fedora_version,
+            "artifacts": urls,
+            "members": {name: _file_digest(path) for name, path in members.items()},
+        }
+        data = json.dumps(manifest, indent=1).encode()
+        output.parent.mkdir(parents=True, exist_ok=True)
+        tmp = output.with_name(f".{output.name}.tmp")
+        with tarfile.open(str(tmp), "w|gz") as tar:
+            header = tarfile.TarInfo("manifest.json")
+            header.size = len(data)
+            header.mtime = int(time.time())
+            tar.addfile(header, io.BytesIO(data))
+            for name, path in members.items():
+                tar.add(path, arcname=name, recursive=False)
+            # Directorios, enlaces y permisos del checkout (sin hash).
+            for directory, dirnames, filenames in os.walk(checkout):
+                for name in sorted(dirnames + filenames):
+                    path = Path(directory) / name
+                    if path.is_symlink() or path.is_dir():
+                        arcname = f"dotfiles/{path.relative_to(checkout)}"
+                        tar.add(path, arcname=arcname, recursive=False)
+        os.replace(tmp, output)
+    return manifest
+
+
+def provision_from_bundle(
+    bundle: Path, cache: ArtifactCache, checkout: Path | None = None
+) -> BundleContents:
+    """Aprovisiona desde un paquete de :func:`create_bundle` en una sola pasada.
+
+    El archivo se lee como flujo: cada miembro se verifica contra el
+    manifiesto mientras se copia a su destino final, sin extraer antes el
+    paquete completo. Los artefactos van directos a ``cache`` (se omiten los
+    que ya tiene), las wheels a ``CACHE_DIR/bundle/wheels`` y el checkout a
+    ``checkout`` (que no debe existir; se extrae a un directorio temporal y se
+    renombra al terminar).
+
+    Args:
+        bundle (Path): Archivo del paquete.
+        cache (ArtifactCache): Caché de artefactos a sembrar.
+        checkout (Path | None): Destino de los dotfiles; ``None`` los omite.
+
+    Raises:
+        BundleError: Si el paquete está dañado o es de otro formato.
+        OSError, tarfile.TarError: Si no se puede leer o escribir.
+    """
+    wheels = CACHE_DIR / "bundle" / "wheels"
+    staging = checkout.with_name(f".{checkout.name}.bundle") if checkout else None
+    for directory in (wheels, staging):
+        if directory is not None:
+            shutil.rmtree(directory, ignore_errors=True)
+    contents = None
+    by_sha = {}
+    directories = []
+    with tarfile.open(bundle, "r|*") as tar:
+        for member in tar:
+            name = member.name
+            if contents is None:
+                if name != "manifest.json":
+                    raise BundleError(f"'{bundle}' no empieza por manifest.json.")
+                manifest = json.load(tar.extractfile(member))
+                if manifest.get("format") != BUNDLE_FORMAT:
+                    raise BundleError(f"Formato de paquete desconocido en '{bundle}'.")
+                contents = BundleContents(manifest)
+                for url, sha256 in manifest["artifacts"].items():
+                    by_sha.setdefault(sha256, []).append(url)
+                continue
+            if name.startswith("/") or ".." in Path(name).parts:
+                raise BundleError(f"Ruta no permitida en el paquete: '{name}'.")
+            section, _, relative = name.partition("/")
+            expected = contents.manifest["members"].get(name)
+            if member.isfile() and expected is None:
+                raise BundleError(f"'{name}' no está en el manifiesto.")
+
+            match section:
+                case "artifacts":
+                    urls = by_sha.get(relative, [])
+                    if not urls:
+                        continue
+                    if cache._object_path(relative).exists():
+                        for url in urls:
+                            cache._update_entry(url, sha256=relative)
+                        contents.reused += 1
+                        continue
+                    reader = _HashingReader(tar.extractfile(member))
+                    cache.put(urls[0], reader, relative)
+                    reader.check(name, expected)
+                    for url in urls[1:]:
+                        cache._update_entry(url, sha256=relative)
+                    contents.artifacts += 1
+                case "wheels":
+                    wheels.mkdir(parents=True, exist_ok=True)
+                    target = wheels / relative
+                    with open(target, "wb") as f:
+                        reader = _HashingReader(tar.extractfile(member))
+                        shutil.copyfileobj(reader, f, ArtifactCache.CHUNK)
+                    reader.check(name, expected)
+                    contents.wheels = wheels
+                case "dotfiles" if staging is not None:
+                    target = staging / relative
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    if member.isdir():
+                        target.mkdir(exist_ok=True)
+                        directories.append((target, member.mode))
+                    elif member.issym():
+                        target.symlink_to(member.linkname)
+                    elif member.isfile():
+                        with open(target, "wb") as f:
+                            reader = _HashingReader(tar.extractfile(member))
+                            shutil.copyfileobj(reader, f, ArtifactCache.CHUNK)
+                        reader.check(name, expected)
+                        target.chmod(member.mode & 0o777)
+    if contents is None:
+        raise BundleError(f"'{bundle}' está vacío.")
+    for directory, mode in directories:
+        directory.chmod(mode & 0o777)
+    if staging is not None:
+        os.replace(staging, checkout)
+        contents.checkout = checkout
+    return contents
+
+
+@dataclass
+class UpgradeReport:
+    """Resultado de :func:`system_upgrade`.
+
+    Attributes:
+        status (str): ``"upgraded"``, ``"current"`` (nada que actualizar),
+            ``"skipped"`` (la política no lo permite aún) o ``"failed"``.
+        reason (str): Explicación para los estados ``skipped``/``failed``.
+        duration (float): Segundos de reloj de la transacción.
+        downloaded (str): Lo que dnf dice haber descargado (su línea
+            ``Total``), sin el tráfico de otros roles en paralelo.
+        download_size (str): Tamaño de descarga que anunció dnf.
+    """
+
+    status: str
+    reason: str = ""
+    duration: float = 0.0
+    downloaded: str = ""
+    download_size: str = ""
+
+
+# Línea de totales tras la descarga: "Total  9.3 MB/s | 120 MB  00:12" (dnf4)
+# o "[12/12] Total  100% | 10.1 MiB/s | 120.3 MiB | 00m12s" (dnf5).
+_DNF_DOWNLOADED = re.compile(
+    r"^\s*(?:\[\s*\d+/\d+\]\s+)?Total\s.*?\|\s*([\d.]+\s*[kKMGT]?i?B)\s*\|?\s*\d",
+    re.MULTILINE,
+)
+
+
+def load_upgrade_stamp() -> dict:
+    try:
+        with open(UPGRADE_STAMP, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def upgrade_due(policy: dict, stamp: dict | None = None) -> bool:
+    """Indica si la política de ``sentu_install.upgrade`` pide actualizar ya.
+
+    Una actualización completa cubre también a la de solo seguridad, pero no
+    al revés.
+    """
+    mode = policy.get("policy", "full")
+    if mode == "never":
+        return False
+    stamp = load_upgrade_stamp() if stamp is None else stamp
+    if not stamp or (mode == "full" and stamp.get("policy") != "full"):
+        return True
+    interval = float(policy.get("interval_hours", 0)) * 3600
+    return time.time() - stamp.get("finished", 0) >= interval
+
+
+def system_upgrade(policy: dict, force: bool = False) -> UpgradeReport:
+    """Actualiza el sistema con dnf según la política configurada.
+
+    ``policy`` es ``sentu_install.upgrade``: ``policy`` (``full``,
+    ``security`` o ``never``) e ``interval_hours`` (como mucho una vez cada
+    tantas horas). La hora de la última actualización correcta se guarda en
+    :data:`UPGRADE_STAMP`. La salida de dnf se muestra mientras avanza.
+
+    Args:
+        policy (dict): Política de actualización.
+        force (bool): Actualiza aunque el intervalo no haya pasado.
+
+    Returns:
+        UpgradeReport: Qué se hizo, cuánto tardó y cuánto se transfirió.
+    """
+    mode = policy.get("policy", "full")
+    if mode not in ("full", "security", "never"):
+        return UpgradeReport("failed", f"política desconocida: {mode}")
+    stamp = load_upgrade_stamp()
+    if mode == "never":
+        return UpgradeReport("skipped", "la política es 'never'")
+    if not force and not upgrade_due(policy, stamp):
+        hours = (time.time() - stamp.get("finished", 0)) / 3600
+        return UpgradeReport(
+            "skipped",
+            f"última actualización hace {hours:.1f} h "
+            f"(intervalo {policy.get('interval_hours', 0)} h)",
+        )
+
+    command = ["dnf", "upgrade", "-y", *dnf_metadata_options()]
+    if mode == "security":
+        command.append("--security")
+    if os.geteuid() != 0:
+        # sudo limpia el entorno: el idioma de la salida se fija tras él.
+        command = ["sudo", "env", "LC_ALL=C", *command]
+    start = time.perf_counter()
+    output = []
+    try:
+        with subprocess.Popen(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            env=c_locale_env(),
+        ) as process:
+            for line in process.stdout:
+                print(line, end="", flush=True)
+                output.append(line)
+    except OSError as e:
+        return UpgradeReport("failed", str(e))
+    duration = time.perf_counter() - start
+    text = "".join(output)
+    downloaded = _DNF_DOWNLOADED.findall(text)
+    downloaded = downloaded[-1] if downloaded else ""
+    if process.returncode != 0:
+        return UpgradeReport(
+            "failed",
+            f"dnf terminó con código {process.returncode}",
+            duration,
+            downloaded,
+        )
+
+    mark_dnf_metadata_fresh()
+    size = re.search(
+        r"Total download size: (.+)|Total size of inbound packages is (\S+ \S+)", text
+    )
+    try:
+        UPGRADE_STAMP.parent.mkdir(parents=True, exist_ok=True)
+        UPGRADE_STAMP.write_text(
+            json.dumps({"finished": time.time(), "policy": mode, "duration": duration}),
+            encoding="utf-8",
+        )
+    except OSError as e:
+        error(f"No se pudo guardar {UPGRADE_STAMP}: {e}")
+    return UpgradeReport(
+        "current" if "Nothing to do" in text else "upgraded",
+        duration=duration,
+        downloaded=downloaded,
+        download_size=next((g for g in size.groups() if g), "") if size else "",
+    )
+
+
+@dataclass
+class RoleResult:
+    """Resultado de un role ejecutado por :func:`schedule_roles`.
+
+    Attributes:
+        role (str): Nombre del role.
+        status (str): ``"ok"``, ``"failed"`` o ``"skipped"`` (falló una
+            dependencia).
+        duration (float): Segundos de reloj.
+        output (str): Salida combinada del role.
+    """
+
+    role: str
+    status: str
+    duration: float = 0.0
+    output: str = ""
+
+
+def schedule_roles(
+    roles: list,
+    run_role,
+    depends_on: dict | None = None,
+    exclusive: set | None = None,
+    max_workers: int = 4,
+    on_result=None,
+) -> dict:
+    """Ejecuta ``roles`` en paralelo respetando dependencias y exclusiones.
+
+    Un role arranca cuando todas sus dependencias presentes en ``roles``
+    terminaron sin fallar (``run_role`` o ``on_result`` pueden marcar otros
+    estados, como ``"present"``); las que no están en ``roles`` se consideran
+    ya convergidas. Nunca hay dos roles de ``exclusive`` a la vez (p. ej. los que
+    usan dnf). Ante varios roles listos se respeta el orden de ``roles``.
+
+    Args:
+        roles (list): Roles a ejecutar, en orden del playbook.
+        run_role (callable): ``run_role(role) -> (bool, str)`` con éxito y salida;
+            si lanza una excepción el role cuenta como fallido.
+        depends_on (dict | None): ``{role: [dependencias]}``.
+        exclusive (set | None): Roles que no pueden solaparse entre sí.
+        max_workers (int): Máximo de roles simultáneos.
+        on_result (callable | None): Recibe cada :class:`RoleResult` al terminar.
+
+    Returns:
+        dict: ``{role: RoleResult}``.
+
+    Raises:
+        ValueError: Si las dependencias forman un ciclo.
+    """
+    exclusive = exclusive or set()
+    deps = {
+        role: [d for d in (depends_on or {}).get(role, []) if d in roles]
+        for role in roles
+    }
+    _check_acyclic(deps)
+
+    def timed(role):
+        start = time.perf_counter()
+        try:
+            ok, output = run_role(role)
+        except Exception as e:
+            # Un error inesperado falla solo este role (y omite los que
+            # dependen de él); el resto de la planificación sigue.
+            ok, output = False, f"{type(e).__name__}: {e}\n"
+        return RoleResult(
+            role, "ok" if ok else "failed", time.perf_counter() - start, output
+        )
+
+    results, pending, running = {}, list(roles), {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        while pending or running:
+            for role in list(pending):
+                if any(
+                    d in results and results[d].status in ("failed", "skipped")
+                    for d in deps[role]
+                ):
+                    pending.remove(role)
+                    results[role] = RoleResult(role, "skipped")
+                    if on_result is not None:
+                        on_result(results[role])
+            for role in list(pending):
+                if len(running) >= max(1, max_workers):
+                    break
+                if any(d not in results for d in deps[role]):
+                    continue
+                if role in exclusive and any(r in exclusive for r in running.values()):
+                    continue
+                pending.remove(role)
+                running[pool.submit(timed, role)] = role
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                role = running.pop(future)
+                results[role] = future.result()
+                if on_result is not None:
+                    on_result(results[role])
+    return {role: results[role] for role in roles}
+
+
+def render_vars(text: str, variables: dict) -> str:
+    """Sustituye referencias simples ``{{ nombre }}`` (sin filtros) por su valor.
+
+    Permite usar desde la línea de comandos los textos de
+    ``installer_config.yaml`` que Ansible plantilla normalmente.
+    """
+    return re.sub(
+        r"\{\{\s*(\w+)\s*\}\}",
+        lambda m: str(variables.get(m.group(1), m.group(0))),
+        text,
+    )
+
+
+def _user_context(user: str | None) -> dict:
+    """Credenciales y entorno para ejecutar como ``user`` (o el usuario actual)."""
+    entry = pwd.getpwnam(user) if user else pwd.getpwuid(os.getuid())
+    # Para el propio usuario del proceso se respeta HOME (p. ej. un HOME
+    # temporal en los benchmarks).
+    home = entry.pw_dir
+    if entry.pw_uid == os.getuid():
+        home = os.environ.get("HOME", home)
+    return {
+        "name": entry.pw_name,
+        "uid": entry.pw_uid,
+        "gid": entry.pw_gid,
+        "home": home,
+        "groups": os.getgrouplist(entry.pw_name, entry.pw_gid),
+    }
+
+
+def run_post_install(
+    commands: list,
+    user: str | None = None,
+    max_workers: int = 3,
+    on_result=None,
+) -> dict:
+    """Ejecuta los comandos de post-instalación de forma idempotente y paralela.
+
+    Cada entrada con ``probe`` se omite si la sonda termina con 0. Las
+    entradas se planifican con :func:`schedule_roles` según ``depends_on`` y
+    ``package_lock``. Las que llevan ``become: false`` se ejecutan como
+    ``user`` con su ``HOME``; el resto como root (o con ``sudo`` si el proceso
+    no es root). ``CARGO_TARGET_DIR`` y ``GOCACHE`` apuntan a una caché de
+    compilación persistente.
+
+    Args:
+        commands (list): Entradas de ``install_post_install_commands``.
+        user (str | None): Usuario final; por defecto el del proceso.
+        max_workers (int): Comandos simultáneos.
+        on_result (callable | None): Recibe cada :class:`RoleResult`.
+
+    Returns:
+        dict: ``{nombre: RoleResult}``; ``status`` es ``"ok"`` (ejecutado),
+        ``"present"`` (omitido por la sonda), ``"failed"`` o ``"skipped"``.
+    """
+    target = _user_context(user)
+    is_root = os.geteuid() == 0
+    entries = {entry.get("name") or entry["command"]: entry for entry in commands}
+    probed = set()
+
+    def environment(as_user: bool) -> dict:
+        home = target["home"] if as_user else os.environ.get("HOME", "/root")
+        build_cache = Path(home) / ".cache" / "sentu" / "build"
+        return {
+            **os.environ,
+            "HOME": home,
+            "SENTU_USER": target["name"],
+            "SENTU_ARTIFACT_CACHE": str(ARTIFACT_CACHE_DIR),
+            "CARGO_TARGET_DIR": str(build_cache / "cargo-target"),
+            "GOCACHE": str(build_cache / "go"),
+            **({"USER": target["name"], "LOGNAME": target["name"]} if as_user else {}),
+        }
+
+    def shell(command: str, as_user: bool, capture: bool):
+        kwargs = {"env": environment(as_user), "text": True}
+        argv = ["sh", "-c", command]
+        if as_user and is_root and target["uid"] != 0:
+            kwargs.update(
+                user=target["uid"],
+                group=target["gid"],
+                extra_groups=target["groups"],
+                cwd=target["home"],
+            )
+        elif not as_user and not is_root:
+            argv = [
+                "sudo",
+                "--preserve-env=SENTU_USER,SENTU_ARTIFACT_CACHE,SENTU_OFFLINE",
+                *argv,
+            ]
+        if capture:
+            kwargs.update(stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        else:
+            kwargs.update(stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return subprocess.run(argv, **kwargs)
+
+    def run_entry(name):
+        entry = entries[name]
+        as_user = entry.get("become", True) is False
+        if entry.get("probe") and shell(entry["probe"], as_user, False).returncode == 0:
+            probed.add(name)
+            return True, ""
+        result = shell(entry["command"], as_user, True)
+        return result.returncode == 0, result.stdout
+
+    def report(result: RoleResult):
+        if result.role in probed:
+            result.status = "present"
+        if on_result is not None:
+            on_result(result)
+
+    return schedule_roles(
+        list(entries),
+        run_entry,
+        depends_on={n: e.get("depends_on", []) for n, e in entries.items()},
+        exclusive={n for n, e in entries.items() if e.get("package_lock")},
+        max_workers=max_workers,
+        on_result=report,
+    )
+
+
+def _check_acyclic(deps: dict):
+    visiting, visited = set(), set()
+
+    def visit(role, chain):
+        if role in visited:
+            return
+        if role in visiting:
+            raise ValueError(f"Ciclo de dependencias: {' -> '.join(chain + [role])}")
+        visiting.add(role)
+        for dep in deps.get(role, []):
+            visit(dep, chain + [role])
+        visiting.discard(role)
+        visited.add(role)
+
+    for role in deps:
+        visit(role, [])
+
+
+class NativeUnsupported(Exception):
+    """El playbook usa algo fuera del subconjunto que ejecuta :class:`NativePlaybook`."""
+
+
+class TemplateError(ValueError):
+    """Expresión Jinja mal formada o que usa un valor indefinido."""
+
+
+class _Undefined:
+    """Variable inexistente (o que no se pudo plantillar).
+
+    Solo admite ``is defined`` y el filtro ``default``; cualquier otro uso
+    lanza :class:`TemplateError`, igual que las variables indefinidas
+    estrictas de Ansible.
+    """
+
+    def __init__(self, message: str):
+        self.message = message
+
+    def _fail(self, *args):
+        raise TemplateError(self.message)
+
+    __str__ = __iter__ = __len__ = __bool__ = _fail
+
+
+_JINJA_TOKEN = re.compile(
+    r"""\s*(?:(?P<num>\d+(?:\.\d+)?)|(?P<name>[A-Za-z_]\w*)"""
+    r"""|(?P<str>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")"""
+    r"""|(?P<op>==|!=|<=|>=|//|[-+*/%~|.,:()\[\]{}<>=]))"""
+)
+_JINJA_BLOCK = re.compile(r"\{\{(.*?)\}\}", re.DOTALL)
+
+
+class _ExpressionParser:
+    """Analizador descendente del subconjunto de expresiones Jinja del playbook.
+
+    Produce tuplas ``(tipo, ...)`` que evalúa :func:`_evaluate`. La precedencia
+    sigue a Jinja: los filtros (``|``) y tests (``is``) se aplican sobre el
+    operando más cercano.
+    """
+
+    def __init__(self, expression: str):
+        self.tokens = []
+        pos, expression = 0, expression.strip()
+        while pos < len(expression):
+            match = _JINJA_TOKEN.match(expression, pos)
+            if not match or match.end() == pos:
+                raise TemplateError(f"Expresión no válida: {expression!r}")
+            self.tokens.append((match.lastgroup, match.group(match.lastgroup)))
+            pos = match.end()
+        self.tokens.append(("end", None))
+        self.pos = 0
+        self.source = expression
+
+    def parse(self):
+        node = self.expression()
+        if self.tokens[self.pos][0] != "end":
+            raise TemplateError(f"Expresión no válida: {self.source!r}")
+        return node
+
+    def take(self, kind: str, value: str | None = None):
+        token = self.tokens[self.pos]
+        if token[0] == kind and (value is None or token[1] == value):
+            self.pos += 1
+            return token
+        return None
+
+    def expect(self, kind: str, value: str | None = None):
+        token = self.take(kind, value)
+        if token is None:
+            raise TemplateError(
+                f"Se esperaba {value or kind} en {self.source!r} "
+                f"(encontrado {self.tokens[self.pos][1]!r})"
+            )
+        return token
+
+    def expression(self):
+        node = self.binary(0)
+        if self.take("name", "if"):
+            test = self.binary(0)
+            other = self.expression() if self.take("name", "else") else ("const", "")
+            node = ("cond", test, node, other)
+        return node
+
+    _LEVELS = (
+        ("name", ("or",)),
+        ("name", ("and",)),
+        None,  # not
+        ("op", ("==", "!=", "<", ">", "<=", ">=")),
+        ("op", ("~",)),
+        ("op", ("+", "-")),
+        ("op", ("*", "/", "//", "%")),
+    )
+
+    def binary(self, level: int):
+        if level == len(self._LEVELS):
+            return self.unary()
+        if self._LEVELS[level] is None:
+            if self.take("name", "not"):
+                return ("not", self.binary(level))
+            return self.binary(level + 1)
+        kind, ops = self._LEVELS[level]
+        node = self.binary(level + 1)
+        while True:
+            token = self.tokens[self.pos]
+            if token[0] == kind and token[1] in ops:
+                self.pos += 1
+                node = ("binop", token[1], node, self.binary(level + 1))
+            elif level == 3 and token == ("name", "in"):
+                self.pos += 1
+                node = ("binop", "in", node, self.binary(level + 1))
+            elif (
+                level == 3
+                and token == ("name", "not")
+                and (self.tokens[self.pos + 1] == ("name", "in"))
+            ):
+                self.pos += 2
+                node = ("not", ("binop", "in", node, self.binary(level + 1)))
+            elif level == 3 and self.take("name", "is"):
+                negate = bool(self.take("name", "not"))
+                node = ("test", node, self.expect("name")[1], negate)
+            else:
+                return node
+
+    def unary(self):
+        if self.take("op", "-"):
+            return ("neg", self.unary())
+        node = self.postfix()
+        while self.take("op", "|"):
+            name = self.expect("name")[1]
+            args, kwargs = self.arguments() if self.take("op", "(") else ([], {})
+            node = ("filter", node, name, args, kwargs)
+        return node
+
+    def postfix(self):
+        node = self.primary()
+        while True:
+            if self.take("op", "."):
+                if token := self.take("num"):
+                    node = ("item", node, ("const", int(token[1])))
+                else:
+                    node = ("item", node, ("const", self.expect("name")[1]))
+            elif self.take("op", "["):
+                node = ("item", node, self.expression())
+                self.expect("op", "]")
+            elif self.take("op", "("):
+                node = ("call", node, *self.arguments())
+            else:
+                return node
+
+    def arguments(self):
+        args, kwargs = [], {}
+        while not self.take("op", ")"):
+            if self.tokens[self.pos][0] == "name" and self.tokens[self.pos + 1] == (
+                "op",
+                "=",
+            ):
+                name = self.tokens[self.pos][1]
+                self.pos += 2
+                kwargs[name] = self.expression()
+            else:
+                args.append(self.expression())
+            if not self.take("op", ","):
+                self.expect("op", ")")
+                break
+        return args, kwargs
+
+    def primary(self):
+        if token := self.take("num"):
+            return ("const", float(token[1]) if "." in token[1] else int(token[1]))
+        if token := self.take("str"):
+            return ("const", ast.literal_eval(token[1]))
+        if token := self.take("name"):
+            constants = {"true": True, "false": False, "none": None}
+            if token[1].lower() in constants:
+                return ("const", constants[token[1].lower()])
+            return ("var", token[1])
+        if self.take("op", "("):
+            node = self.expression()
+            self.expect("op", ")")
+            return node
+        if self.take("op", "["):
+            items = []
+            while not self.take("op", "]"):
+                items.append(self.expression())
+                if not self.take("op", ","):
+                    self.expect("op", "]")
+                    break
+            return ("list", items)
+        if self.take("op", "{"):
+            keys, values = [], []
+            while not self.take("op", "}"):
+                keys.append(self.expression())
+                self.expect("op", ":")
+                values.append(self.expression())
+                if not self.take("op", ","):
+                    self.expect("op", "}")
+                    break
+            return ("dict", keys, values)
+        raise TemplateError(f"Expresión no válida: {self.source!r}")
+
+
+@functools.lru_cache(maxsize=None)
+def compile_expression(expression: str):
+    """Analiza una expresión Jinja (sin ``{{ }}``) y devuelve su árbol."""
+    return _ExpressionParser(expression).parse()
+
+
+@functools.lru_cache(maxsize=None)
+def _compile_template(text: str) -> tuple:
+    """Separa ``text`` en literales y expresiones ya compiladas."""
+    if "{%" in text or "{#" in text:
+        raise TemplateError(f"Bloques Jinja no soportados: {text!r}")
+    parts, last = [], 0
+    for match in _JINJA_BLOCK.finditer(text):
+        if match.start() > last:
+            parts.append(text[last : match.start()])
+        parts.append(compile_expression(match.group(1)))
+        last = match.end()
+    if last < len(text):
+        parts.append(text[last:])
+    return tuple(parts)
+
+
+def _text(value) -> str:
+    if isinstance(value, bool):
+        return str(value)
+    return str(value) if value is not None else ""
+
+
+def _to_bool(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ("yes", "on", "1", "true", "y")
+    return bool(value)
+
+
+def _to_json(value) -> str:
+    def fail(obj):
+        if isinstance(obj, _Undefined):
+            obj._fail()
+        raise TemplateError(f"No se puede serializar {type(obj).__name__}")
+
+    return json.dumps(value, ensure_ascii=False, default=fail)
+
+
+def _lookup_plugin(kind: str, *terms, wantlist: bool = False, **options):
+    match kind:
+        case "env":
+            values = [
+                os.environ.get(term, options.get("default", "")) for term in terms
+            ]
+        case "fileglob":
+            values = sorted(
+                path
+                for term in terms
+                for path in glob.glob(os.path.expanduser(term))
+                if os.path.isfile(path)
+            )
+        case "file":
+            values = [
+                Path(os.path.expanduser(term)).read_text(encoding="utf-8").rstrip("\n")
+                for term in terms
+            ]
+        case _:
+            raise TemplateError(f"lookup '{kind}' no soportado")
+    return values if wantlist else ",".join(_text(v) for v in values)
+
+
+_FILTERS = {
+    "default": lambda value, default="", boolean=False: (
+        default if isinstance(value, _Undefined) or (boolean and not value) else value
+    ),
+    "dict2items": lambda value: [{"key": k, "value": v} for k, v in value.items()],
+    "items2dict": lambda value: {item["key"]: item["value"] for item in value},
+    "to_json": _to_json,
+    "from_json": json.loads,
+    "bool": _to_bool,
+    "int": lambda value, default=0: int(value) if str(value).strip() else default,
+    "string": _text,
+    "lower": lambda value: _text(value).lower(),
+    "upper": lambda value: _text(value).upper(),
+    "trim": lambda value: _text(value).strip(),
+    "replace": lambda value, old, new: _text(value).replace(old, new),
+    "length": len,
+    "list": list,
+    "join": lambda value, separator="": separator.join(_text(v) for v in value),
+    "first": lambda value: next(iter(value)),
+    "last": lambda value: list(value)[-1],
+    "basename": lambda value: os.path.basename(_text(value)),
+    "dirname": lambda value: os.path.dirname(_text(value)),
+    "expanduser": lambda value: os.path.expanduser(_text(value)),
+}
+_FILTERS["d"] = _FILTERS["default"]
+
+_TESTS = {
+    "defined": lambda value: not isinstance(value, _Undefined),
+    "undefined": lambda value: isinstance(value, _Undefined),
+    "none": lambda value: value is None,
+    "string": lambda value: isinstance(value, str),
+    "number": lambda value: isinstance(value, (int, float)),
+    "mapping": lambda value: isinstance(value, dict),
+}
+
+_GLOBALS = {
+    "lookup": _lookup_plugin,
+    "query": lambda kind, *terms, **options: _lookup_plugin(
+        kind, *terms, **{**options, "wantlist": True}
+    ),
+}
+_GLOBALS["q"] = _GLOBALS["query"]
+
+_BINARY_OPS = {
+    "+": lambda a, b: a + b,
+    "-": lambda a, b: a - b,
+    "*": lambda a, b: a * b,
+    "/": lambda a, b: a / b,
+    "//": lambda a, b: a // b,
+    "%": lambda a, b: a % b,
+    "~": lambda a, b: _text(a) + _text(b),
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    ">": lambda a, b: a > b,
+    "<=": lambda a, b: a <= b,
+    ">=": lambda a, b: a >= b,
+    "in": lambda a, b: a in b,
+}
+
+
+def _check_expression(node):
+    """Comprueba que el árbol solo use filtros, tests y lookups soportados."""
+    if not isinstance(node, tuple):
+        return
+    match node[0]:
+        case "filter" if node[2] not in _FILTERS:
+            raise NativeUnsupported(f"filtro '{node[2]}' no soportado")
+        case "test" if node[2] not in _TESTS:
+            raise NativeUnsupported(f"test '{node[2]}' no soportado")
+        case "call" if node[1][0] == "var" and node[1][1] in _GLOBALS:
+            kind = node[2][0] if node[2] else None
+            if (
+                not kind
+                or kind[0] != "const"
+                or kind[1] not in ("env", "fileglob", "file")
+            ):
+                raise NativeUnsupported("lookup no soportado")
+    for child in node[1:]:
+        if isinstance(child, tuple):
+            _check_expression(child)
+        elif isinstance(child, list):
+            for item in child:
+                _check_expression(item)
+        elif isinstance(child, dict):
+            for item in child.values():
+                _check_expression(item)
+
+
+def _evaluate(node, scope):
+    kind = node[0]
+    if kind == "const":
+        return node[1]
+    if kind == "var":
+        value = scope.lookup(node[1])
+        if isinstance(value, _Undefined) and node[1] in _GLOBALS:
+            return _GLOBALS[node[1]]
+        return value
+    if kind == "item":
+        value, key = _evaluate(node[1], scope), _evaluate(node[2], scope)
+        if isinstance(value, _Undefined):
+            return _Undefined(value.message)
+        if isinstance(value, dict) or isinstance(key, int):
+            try:
+                return value[key]
+            except (KeyError, IndexError, TypeError):
+                pass
+        if isinstance(key, str) and not key.startswith("_") and hasattr(value, key):
+            return getattr(value, key)
+        return _Undefined(f"'{key}' no está definida")
+    if kind == "call":
+        function = _evaluate(node[1], scope)
+        if not callable(function):
+            raise TemplateError(f"{function!r} no es invocable")
+        args = [_evaluate(arg, scope) for arg in node[2]]
+        kwargs = {key: _evaluate(arg, scope) for key, arg in node[3].items()}
+        return function(*args, **kwargs)
+    if kind == "filter":
+        value = _evaluate(node[1], scope)
+        if isinstance(value, _Undefined) and node[2] not in ("default", "d"):
+            value._fail()
+        args = [_evaluate(arg, scope) for arg in node[3]]
+        kwargs = {key: _evaluate(arg, scope) for key, arg in node[4].items()}
+        return _FILTERS[node[2]](value, *args, **kwargs)
+    if kind == "test":
+        return _TESTS[node[2]](_evaluate(node[1], scope)) != node[3]
+    if kind == "binop":
+        left = _evaluate(node[2], scope)
+        if node[1] == "and":
+            return _evaluate(node[3], scope) if left else left
+        if node[1] == "or":
+            return left if left else _evaluate(node[3], scope)
+        right = _evaluate(node[3], scope)
+        for operand in (left, right):
+            if isinstance(operand, _Undefined):
+                operand._fail()
+        return _BINARY_OPS[node[1]](left, right)
+    if kind == "not":
+        return not _evaluate(node[1], scope)
+    if kind == "neg":
+        return -_evaluate(node[1], scope)
+    if kind == "cond":
+        branch = node[2] if _evaluate(node[1], scope) else node[3]
+        return _evaluate(branch, scope)
+    if kind == "list":
+        return [_evaluate(item, scope) for item in node[1]]
+    if kind == "dict":
+        return {
+            _evaluate(k, scope): _evaluate(v, scope) for k, v in zip(node[1], node[2])
+        }
+    raise TemplateError(f"Nodo desconocido: {kind}")
+
+
+class _Scope:
+    """Capas de variables con la precedencia de Ansible, de mayor a menor.
+
+    Cada capa es ``(dict, lazy)``; en las ``lazy`` (vars del play, vars_files,
+    extra vars) los valores se plantillan al leerlos, como hace Ansible. Los
+    hechos, ``set_fact`` y los resultados registrados ya son valores finales.
+    """
+
+    def __init__(self, layers: list):
+        self.layers = layers
+        self._resolving = set()
+
+    def child(self, variables: dict, lazy: bool = False) -> "_Scope":
+        return _Scope([(variables, lazy), *self.layers])
+
+    def lookup(self, name: str):
+        for variables, lazy in self.layers:
+            if name not in variables:
+                continue
+            if not lazy:
+                return variables[name]
+            if name in self._resolving:
+                raise TemplateError(f"Definición recursiva de '{name}'")
+            self._resolving.add(name)
+            try:
+                return self.template(variables[name], strict=False)
+            finally:
+                self._resolving.discard(name)
+        return _Undefined(f"'{name}' no está definida")
+
+    def evaluate(self, expression):
+        """Evalúa una condición (``when``, ``changed_when``...) como booleano."""
+        if not isinstance(expression, str):
+            return _to_bool(expression)
+        expression = expression.strip()
+        if expression.startswith("{{") and expression.endswith("}}"):
+            expression = expression[2:-2]
+        return _to_bool(self._run(compile_expression(expression)))
+
+    def template(self, value, strict: bool = True):
+        """Plantilla ``value`` recursivamente.
+
+        Una cadena que es solo ``{{ expr }}`` conserva el tipo del resultado
+        (listas, diccionarios...). Con ``strict=False`` las hojas que no se
+        pueden plantillar quedan como indefinidas en lugar de fallar, de modo
+        que solo falla quien llegue a usarlas.
+        """
+        if isinstance(value, dict):
+            return {k: self.template(v, strict) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self.template(v, strict) for v in value]
+        if not isinstance(value, str) or "{" not in value:
+            return value
+        try:
+            parts = _compile_template(value)
+            if len(parts) == 1 and isinstance(parts[0], tuple):
+                return self._run(parts[0])
+            return "".join(
+                _text(self._run(part)) if isinstance(part, tuple) else part
+                for part in parts
+            )
+        except TemplateError as e:
+            if strict:
+                raise
+            return _Undefined(str(e))
+
+    def _run(self, node):
+        try:
+            return _evaluate(node, self)
+        except TemplateError:
+            raise
+        except (TypeError, ValueError, KeyError, IndexError, OSError) as e:
+            raise TemplateError(str(e)) from e
+
+
+@dataclass
+class NativeTask:
+    """Tarea de un role, validada para :class:`NativePlaybook`.
+
+    Attributes:
+        role (str): Role al que pertenece.
+        name (str): Nombre (sin plantillar) de la tarea.
+        module (str): Módulo sin prefijo (``command``, ``dnf``...).
+        args (object): Argumentos del módulo (dict o texto libre).
+        options (dict): Palabras clave de la tarea (``when``, ``loop``...).
+    """
+
+    role: str
+    name: str
+    module: str
+    args: object
+    options: dict
+
+
+_PLAY_KEYWORDS = {
+    "name",
+    "hosts",
+    "connection",
+    "become",
+    "gather_facts",
+    "gather_subset",
+    "fact_path",
+    "vars_files",
+    "environment",
+    "vars",
+    "roles",
+}
+_TASK_KEYWORDS = {
+    "name",
+    "when",
+    "loop",
+    "loop_control",
+    "register",
+    "become",
+    "changed_when",
+    "failed_when",
+    "ignore_errors",
+    "environment",
+    "vars",
+    "tags",
+    "no_log",
+}
+# Módulos que se ejecutan dentro del propio proceso (con el usuario actual).
+_IN_PROCESS_MODULES = {"set_fact", "debug", "file", "sentu_links"}
+_NATIVE_MODULES = _IN_PROCESS_MODULES | {"command", "shell", "dnf"}
+# Argumentos que implementa cada módulo (None: cualquiera) y los obligatorios;
+# el resto de argumentos y estados hace recurrir a ansible-playbook.
+_MODULE_ARGS = {
+    "command": ({"cmd", "argv", "chdir", "creates", "removes"}, set()),
+    "shell": ({"cmd", "chdir", "creates", "removes", "executable"}, {"cmd"}),
+    "dnf": ({"name", "state"}, {"name"}),
+    "file": ({"path", "state", "src", "mode"}, {"path"}),
+    "set_fact": (None, set()),
+    "debug": ({"msg", "var", "verbosity"}, set()),
+    "sentu_links": ({"repo", "home", "profile"}, {"repo", "home"}),
+}
+_MODULE_STATES = {
+    "dnf": {"present", "installed", "absent", "removed", "latest"},
+    "file": {"file", "directory", "absent", "touch", "link"},
+}
+_DISTRIBUTIONS = {
+    "fedora": ("Fedora", "RedHat"),
+    "rhel": ("RedHat", "RedHat"),
+    "centos": ("CentOS", "RedHat"),
+    "ubuntu": ("Ubuntu", "Debian"),
+    "debian": ("Debian", "Debian"),
+    "arch": ("Archlinux", "Archlinux"),
+}
+
+
+def native_facts() -> dict:
+    """Hechos ``ansible_*`` que usan los roles, sacados de la instantánea del equipo.
+
+    Sustituye a ``gather_facts`` en el ejecutor nativo: no se recorre hardware
+    ni red, solo lo que ya conoce :func:`host_snapshot`.
+    """
+    snapshot = host_snapshot()
+    distribution, family = _DISTRIBUTIONS.get(
+        snapshot.distribution,
+        (snapshot.distribution.capitalize(), snapshot.distribution.capitalize()),
+    )
+    local = asdict(snapshot)
+    del local["path_mtimes"], local["executables"]
+    facts = {
+        "distribution": distribution,
+        "distribution_version": snapshot.distribution_version,
+        "distribution_major_version": snapshot.distribution_version.split(".")[0],
+        "os_family": family,
+        "system": snapshot.os_name,
+        "pkg_mgr": snapshot.package_manager or "unknown",
+        "python_version": snapshot.python_version,
+        "user_id": getpass.getuser(),
+        "env": dict(os.environ),
+        "local": {"sentu": local},
+    }
+    return {
+        **{f"ansible_{key}": value for key, value in facts.items()},
+        "ansible_facts": facts,
+        "inventory_hostname": "localhost",
+    }
+
+
+class NativePlaybook:
+    """Ejecuta en proceso el subconjunto de Ansible que usan los roles del repo.
+
+    Lee ``playbook.yml`` y los ``tasks/main.yml`` de sus roles y admite
+    ``when``, ``loop``/``loop_control``, ``register``, ``changed_when``,
+    ``failed_when``, ``become``, ``environment`` y ``vars`` sobre los módulos
+    ``command``, ``shell``, ``dnf``, ``file``, ``set_fact``, ``debug`` y
+    ``sentu_links``. Todo (incluidos los argumentos y estados de cada módulo)
+    se valida al construirlo: si algo queda fuera del subconjunto se lanza
+    :class:`NativeUnsupported` y el instalador recurre a ``ansible-playbook``.
+
+    Las tareas con ``become`` se lanzan con ``sudo -n``, así que la sesión de
+    sudo debe estar abierta (:func:`run_native` la abre una vez).
+
+    Args:
+        ansible_dir (Path): Directorio que contiene ``playbook.yml``.
+        extra_vars (dict | None): Equivalente a ``-e`` de ``ansible-playbook``.
+
+    Raises:
+        NativeUnsupported: Si el playbook no se puede ejecutar de forma nativa.
+    """
+
+    def __init__(self, ansible_dir: Path, extra_vars: dict | None = None):
+        self.ansible_dir = ansible_dir
+        try:
+            plays = load_yaml(ansible_dir / "playbook.yml") or []
+        except (OSError, ValueError) as e:
+            raise NativeUnsupported(f"no se pudo leer el playbook: {e}") from e
+        if len(plays) != 1:
+            raise NativeUnsupported("solo se admite un play")
+        play = plays[0]
+        if unknown := set(play) - _PLAY_KEYWORDS:
+            raise NativeUnsupported(f"claves del play: {', '.join(sorted(unknown))}")
+        if play.get("hosts") not in ("localhost", "127.0.0.1"):
+            raise NativeUnsupported("solo se admite hosts: localhost")
+
+        self.become = _to_bool(play.get("become", False))
+        self.environment = play.get("environment") or {}
+        self.play_vars = play.get("vars") or {}
+        self.vars_files = {}
+        for relpath in play.get("vars_files", []):
+            self.vars_files.update(load_yaml(ansible_dir / relpath) or {})
+        self.extra_vars = extra_vars or {}
+        self.host_vars = {}
+        self.facts = native_facts() if play.get("gather_facts", True) else {}
+        self.facts["playbook_dir"] = str(ansible_dir)
+        self.verbosity = 1  # Como el ``-v`` que pasa run_playbook.
+        self.stats = {"ok": 0, "changed": 0, "skipped": 0, "failed": 0}
+        self._lock = threading.Lock()
+
+        self.roles = {}
+        for entry in play.get("roles", []):
+            if isinstance(entry, dict):
+                if set(entry) - {"role", "tags"}:
+                    raise NativeUnsupported("roles con parámetros")
+                entry = entry["role"]
+            tasks_file = ansible_dir / "roles" / entry / "tasks" / "main.yml"
+            tasks = load_yaml(tasks_file) if tasks_file.exists() else []
+            self.roles[entry] = [self._task(entry, task) for task in tasks or []]
+
+    def _task(self, role: str, entry) -> NativeTask:
+        if not isinstance(entry, dict):
+            raise NativeUnsupported(f"{role}: tarea no válida")
+        name = entry.get("name", "")
+        modules = [key for key in entry if key not in _TASK_KEYWORDS]
+        if len(modules) != 1:
+            raise NativeUnsupported(f"{role}: claves no soportadas en '{name}'")
+        module = (
+            modules[0].removeprefix("ansible.builtin.").removeprefix("ansible.legacy.")
+        )
+        if module not in _NATIVE_MODULES:
+            raise NativeUnsupported(f"{role}: módulo '{module}' no soportado")
+        args = entry[modules[0]]
+        if isinstance(args, str) and module not in ("command", "shell"):
+            raise NativeUnsupported(f"{role}: '{module}' con argumentos en línea")
+        become = _to_bool(entry.get("become", self.become))
+        if become and module in _IN_PROCESS_MODULES - {"set_fact", "debug"}:
+            if os.geteuid() != 0:
+                raise NativeUnsupported(f"{role}: '{module}' con become")
+        self._check_args(role, name, module, args)
+        options = {key: value for key, value in entry.items() if key != modules[0]}
+        options["become"] = become
+
+        try:
+            for value in (name, args, options.get("vars"), options.get("environment")):
+                self._check_templates(value)
+            self._check_templates(options.get("loop"))
+            self._check_templates((options.get("loop_control") or {}).get("label"))
+            for key in ("when", "changed_when", "failed_when"):
+                conditions = options.get(key, [])
+                for condition in (
+                    conditions if isinstance(conditions, list) else [conditions]
+                ):
+                    if isinstance(condition, str):
+                        condition = condition.strip()
+                        if condition.startswith("{{") and condition.endswith("}}"):
+                            condition = condition[2:-2]
+                        _check_expression(compile_expression(condition))
+        except TemplateError as e:
+            raise NativeUnsupported(f"{role}: {e}") from e
+        return NativeTask(role, name, module, args, options)
+
+    def _check_args(self, role: str, name: str, module: str, args):
+        """Rechaza argumentos y estados que el módulo nativo no implementa."""
+        if isinstance(args, str):  # command/shell en forma libre.
+            return
+        if not isinstance(args, dict):
+            if args is None and module == "debug":
+                return
+            raise NativeUnsupported(f"{role}: argumentos no válidos en '{name}'")
+        known, required = _MODULE_ARGS[module]
+        if known is not None and (unknown := set(args) - known):
+            raise NativeUnsupported(
+                f"{role}: '{module}' con {', '.join(sorted(unknown))} en '{name}'"
+            )
+        if missing := required - set(args):
+            raise NativeUnsupported(
+                f"{role}: '{module}' sin {', '.join(sorted(missing))} en '{name}'"
+            )
+        if module == "command" and not {"cmd", "argv"} & set(args):
+            raise NativeUnsupported(f"{role}: 'command' sin cmd ni argv en '{name}'")
+        if module in _MODULE_STATES:
+            state = args.get("state", "present" if module == "dnf" else "file")
+            if not isinstance(state, str) or state not in _MODULE_STATES[module]:
+                raise NativeUnsupported(f"{role}: '{module}' con state={state!r}")
+            everything = args.get("name") in ("*", ["*"])
+            if module == "dnf" and state == "latest" and not everything:
+                raise NativeUnsupported(f"{role}: 'dnf' latest solo con name='*'")
+            if module == "file" and state == "link" and "src" not in args:
+                raise NativeUnsupported(f"{role}: 'file' link sin src en '{name}'")
+
+    def _check_templates(self, value):
+        if isinstance(value, dict):
+            for item in value.values():
+                self._check_templates(item)
+        elif isinstance(value, list):
+            for item in value:
+                self._check_templates(item)
+        elif isinstance(value, str):
+            for part in _compile_template(value):
+                if isinstance(part, tuple):
+                    _check_expression(part)
+
+    def needs_become(self, roles: list) -> bool:
+        """Indica si alguna tarea de ``roles`` necesita privilegios."""
+        return any(
+            task.options["become"] and task.module not in _IN_PROCESS_MODULES
+            for role in roles
+            for task in self.roles.get(role, [])
+        )
+
+    def scope(self, role: str | None = None) -> _Scope:
+        """Variables visibles desde una tarea de ``role``."""
+        role_vars = {}
+        if role is not None:
+            role_vars = {
+                "role_name": role,
+                "role_path": str(self.ansible_dir / "roles" / role),
+            }
+        return _Scope(
+            [
+                (self.extra_vars, True),
+                (self.host_vars, False),
+                (role_vars, False),
+                (self.vars_files, True),
+                (self.play_vars, True),
+                (self.facts, False),
+            ]
+        )
+
+    def run_role(self, role: str, log=print) -> bool:
+        """Ejecuta las tareas de ``role`` en orden.
+
+        Args:
+            role (str): Nombre del role.
+            log (callable): Recibe cada línea de salida.
+
+        Returns:
+            bool: False si alguna tarea falló (sin ``ignore_errors``).
+        """
+        with trace_span(role, "role"):
+            for task in self.roles[role]:
+                if not self._run_task(task, log):
+                    return False
+        return True
+
+    def _run_task(self, task: NativeTask, log) -> bool:
+        scope = self.scope(task.role)
+        if task.options.get("vars"):
+            scope = scope.child(task.options["vars"], lazy=True)
+        try:
+            title = scope.template(task.name)
+        except TemplateError:
+            title = task.name
+        log(f"TASK [{task.role} : {title}]")
+        with trace_span(f"{task.role} : {title}", "task", module=task.module):
+            return self._run_task_items(task, scope, log)
+
+    def _run_task_items(self, task: NativeTask, scope: _Scope, log) -> bool:
+        loop_control = task.options.get("loop_control") or {}
+        loop_var = loop_control.get("loop_var", "item")
+        results = []
+        try:
+            items = (
+                scope.template(task.options["loop"])
+                if "loop" in task.options
+                else [None]
+            )
+            if not isinstance(items, list):
+                raise TemplateError("'loop' debe ser una lista")
+        except TemplateError as e:
+            items, results = [], [{"failed": True, "msg": str(e)}]
+            log(f"fatal: [localhost]: FAILED! => {e}")
+
+        for index, item in enumerate(items):
+            item_scope = scope
+            label = ""
+            if "loop" in task.options:
+                layer = {loop_var: item}
+                if "index_var" in loop_control:
+                    layer[loop_control["index_var"]] = index
+                item_scope = scope.child(layer)
+                label = loop_control.get("label", item)
+                try:
+                    label = item_scope.template(label)
+                except TemplateError:
+                    pass
+                if isinstance(label, dict) and "key" in label:
+                    label = label["key"]
+            result = self._run_item(task, item_scope)
+            results.append(result)
+            self._log_result(log, result, label)
+
+        if "loop" in task.options:
+            outcome = {
+                "results": results,
+                "changed": any(r.get("changed") for r in results),
+                "failed": any(r.get("failed") for r in results),
+                "skipped": bool(results) and all(r.get("skipped") for r in results),
+                "msg": "All items completed",
+            }
+        else:
+            outcome = results[0]
+        if task.options.get("register"):
+            self.host_vars[task.options["register"]] = outcome
+
+        ignore = _to_bool(task.options.get("ignore_errors", False))
+        status = (
+            "failed"
+            if outcome.get("failed") and not ignore
+            else "skipped"
+            if outcome.get("skipped")
+            else "changed"
+            if outcome.get("changed")
+            else "ok"
+        )
+        with self._lock:
+            self.stats[status] += 1
+        return status != "failed"
+
+    def _run_item(self, task: NativeTask, scope: _Scope) -> dict:
+        try:
+            conditions = task.options.get("when", [])
+            for condition in (
+                conditions if isinstance(conditions, list) else [conditions]
+            ):
+                if not scope.evaluate(condition):
+                    return {
+                        "changed": False,
+                        "skipped": True,
+                        "skip_reason": "Conditional result was False",
+                    }
+            environment = {
+                **scope.template(self.environment),
+                **scope.template(task.options.get("environment") or {}),
+            }
+            result = self._execute(task, scope, environment)
+            register = task.options.get("register")
+            checks = scope.child({register: result}) if register else scope
+            if "changed_when" in task.options:
+                result["changed"] = checks.evaluate(task.options["changed_when"])
+            if "failed_when" in task.options:
+                result["failed"] = checks.evaluate(task.options["failed_when"])
+        except TemplateError as e:
+            return {"failed": True, "msg": str(e)}
+        except NativeUnsupported as e:
+            return {"failed": True, "msg": f"No soportado: {e}"}
+        except OSError as e:
+            return {"failed": True, "msg": str(e)}
+        return result
+
+    def _log_result(self, log, result: dict, label):
+        suffix = f" => (item={label})" if label != "" else ""
+        if result.get("skipped"):
+            log(f"skipping: [localhost]{suffix}")
+            return
+        if result.get("failed"):
+            if label != "":
+                log(f"failed: [localhost] (item={label}) => {result.get('msg', '')}")
+            else:
+                log(f"fatal: [localhost]: FAILED! => {result.get('msg', '')}")
+            for line in result.get("stderr", "").splitlines():
+                log(f"    {line}")
+        else:
+            log(f"{'changed' if result.get('changed') else 'ok'}: [localhost]{suffix}")
+        if "debug" in result:
+            log(json.dumps(result["debug"], indent=4, ensure_ascii=False, default=str))
+        for line in result.get("stdout", "").splitlines():
+            log(f"    {line}")
+
+    def _execute(self, task: NativeTask, scope: _Scope, environment: dict) -> dict:
+        if task.module == "debug" and (
+            int((task.args or {}).get("verbosity", 0)) > self.verbosity
+        ):
+            # Como Ansible: ni siquiera se plantillan sus argumentos.
+            return {
+                "changed": False,
+                "skipped": True,
+                "skip_reason": "Verbosity threshold not met.",
+            }
+        args = scope.template(task.args)
+        become = task.options["become"]
+        match task.module:
+            case "command" | "shell":
+                return self._command(task.module, args, become, environment)
+            case "dnf":
+                return self._dnf(args, become, environment)
+            case "set_fact":
+                self.host_vars.update(args)
+                return {"changed": False, "ansible_facts": args}
+            case "debug":
+                args = args or {}
+                if "var" in args:
+                    value = args["var"]
+                    if isinstance(value, str):
+                        try:
+                            value = scope.template("{{ " + value + " }}")
+                        except TemplateError:
+                            value = "VARIABLE IS NOT DEFINED!"
+                    shown = {str(args["var"]): value}
+                else:
+                    shown = {"msg": args.get("msg", "Hello world!")}
+                return {"changed": False, "debug": shown}
+            case "file":
+                return self._file(args)
+            case "sentu_links":
+                links = desired_links(
+                    Path(args["repo"]),
+                    Path(args["home"]),
+                    args.get("profile") or {"config": "*", "local_share": "*"},
+                )
+                report = reconcile_links(links)
+                return {
+                    "changed": report.changed,
+                    "counts": report.counts(),
+                    "created": report.created,
+                    "repaired": report.repaired,
+                    "backed_up": report.backed_up,
+                }
+        raise NativeUnsupported(f"módulo '{task.module}'")
+
+    def _spawn(self, argv: list, become: bool, environment: dict, cwd=None) -> dict:
+        argv = [_text(arg) for arg in argv]
+        env = {**os.environ, **{k: _text(v) for k, v in environment.items()}}
+        if become and os.geteuid() != 0:
+            assignments = [f"{k}={_text(v)}" for k, v in environment.items()]
+            argv = [
+                "sudo",
+                "-n",
+                *(["env", *assignments] if assignments else []),
+                *argv,
+            ]
+        try:
+            completed = subprocess.run(
+                argv, cwd=cwd, env=env, capture_output=True, text=True
+            )
+        except FileNotFoundError as e:
+            return {"cmd": argv, "rc": 2, "failed": True, "msg": str(e)}
+        stdout = completed.stdout.rstrip("\n")
+        stderr = completed.stderr.rstrip("\n")
+        return {
+            "cmd": argv,
+            "rc": completed.returncode,
+            "stdout": stdout,
+            "stderr": stderr,
+            "stdout_lines": stdout.splitlines(),
+            "stderr_lines": stderr.splitlines(),
+            "changed": True,
+            "failed": completed.returncode != 0,
+            "msg": "" if completed.returncode == 0 else "non-zero return code",
+        }
+
+    def _command(self, module: str, args, become: bool, environment: dict) -> dict:
+        if isinstance(args, str):
+            args = {"cmd": args}
+        for key, exists in (("creates", True), ("removes", False)):
+            if key in args and os.path.exists(args[key]) == exists:
+                return {"changed": False, "rc": 0, "stdout": "", "msg": f"{key}"}
+        if module == "shell":
+            argv = [args.get("executable", "/bin/sh"), "-c", args["cmd"]]
+        else:
+            argv = args.get("argv") or shlex.split(args["cmd"])
+        return self._spawn(argv, become, environment, cwd=args.get("chdir"))
+
+    def _dnf(self, args: dict, become: bool, environment: dict) -> dict:
+        names = args.get("name", [])
+        names = [names] if isinstance(names, str) else list(names)
+        state = args.get("state", "present")
+        options = dnf_metadata_options()
+        if names == ["*"] and state == "latest":
+            # La salida se analiza: en inglés aunque el usuario use otro idioma.
+            result = self._spawn(
+                ["dnf", "upgrade", "-y", *options],
+                become,
+                {**environment, "LC_ALL": "C"},
+            )
+            result["changed"] = "Nothing to do" not in result.get("stdout", "")
+            return result
+        installed = installed_capabilities()
+        if state in ("present", "installed"):
+            pending = [name for name in names if name not in installed]
+            command = ["dnf", "install", "-y", *options]
+        elif state in ("absent", "removed"):
+            pending = [name for name in names if name in installed]
+            command = ["dnf", "remove", "-y", *options]
+        else:
+            raise NativeUnsupported(f"dnf state={state}")
+        if not pending:
+            return {"changed": False, "rc": 0, "stdout": "", "results": []}
+        return self._spawn([*command, *pending], become, environment)
+
+    def _file(self, args: dict) -> dict:
+        path = Path(os.path.expanduser(args["path"]))
+        state = args.get("state", "file")
+        changed = False
+        match state:
+            case "directory":
+                changed = not path.is_dir()
+                path.mkdir(parents=True, exist_ok=True)
+            case "absent":
+                changed = path.exists() or path.is_symlink()
+                if path.is_dir() and not path.is_symlink():
+                    shutil.rmtree(path)
+                elif changed:
+                    path.unlink()
+            case "touch":
+                path.touch()
+                changed = True
+            case "link":
+                src = os.path.expanduser(args["src"])
+                changed = not path.is_symlink() or os.readlink(path) != src
+                if changed:
+                    tmp = path.with_name(f".{path.name}.sentu-tmp")
+                    tmp.unlink(missing_ok=True)
+                    tmp.symlink_to(src)
+                    os.replace(tmp, path)
+            case "file":
+                if not path.exists():
+                    return {"failed": True, "msg": f"{path} no existe"}
+            case _:
+                raise NativeUnsupported(f"file state={state}")
+        if "mode" in args and state != "link" and path.exists():
+            mode = args["mode"]
+            mode = int(mode, 8) if isinstance(mode, str) else mode
+            if stat.S_IMODE(path.stat().st_mode) != mode:
+                path.chmod(mode)
+                changed = True
+        return {"changed": changed, "path": str(path), "state": state}
+
+
+def _sudo_keepalive(stop, interval: float = 60.0):
+    while not stop.wait(interval):
+        subprocess.run(["sudo", "-n", "-v"], capture_output=True)
+
+
+def run_native(args, playbook: NativePlaybook, roles: list) -> bool:
+    """Ejecuta ``roles`` con :class:`NativePlaybook` y actualiza el estado.
+
+    Igual que :func:`run_playbook`: con un solo worker los roles van en orden y
+    se detiene en el primer fallo; con más los planifica :func:`schedule_roles`.
+    La contraseña de sudo se pide una vez y la sesión se mantiene abierta
+    mientras dura la ejecución.
+
+    Returns:
+        bool: True si todos los roles terminaron bien.
+    """
+    depends_on, exclusive, max_workers = _role_settings(DOTFILES_DIR)
+    max_workers = args.jobs or max_workers
+    stop = threading.Event()
+    if playbook.needs_become(roles) and os.geteuid() != 0:
+        if subprocess.run(["sudo", "-v"]).returncode != 0:
+            error("No se pudo obtener privilegios con sudo.")
+            return False
+        threading.Thread(target=_sudo_keepalive, args=(stop,), daemon=True).start()
+
+    try:
+        if max_workers <= 1 or len(roles) == 1:
+            info("Ejecutando el playbook con el ejecutor nativo...")
+            succeeded = []
+            for role in roles:
+                if not playbook.run_role(role):
+                    break
+                succeeded.append(role)
+        else:
+            info(
+                f"Ejecutando {len(roles)} roles con hasta {max_workers} en paralelo "
+                "(ejecutor nativo)..."
+            )
+
+            def run_role(role):
+                lines = []
+                ok = playbook.run_role(role, log=lines.append)
+                return ok, "\n".join(lines) + "\n"
+
+            results = schedule_roles(
+                roles,
+                run_role,
+                depends_on,
+                exclusive,
+                max_workers,
+                on_result=_print_role_result,
+            )
+            succeeded = [role for role in roles if results[role].status == "ok"]
+    finally:
+        stop.set()
+
+    stats = playbook.stats
+    info(
+        f"localhost: ok={stats['ok']} changed={stats['changed']} "
+        f"skipped={stats['skipped']} failed={stats['failed']}"
+    )
+    save_state(role_fingerprints(DOTFILES_DIR, args.profile), only=succeeded)
+    if len(succeeded) != len(roles):
+        failed = [role for role in roles if role not in succeeded]
+        error(f"Roles con errores u omitidos: {', '.join(failed)}")
+        return False
+    info("Playbook ejecutado exitosamente (ejecutor nativo).")
+    return True
+
+
+def write_ansible_config(
+    ansible_dir: Path, fact_file: Path, cache_timeout: int = 86400
+) -> Path:
+    """Genera la configuración de Ansible que usa el instalador.
+
+    Activa ``gathering = smart`` con caché ``jsonfile`` de hechos (con TTL) y
+    ``pipelining``. La instantánea del equipo llega como hecho local
+    (``fact_file``); si cambia, se vacía la caché de hechos para que no sirva
+    valores de otra versión del sistema. Un ``ansible.cfg`` del repositorio se
+    respeta y solo se sobrescriben estas claves.
+
+    Args:
+        ansible_dir (Path): Directorio del playbook (y su inventario).
+        fact_file (Path): Archivo generado por :func:`export_ansible_facts`.
+        cache_timeout (int): Segundos de validez de la caché de hechos.
+
+    Returns:
+        Path: Ruta del archivo para ``ANSIBLE_CONFIG``.
+    """
+    digest = hashlib.sha256(fact_file.read_bytes()).hexdigest()
+    stamp = FACT_CACHE_DIR.with_suffix(".snapshot")
+    try:
+        cached_digest = stamp.read_text(encoding="utf-8")
+    except OSError:
+        cached_digest = None
+    if cached_digest != digest:
+        shutil.rmtree(FACT_CACHE_DIR, ignore_errors=True)
+        FACT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        stamp.write_text(digest, encoding="utf-8")
+
+    config = configparser.ConfigParser(interpolation=None)
+    config.read(ansible_dir / "ansible.cfg", encoding="utf-8")
+    config.read_dict(
+        {
+            "defaults": {
+                "inventory": str(ansible_dir / "inventory.ini"),
+                "gathering": "smart",
+                "fact_caching": "jsonfile",
+                "fact_caching_connection": str(FACT_CACHE_DIR),
+                "fact_caching_timeout": str(cache_timeout),
+                # Solo escribe eventos con --trace (SENTU_TRACE_EVENTS).
+                "callbacks_enabled": "sentu_trace",
+            },
+            "connection": {"pipelining": "True"},
+        }
+    )
+    ANSIBLE_CONFIG_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp = ANSIBLE_CONFIG_FILE.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        config.write(f)
+    os.replace(tmp, ANSIBLE_CONFIG_FILE)
+    return ANSIBLE_CONFIG_FILE
+
+
+def check_and_install_ansible(wheels: Path | None = None):
+    """Instala Ansible con pip si falta.
+
+    Args:
+        wheels (Path | None): Directorio con las wheels de un paquete sin
+            conexión; si se indica, pip no usa la red.
+    """
+    if not check_command("ansible-playbook"):
+        info("Ansible no está instalado. Intentando instalarlo con pip...")
+        os_name = host_snapshot().os_name
+        match os_name:
+            case "Linux":
+                try:
+                    match host_snapshot().package_manager:
+                        case _ if wheels:
+                            info(
+                                f"Instalando Ansible desde las wheels del paquete sin conexión ({wheels})..."
+                            )
+                        case "dnf":
+                            info(
+                                "Gestor de paquetes 'dnf' detectado. Intentando instalar python3-libdnf5..."
+                            )
+                            run_command(
+                                [
+                                    "sudo",
+                                    "dnf",
+                                    "install",
+                                    "-y",
+                                    "python3-libdnf5",
+                                    "python3-pip",
+                                ]
+                            )
+                            info("python3-libdnf5 instalado exitosamente.")
+                        case _:
+                            info(
+                                "No se detectó un gestor de paquetes conocido que requiera dependencias específicas para Ansible."
+                            )
+                    subprocess.run(
+                        [
+                            "python3",
+                            "-m",
+                            "pip",
+                            "install",
+                            *(
+                                ["--no-index", "--find-links", str(wheels)]
+                                if wheels
+                                else []
+                            ),
+                            ANSIBLE_REQUIREMENT,
+                        ],
+                        check=True,
+                    )
+                    info("Ansible instalado exitosamente (pip).")
+                    host_snapshot(refresh=True)
+
+                    info(
+                        "Verificando gestor de paquetes para dependencias de Ansible..."
+                    )
+                    return True
+                except subprocess.CalledProcessError as e:
+                    error(f"Error al instalar Ansible con pip: {e}")
+                    info(
+                        "Asegúrate de tener pip instalado y configurado correctamente."
+                    )
+                    info(
+                        "Si los problemas persisten, intenta instalar Ansible manualmente usando el gestor de paquetes de tu distribución."
+                    )
+                    return False
+            case "Darwin":
+                info(
+                    "Por favor, instala Ansible en macOS usando pip: `pip3 install ansible`."
+                )
+                info("Luego, vuelve a ejecutar este script.")
+                return False
+            case "Windows":
+                info(
+                    "Por favor, instala Ansible en Windows usando pip: `pip install ansible`."
+                )
+                info("Luego, vuelve a ejecutar este script.")
+                return False
+            case _:
+                error(
+                    f"Sistema operativo '{os_name}' no reconocido para la instalación automática de Ansible."
+                )
+                info(
+                    "Por favor, instala Ansible manualmente (preferiblemente con pip) y vuelve a ejecutar este script."
+                )
+                return False
+    else:
+        info("Ansible ya está instalado.")
+        return True
+
+
+def _role_settings(repo_dir: Path) -> tuple:
+    config = (load_yaml(repo_dir / CONFIG_RELPATH) or {}).get("sentu_install", {})
+    role_inputs = config.get("roles", {})
+    depends_on = {
+        role: (inputs or {}).get("depends_on", [])
+        for role, inputs in role_inputs.items()
+    }
+    exclusive = {
+        role
+        for role, inputs in role_inputs.items()
+        if (inputs or {}).get("package_lock")
+    }
+    max_workers = _lookup(config, "scheduler.max_workers") or 1
+    return depends_on, exclusive, max_workers
+
+
+def _print_role_result(result: RoleResult):
+    if result.status == "skipped":
+        error(f"Role '{result.role}' omitido: falló una de sus dependencias.")
+        return
+    log = info if result.status == "ok" else error
+    log(f"── {result.role} ({result.status}, {result.duration:.1f} s) ──")
+    print(result.output, end="" if result.output.endswith("\n") else "\n")
+
+
+def playbook_extra_vars(args) -> dict:
+    """Variables extra (``-e``) comunes a ``ansible-playbook`` y al ejecutor nativo."""
+    extra_vars = {
+        "sentu_fact_path": str(export_ansible_facts().parent),
+        # Identifica la ejecución para compartir los metadatos de dnf entre roles.
+        "sentu_run_id": f"{int(time.time())}-{os.getpid()}",
+        # Con become el HOME es el de root: la caché se pasa por ruta.
+        "sentu_artifact_cache": str(ARTIFACT_CACHE_DIR),
+    }
+    if args.profile:
+        extra_vars["sentu_profile"] = args.profile
+    if args.offline:
+        extra_vars["sentu_offline"] = "1"
+    return extra_vars
+
+
+def become_password_needed() -> bool:
+    """Si ``ansible-playbook`` necesita que se le pase la contraseña de ``become``.
+
+    No hace falta como root ni con ``sudo`` sin contraseña (``sudo -n true``).
+    Sin terminal (p. ej. en ``fleet``, donde el script llega por la entrada
+    estándar) tampoco se puede pedir: se deja que sudo falle en la tarea.
+    """
+    if os.geteuid() == 0:
+        return False
+    try:
+        passwordless = subprocess.run(
+            ["sudo", "-n", "true"],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+    except OSError:
+        return False
+    return passwordless.returncode != 0 and sys.stdin.isatty()
+
+
+def run_playbook(args, roles: list, all_roles: bool = True) -> bool:
+    """Ejecuta ``roles`` del playbook y actualiza el manifiesto de estado.
+
+    Con un solo worker se lanza un único ``ansible-playbook`` (con ``--tags``
+    si no son todos los roles). Con más, cada role es un ``ansible-playbook
+    --tags <role>`` propio planificado por :func:`schedule_roles`; la salida de
+    cada role se muestra agrupada al terminar y la contraseña de ``become`` se
+    pide una sola vez (solo si :func:`become_password_needed`).
+
+    Returns:
+        bool: True si todos los roles terminaron bien.
+    """
+    ansible_dir = DOTFILES_DIR / "ansible"
+    playbook_path = ansible_dir / "playbook.yml"
+    inventory_file_path = ansible_dir / "inventory.ini"
+    if not playbook_path.exists() or not inventory_file_path.exists():
+        error(
+            f"No se encontró el playbook o el inventario de Ansible en: {ansible_dir}"
+        )
+        return False
+
+    depends_on, exclusive, max_workers = _role_settings(DOTFILES_DIR)
+    max_workers = args.jobs or max_workers
+    command = ["ansible-playbook", str(playbook_path), "-i", str(inventory_file_path)]
+    extra_vars = playbook_extra_vars(args)
+    for key, value in extra_vars.items():
+        command += ["-e", f"{key}={value}"]
+    command.append("-v")
+    config = (load_yaml(DOTFILES_DIR / CONFIG_RELPATH) or {}).get("sentu_install", {})
+    config_file = write_ansible_config(
+        ansible_dir,
+        Path(extra_vars["sentu_fact_path"]) / "sentu.fact",
+        _lookup(config, "facts.cache_timeout") or 86400,
+    )
+    env = {**os.environ, "ANSIBLE_CONFIG": str(config_file)}
+    if _tracer is not None:
+        env["SENTU_TRACE_EVENTS"] = str(_tracer.ansible_events)
+
+    if max_workers <= 1 or len(roles) == 1:
+        info("Ejecutando Ansible Playbook...")
+        if become_password_needed():
+            command.insert(1, "--ask-become-pass")
+        if not all_roles:
+            command += ["--tags", ",".join(roles)]
+        try:
+            subprocess.run(command, cwd=str(ansible_dir), env=env, check=True)
+            info("Ansible Playbook ejecutado exitosamente.")
+        except subprocess.CalledProcessError as e:
+            error(f"Error al ejecutar Ansible Playbook: {e}")
+            return False
+        # Se recalcula tras la ejecución: los roles cambian las versiones
+        # instaladas, que también forman parte de sus entradas.
+        save_state(role_fingerprints(DOTFILES_DIR, args.profile))
+        return True
+
+    info(f"Ejecutando {len(roles)} roles con hasta {max_workers} en paralelo...")
+
+    def run_role(role):
+        with trace_span(role, "role"):
+            result = subprocess.run(
+                [*command, "--tags", role],
+                cwd=str(ansible_dir),
+                env=env,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+            )
+        return result.returncode == 0, result.stdout
+
+    password_file = None
+    if become_password_needed():
+        password = getpass.getpass("BECOME password: ")
+        fd, password_file = tempfile.mkstemp(prefix="sentu-become-")
+        with os.fdopen(fd, "w") as f:
+            f.write(password)
+        command += ["--become-password-file", password_file]
+    try:
+        results = schedule_roles(
+            roles,
+            run_role,
+            depends_on,
+            exclusive,
+            max_workers,
+            on_result=_print_role_result,
+        )
+    finally:
+        if password_file:
+            os.unlink(password_file)
+
+    succeeded = [role for role, result in results.items() if result.status == "ok"]
+    save_state(role_fingerprints(DOTFILES_DIR, args.profile), only=succeeded)
+    if len(succeeded) != len(roles):
+        failed = [role for role in roles if role not in succeeded]
+        error(f"Roles con errores u omitidos: {', '.join(failed)}")
+        return False
+    info("Ansible Playbook ejecutado exitosamente.")
+    return True
+
+
+FLEET_CONNECTIONS = ("ssh", "local", "docker", "podman")
+# Límite de la subida del paquete cuando no hay ``timeout`` por equipo.
+FLEET_UPLOAD_TIMEOUT = 600
+
+
+@dataclass
+class FleetHost:
+    """Equipo de un inventario de :func:`load_inventory`.
+
+    Attributes:
+        name (str): Nombre en el inventario.
+        address (str): ``ansible_host`` (por defecto el nombre).
+        connection (str): ``ssh``, ``local``, ``docker`` o ``podman``.
+        user (str | None): ``ansible_user``.
+        port (int | None): ``ansible_port``.
+        key_file (str | None): ``ansible_ssh_private_key_file``.
+        python (str): ``ansible_python_interpreter`` en el equipo.
+    """
+
+    name: str
+    address: str
+    connection: str = "ssh"
+    user: str | None = None
+    port: int | None = None
+    key_file: str | None = None
+    python: str = "python3"
+
+    def command(self, argv: list, control_dir: Path, connect_timeout: int) -> list:
+        """Comando local que ejecuta ``argv`` en el equipo.
+
+        Con SSH todas las llamadas comparten una conexión maestra persistente
+        (``ControlMaster``), así que solo la primera paga el handshake.
+        """
+        match self.connection:
+            case "local":
+                return list(argv)
+            case "docker" | "podman":
+                user = ["-u", self.user] if self.user else []
+                return [self.connection, "exec", "-i", *user, self.address, *argv]
+            case "ssh":
+                options = {
+                    "BatchMode": "yes",
+                    "ControlMaster": "auto",
+                    "ControlPath": f"{control_dir}/%C",
+                    "ControlPersist": "10m",
+                    "ConnectTimeout": str(connect_timeout),
+                    "ServerAliveInterval": "30",
+                }
+                command = ["ssh"]
+                for key, value in options.items():
+                    command += ["-o", f"{key}={value}"]
+                if self.port:
+                    command += ["-p", str(self.port)]
+                if self.key_file:
+                    command += ["-i", os.path.expanduser(self.key_file)]
+                if self.user:
+                    command += ["-l", self.user]
+                return [*command, self.address, shlex.join(argv)]
+        raise ValueError(f"Conexión '{self.connection}' no soportada ({self.name}).")
+
+
+def load_inventory(path: Path, limit: list | None = None) -> list:
+    """Lee un inventario INI de Ansible (``[grupo]`` y ``host clave=valor``).
+
+    Se reconocen ``ansible_host``, ``ansible_connection``, ``ansible_user``,
+    ``ansible_port``, ``ansible_ssh_private_key_file`` y
+    ``ansible_python_interpreter``; las secciones ``:vars``/``:children`` y el
+    resto de variables se ignoran. Un equipo en varios grupos aparece una vez.
+
+    Args:
+        path (Path): Archivo de inventario.
+        limit (list | None): Nombres de equipos o grupos a incluir.
+
+    Raises:
+        OSError: Si no se puede leer el inventario.
+        ValueError: Si una línea no se puede interpretar o un equipo usa una
+            conexión no soportada.
+    """
+    hosts = {}
+    group = "ungrouped"
+    for number, raw in enumerate(path.read_text(encoding="utf-8").splitlines(), 1):
+        line = raw.split(";", 1)[0].split("#", 1)[0].strip()
+        if not line:
+            continue
+        if line.startswith("["):
+            group = line.strip("[]")
+            continue
+        if ":" in group:
+            continue
+        name, *pairs = shlex.split(line)
+        values = {}
+        for pair in pairs:
+            key, sep, value = pair.partition("=")
+            if not sep:
+                raise ValueError(f"{path}:{number}: se esperaba clave=valor: {pair!r}")
+            values[key] = value
+        if limit and name not in limit and group not in limit:
+            continue
+        connection = values.get("ansible_connection", "ssh")
+        if connection not in FLEET_CONNECTIONS:
+            raise ValueError(
+                f"{path}:{number}: conexión '{connection}' no soportada para "
+                f"{name} (válidas: {', '.join(FLEET_CONNECTIONS)})"
+            )
+        hosts.setdefault(
+            name,
+            FleetHost(
+                name,
+                values.get("ansible_host", name),
+                connection,
+                values.get("ansible_user"),
+                int(values["ansible_port"]) if "ansible_port" in values else None,
+                values.get("ansible_ssh_private_key_file"),
+                values.get("ansible_python_interpreter", "python3"),
+            ),
+        )
+    return list(hosts.values())
+
+
+def _private_dir(path: Path) -> Path:
+    """Crea ``path`` con modo 0700, o lo reutiliza solo si es seguro.
+
+    Un nombre predecible en ``/tmp`` puede haberlo creado otro usuario (o ser
+    un enlace simbólico): si no es un directorio propio sin permisos para
+    grupo ni otros, se usa uno nuevo de :func:`tempfile.mkdtemp`.
+    """
+    try:
+        path.mkdir(mode=0o700)
+        return path
+    except FileExistsError:
+        pass
+    st = path.lstat()
+    if (
+        stat.S_ISDIR(st.st_mode)
+        and st.st_uid == os.getuid()
+        and stat.S_IMODE(st.st_mode) & 0o077 == 0
+    ):
+        return path
+    return Path(tempfile.mkdtemp(prefix=f"{path.name}-", dir=path.parent))
+
+
+def provision_fleet(
+    hosts: list,
+    installer_args: list,
+    max_workers: int = 4,
+    bundle: Path | None = None,
+    connect_timeout: int = 10,
+    timeout: float | None = None,
+    log_dir: Path = CACHE_DIR / "fleet",
+    on_result=None,
+) -> tuple:
+    """Ejecuta el instalador en ``hosts`` a la vez (como mucho ``max_workers``).
+
+    En cada equipo: se abre (o reutiliza) la conexión SSH maestra, se
+    comprueba que sudo no pide contraseña (no hay terminal), se sube
+    ``bundle`` si el equipo no tiene ya el mismo y se ejecuta este mismo
+    script enviado por la entrada estándar (``python3 -``), sin copiar
+    archivos ni abrir conexiones nuevas. El paquete subido se borra cuando la
+    instalación termina bien (si falla se conserva para reintentar sin volver
+    a subirlo). La salida de cada equipo se guarda en ``log_dir/<equipo>.log``.
+
+    Args:
+        hosts (list): :class:`FleetHost` de :func:`load_inventory`.
+        installer_args (list): Argumentos del instalador en cada equipo.
+        max_workers (int): Equipos simultáneos.
+        bundle (Path | None): Paquete sin conexión a usar en los equipos.
+        connect_timeout (int): Segundos para establecer la conexión SSH.
+        timeout (float | None): Límite por equipo para la instalación.
+        log_dir (Path): Directorio de los registros por equipo.
+        on_result (callable | None): Recibe cada :class:`RoleResult`.
+
+    Returns:
+        tuple: ``({equipo: RoleResult}, {equipo: {fase: segundos}})``.
+    """
+    script = Path(__file__).read_bytes()
+    bundle_sha = _file_digest(bundle)["sha256"] if bundle else None
+    # ControlPath debe caber en sun_path (108 bytes): no vale cualquier HOME.
+    control_dir = _private_dir(Path(tempfile.gettempdir()) / f"sentu-ssh-{os.getuid()}")
+    log_dir.mkdir(parents=True, exist_ok=True)
+    by_name = {host.name: host for host in hosts}
+    timings = {host.name: {} for host in hosts}
+
+    def step(host, phase, argv, **kwargs):
+        start = time.perf_counter()
+        try:
+            return subprocess.run(
+                host.command(argv, control_dir, connect_timeout),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                **kwargs,
+            )
+        finally:
+            spent = time.perf_counter() - start
+            timings[host.name][phase] = timings[host.name].get(phase, 0) + spent
+
+    def run_host(name):
+        host = by_name[name]
+        output = []
+        with trace_span(name, "host", connection=host.connection):
+            try:
+                ok = install_host(host, output)
+            except (OSError, ValueError, subprocess.SubprocessError) as e:
+                # Sin binario (ssh, docker…), conexión colgada, etc.: falla
+                # este equipo, no la flota entera.
+                output.append(f"\n{e}\n")
+                ok = False
+        text = "".join(output)
+        (log_dir / f"{name}.log").write_text(text, encoding="utf-8")
+        return ok, text
+
+    def install_host(host, output):
+        result = step(host, "conexión", ["true"], timeout=connect_timeout + 30)
+        if result.returncode != 0:
+            output.append(result.stdout.decode(errors="replace"))
+            return False
+        # Sin terminal no se puede pedir la contraseña de sudo: mejor fallar
+        # aquí que a mitad de la instalación.
+        result = step(
+            host,
+            "conexión",
+            ["sh", "-c", '[ "$(id -u)" = 0 ] || sudo -n true'],
+            timeout=connect_timeout + 30,
+        )
+        if result.returncode != 0:
+            output.append(result.stdout.decode(errors="replace"))
+            output.append(
+                f"\n{host.name}: sudo pide contraseña; el equipo necesita sudo sin "
+                "contraseña (NOPASSWD) o ansible_user=root.\n"
+            )
+            return False
+        args = list(installer_args)
+        if bundle is not None:
+            remote = str(bundle.resolve())
+            if host.connection != "local":
+                # Relativo al directorio de trabajo remoto (el HOME con SSH).
+                remote = BUNDLE_NAME
+                check = step(
+                    host,
+                    "paquete",
+                    ["sh", "-c", f"sha256sum {remote} 2>/dev/null"],
+                    timeout=connect_timeout + 30,
+                )
+                if check.stdout.decode().split()[:1] != [bundle_sha]:
+                    with open(bundle, "rb") as f:
+                        upload = step(
+                            host,
+                            "paquete",
+                            [
+                                "sh",
+                                "-c",
+                                f"cat > {remote}.part && mv {remote}.part {remote}",
+                            ],
+                            stdin=f,
+                            timeout=timeout or FLEET_UPLOAD_TIMEOUT,
+                        )
+                    if upload.returncode != 0:
+                        output.append(upload.stdout.decode(errors="replace"))
+                        return False
+            args += ["--bundle", remote]
+        try:
+            result = step(
+                host,
+                "instalación",
+                [host.python, "-", *args],
+                input=script,
+                timeout=timeout,
+            )
+        except subprocess.TimeoutExpired as e:
+            output.append((e.stdout or b"").decode(errors="replace"))
+            output.append(f"\nTiempo agotado tras {timeout:.0f} s.\n")
+            return False
+        output.append(result.stdout.decode(errors="replace"))
+        if result.returncode != 0:
+            return False
+        if bundle is not None and host.connection != "local":
+            try:
+                step(
+                    host, "paquete", ["rm", "-f", remote], timeout=connect_timeout + 30
+                )
+            except subprocess.TimeoutExpired:
+                pass  # La instalación ya terminó; solo queda el paquete subido.
+        return True
+
+    results = schedule_roles(
+        list(by_name), run_host, max_workers=max_workers, on_result=on_result
+    )
+    return results, timings
 
-    Returns:
-        bool: True si el comando está disponible, False en caso contrario.
-    """
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Instalador de los dotfiles de SENTUstudio."
+    )
+    clone_mode = parser.add_mutually_exclusive_group()
+    clone_mode.add_argument(
+        "--update",
+        dest="clone_mode",
+        action="store_const",
+        const="update",
+        help="Actualiza el checkout existente sin preguntar (fetch + fast-forward).",
+    )
+    clone_mode.add_argument(
+        "--reclone",
+        dest="clone_mode",
+        action="store_const",
+        const="reclone",
+        help="Elimina el checkout existente y clona de nuevo sin preguntar.",
+    )
+    clone_mode.add_argument(
+        "--skip-clone",
+        dest="clone_mode",
+        action="store_const",
+        const="skip",
+        help="Usa el checkout existente tal como está.",
+    )
+    parser.add_argument(
+        "--repo-url", default=REPO_URL, help="URL del repositorio de dotfiles."
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        help="Roles simultáneos (por defecto sentu_install.scheduler.max_workers; "
+        "1 ejecuta el playbook completo de forma secuencial).",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=("auto", "native", "ansible"),
+        default="auto",
+        help="Cómo ejecutar el playbook: 'native' lo interpreta el propio script "
+        "(sin instalar Ansible), 'ansible' usa ansible-playbook y 'auto' usa el "
+        "nativo salvo que el playbook salga de su subconjunto (por defecto).",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Los roles sirven las descargas solo desde la caché de artefactos.",
+    )
+    parser.add_argument(
+        "--bundle",
+        type=Path,
+        metavar="FILE",
+        help="Aprovisiona sin red desde un paquete de `bundle` (por defecto se usa "
+        f"$SENTU_BUNDLE o un {BUNDLE_NAME} junto al script).",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Ejecuta todos los roles aunque sus entradas no hayan cambiado.",
+    )
+    parser.add_argument(
+        "--trace",
+        type=Path,
+        metavar="FILE",
+        help="Guarda una traza (Chrome trace event JSON) con la duración, CPU y "
+        "subprocesos de cada fase, role y tarea, y muestra los pasos más lentos.",
+    )
+    parser.add_argument(
+        "--profile",
+        help="Perfil de máquina de installer_config.yaml (p. ej. headless, "
+        "workstation, media) que limita qué se descarga y se enlaza.",
+    )
+    subparsers = parser.add_subparsers(dest="command", metavar="COMANDO")
+
+    link_parser = subparsers.add_parser(
+        "link", help="Reconcilia los enlaces simbólicos de los dotfiles."
+    )
+    link_parser.add_argument(
+        "--repo", type=Path, default=DOTFILES_DIR, help="Checkout de los dotfiles."
+    )
+    link_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Muestra los cambios sin aplicarlos.",
+    )
+
+    packages_parser = subparsers.add_parser(
+        "packages",
+        help="Instala los paquetes que faltan en una transacción por grupo.",
+    )
+    packages_parser.add_argument(
+        "--repo", type=Path, default=DOTFILES_DIR, help="Checkout de los dotfiles."
+    )
+    packages_parser.add_argument(
+        "--group",
+        action="append",
+        dest="groups",
+        help="Grupo de sentu_install.package_plan (repetible; todos por defecto).",
+    )
+    packages_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Muestra el plan sin instalar nada.",
+    )
+
+    repos_parser = subparsers.add_parser(
+        "repos",
+        help="Añade los repositorios que faltan (RPM de release en una transacción).",
+    )
+    repos_parser.add_argument(
+        "--repo", type=Path, default=DOTFILES_DIR, help="Checkout de los dotfiles."
+    )
+    repos_parser.add_argument(
+        "--repos-dir",
+        type=Path,
+        default=REPOS_DIR,
+        help="Directorio de archivos .repo (por defecto /etc/yum.repos.d).",
+    )
+    repos_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Muestra el plan sin cambiar nada.",
+    )
+
+    upgrade_parser = subparsers.add_parser(
+        "upgrade",
+        help="Actualiza el sistema según sentu_install.upgrade (intervalo/seguridad).",
+    )
+    upgrade_parser.add_argument(
+        "--repo", type=Path, default=DOTFILES_DIR, help="Checkout de los dotfiles."
+    )
+    upgrade_parser.add_argument(
+        "--force",
+        action="store_true",
+        # SUPPRESS: sin la opción aquí se conserva el `--force` global.
+        default=argparse.SUPPRESS,
+        help="Actualiza aunque no haya pasado el intervalo configurado.",
+    )
+
+    bundle_parser = subparsers.add_parser(
+        "bundle",
+        help="Crea un paquete sin conexión con el checkout, las descargas de "
+        "installer_config.yaml y, opcionalmente, las wheels de Ansible.",
+    )
+    bundle_parser.add_argument(
+        "--repo", type=Path, default=DOTFILES_DIR, help="Checkout de los dotfiles."
+    )
+    bundle_parser.add_argument(
+        "--output",
+        type=Path,
+        default=Path(BUNDLE_NAME),
+        help=f"Archivo a crear ({BUNDLE_NAME} por defecto).",
+    )
+    bundle_parser.add_argument(
+        "--fedora-version",
+        help="Versión de Fedora de los RPM de repositorios (por defecto la del equipo).",
+    )
+    bundle_parser.add_argument(
+        "--with-ansible",
+        action="store_true",
+        help="Incluye las wheels de Ansible (el ejecutor nativo no las necesita).",
+    )
+
+    fleet_parser = subparsers.add_parser(
+        "fleet",
+        help="Aprovisiona a la vez los equipos de un inventario (SSH con conexiones "
+        "persistentes, local o contenedores).",
+    )
+    fleet_parser.add_argument(
+        "inventory", type=Path, help="Inventario INI de Ansible con los equipos."
+    )
+    fleet_parser.add_argument(
+        "--repo", type=Path, default=DOTFILES_DIR, help="Checkout de los dotfiles."
+    )
+    fleet_parser.add_argument(
+        "--limit",
+        action="append",
+        help="Equipo o grupo del inventario (repetible; todos por defecto).",
+    )
+    fleet_parser.add_argument(
+        "--forks", type=int, help="Equipos simultáneos (fleet.max_workers)."
+    )
+    fleet_parser.add_argument(
+        "--timeout",
+        type=float,
+        help="Segundos máximos de instalación por equipo (fleet.timeout).",
+    )
+
+    fetch_parser = subparsers.add_parser(
+        "fetch", help="Descarga URLs a través de la caché de artefactos."
+    )
+    fetch_parser.add_argument("urls", nargs="+", metavar="URL")
+    fetch_parser.add_argument("--sha256", help="Hash esperado (solo con una URL).")
+    fetch_parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Imprime url, ruta, hash y estado de cada artefacto en JSON.",
+    )
+    fetch_parser.add_argument(
+        "--offline",
+        action="store_true",
+        # SUPPRESS: sin la opción aquí se conserva el `--offline` global.
+        default=argparse.SUPPRESS,
+        help="Sirve solo desde la caché.",
+    )
+
+    cached_run_parser = subparsers.add_parser(
+        "cached-run",
+        help="Ejecuta un comando sustituyendo sus argumentos URL por archivos "
+        "de la caché de artefactos (p. ej. `cached-run -- sh https://.../install.sh`).",
+    )
+    cached_run_parser.add_argument("argv", nargs=argparse.REMAINDER)
+    cached_run_parser.add_argument(
+        "--offline",
+        action="store_true",
+        # SUPPRESS: sin la opción aquí se conserva el `--offline` global.
+        default=argparse.SUPPRESS,
+        help="Sirve solo desde la caché.",
+    )
+
+    fonts_parser = subparsers.add_parser(
+        "fonts",
+        help="Instala las Nerd Fonts de sentu_install.fonts de forma incremental.",
+    )
+    fonts_parser.add_argument(
+        "--repo", type=Path, default=DOTFILES_DIR, help="Checkout de los dotfiles."
+    )
+    fonts_parser.add_argument(
+        "--dest", type=Path, default=FONTS_DIR, help="Directorio de fuentes."
+    )
+
+    post_install_parser = subparsers.add_parser(
+        "post-install",
+        help="Ejecuta install_post_install_commands con sondas y en paralelo.",
+    )
+    post_install_parser.add_argument(
+        "--repo", type=Path, default=DOTFILES_DIR, help="Checkout de los dotfiles."
+    )
+    post_install_parser.add_argument(
+        "--spec",
+        help="Entradas ya plantilladas en JSON (las pasa el role de Ansible); "
+        "por defecto se leen de installer_config.yaml.",
+    )
+    post_install_parser.add_argument(
+        "--user", help="Usuario para las entradas con become: false."
+    )
+    post_install_parser.add_argument(
+        "--jobs", type=int, help="Comandos simultáneos (post_install.max_workers)."
+    )
+
+    watch_parser = subparsers.add_parser(
+        "watch",
+        help="Vigila el checkout (inotify) y enlaza las entradas nuevas al momento.",
+    )
+    watch_parser.add_argument(
+        "--repo", type=Path, default=DOTFILES_DIR, help="Checkout de los dotfiles."
+    )
+    watch_parser.add_argument(
+        "--debounce",
+        type=float,
+        default=0.5,
+        help="Segundos sin eventos antes de aplicar los cambios (0.5 por defecto).",
+    )
+
+    args = parser.parse_args(argv)
+    if args.clone_mode is None:
+        # Sin terminal (p. ej. `curl ... | python3`) no se puede preguntar.
+        args.clone_mode = "ask" if sys.stdin.isatty() else "update"
+    return args
+
+
+def _print_link_report(report: LinkReport):
+    for label, paths in (
+        ("Creado", report.created),
+        ("Reparado", report.repaired),
+        ("Respaldado y enlazado", report.backed_up),
+        ("Eliminado", report.removed),
+    ):
+        for path in paths:
+            info(f"{label}: {path}")
+
+
+def link_command(args) -> int:
     try:
-        subprocess.run(["which", command], capture_output=True, text=True, check=True)
-        return True
-    except subprocess.CalledProcessError:
-        return False
-    except FileNotFoundError:
-        return False
+        report = link_dotfiles(args.repo, profile=args.profile, dry_run=args.dry_run)
+    except KeyError as e:
+        error(e.args[0])
+        return 1
+    _print_link_report(report)
+    counts = report.counts()
+    info(
+        f"Enlaces: {counts['created']} creados, {counts['unchanged']} sin cambios, "
+        f"{counts['repaired']} reparados, {counts['backed_up']} respaldados"
+        + (" (simulación)" if args.dry_run else "")
+    )
+    return 0
 
 
-def run_command(command_list: list):
+def packages_command(args) -> int:
+    config = (load_yaml(args.repo / CONFIG_RELPATH) or {}).get("sentu_install", {})
     try:
-        subprocess.run(command_list, check=True)
-    except subprocess.CalledProcessError as e:
-        error(f"Error al ejecutar el comando '{' '.join(command_list)}': {e}")
-        sys.exit(1)
+        plans = plan_packages(config, args.groups)
+    except (OSError, subprocess.CalledProcessError) as e:
+        error(f"No se pudo consultar la base de datos RPM: {e}")
+        return 1
+    ok = True
+    for plan in plans:
+        info(
+            f"Grupo '{plan.group}': {len(plan.present)} presentes, "
+            f"{len(plan.to_install)} a instalar, {len(plan.unavailable)} no disponibles"
+            + (
+                f", {len(plan.duplicates)} duplicados omitidos"
+                if plan.duplicates
+                else ""
+            )
+        )
+        if plan.to_install:
+            info(f"Instalando: {' '.join(plan.to_install)}")
+        if plan.unavailable:
+            error(f"No disponibles: {' '.join(plan.unavailable)}")
+        ok = install_planned(plan, args.dry_run) and ok
+    return 0 if ok else 1
 
 
-def info(message: str):
-    print(f"\033[1;34m[INFO]\033[0m {message}")
+def repos_command(args) -> int:
+    config = (load_yaml(args.repo / CONFIG_RELPATH) or {}).get("sentu_install", {})
+    repos = _lookup(config, "package_managers.fedora.repo") or {}
+    variables = {"fedora_version": host_snapshot().distribution_version}
+    try:
+        plan = plan_repositories(repos, args.repos_dir, variables)
+    except (OSError, subprocess.CalledProcessError, ValueError) as e:
+        error(f"No se pudo planificar los repositorios: {e}")
+        return 1
+    missing = [*plan.repo_files, *plan.release_rpms]
+    info(
+        f"Repositorios: {len(plan.present)} ya configurados, {len(missing)} a añadir"
+        + (f" ({', '.join(missing)})" if missing else "")
+    )
+    return 0 if apply_repositories(plan, args.repos_dir, dry_run=args.dry_run) else 1
 
 
-def error(message: str):
-    print(f"\033[1;31m[ERROR]\033[0m {message}")
+def upgrade_command(args) -> int:
+    config = (load_yaml(args.repo / CONFIG_RELPATH) or {}).get("sentu_install", {})
+    report = system_upgrade(config.get("upgrade") or {}, force=args.force)
+    match report.status:
+        case "skipped":
+            info(f"Actualización omitida: {report.reason}.")
+            return 0
+        case "failed":
+            error(f"Error al actualizar el sistema: {report.reason}.")
+            return 1
+    summary = f"{report.duration:.1f} s"
+    if report.downloaded:
+        summary += f", {report.downloaded} descargados por dnf"
+    if report.download_size:
+        summary += f", descarga anunciada por dnf: {report.download_size}"
+    if report.status == "upgraded":
+        info(f"Sistema actualizado ({summary}).")
+    else:
+        info(f"El sistema ya estaba al día ({summary}).")
+    return 0
 
 
-def clone_repo():
-    if DOTFILES_DIR.exists():
-        info(
-            f"El directorio '{DOTFILES_DIR}' ya existe. ¿Deseas eliminarlo y clonar de nuevo? (s/N)"
+def bundle_command(args) -> int:
+    version = args.fedora_version
+    if version is None:
+        snapshot = host_snapshot()
+        if snapshot.distribution != "fedora":
+            error("Este equipo no es Fedora: indica la versión con --fedora-version.")
+            return 1
+        version = snapshot.distribution_version
+    info(f"Creando el paquete sin conexión para Fedora {version}...")
+    try:
+        manifest = create_bundle(
+            args.repo, args.output, version, args.with_ansible, args.repo_url
         )
-        response = input().lower()
-        if response == "s":
-            try:
-                info(f"Eliminando '{DOTFILES_DIR}'...")
-                subprocess.run(["rm", "-rf", str(DOTFILES_DIR)], check=True)
-            except subprocess.CalledProcessError as e:
-                error(f"Error al eliminar el directorio: {e}")
-                sys.exit(1)
-        else:
-            info("Omitiendo la clonación del repositorio.")
-            return
+    except (
+        OfflineCacheMiss,
+        urllib.error.URLError,
+        ValueError,
+        OSError,
+        subprocess.CalledProcessError,
+    ) as e:
+        error(f"No se pudo crear el paquete: {e}")
+        return 1
+    wheels = sum(name.startswith("wheels/") for name in manifest["members"])
+    info(
+        f"Paquete creado: {args.output} ({_format_bytes(args.output.stat().st_size)}; "
+        f"commit {manifest['commit'][:7]}, {len(manifest['artifacts'])} descargas, "
+        f"{wheels} wheels)."
+    )
+    return 0
+
+
+def fleet_command(args) -> int:
+    config = (load_yaml(args.repo / CONFIG_RELPATH) or {}).get("sentu_install", {})
+    settings = config.get("fleet") or {}
+    try:
+        hosts = load_inventory(args.inventory, args.limit)
+    except (OSError, ValueError) as e:
+        error(f"No se pudo leer el inventario: {e}")
+        return 1
+    if not hosts:
+        error("El inventario no tiene equipos (o ninguno coincide con --limit).")
+        return 1
+
+    # Opciones globales que se reenvían al instalador de cada equipo.
+    installer_args = ["--update", "--engine", args.engine]
+    if args.repo_url != REPO_URL:
+        installer_args += ["--repo-url", args.repo_url]
+    if args.profile:
+        installer_args += ["--profile", args.profile]
+    if args.jobs:
+        installer_args += ["--jobs", str(args.jobs)]
+    if args.force:
+        installer_args.append("--force")
+    if args.offline:
+        installer_args.append("--offline")
+
+    max_workers = args.forks or settings.get("max_workers", 4)
+    info(f"Aprovisionando {len(hosts)} equipos con hasta {max_workers} a la vez...")
+    log_dir = CACHE_DIR / "fleet"
+
+    def report(result: RoleResult):
+        log = info if result.status == "ok" else error
+        log(f"{result.role}: {result.status} ({result.duration:.1f} s)")
+        if result.status == "failed":
+            for line in result.output.rstrip().splitlines()[-10:]:
+                print(f"    {line}")
+
+    results, timings = provision_fleet(
+        hosts,
+        installer_args,
+        max_workers,
+        bundle=args.bundle,
+        connect_timeout=settings.get("connect_timeout", 10),
+        timeout=args.timeout or settings.get("timeout"),
+        log_dir=log_dir,
+        on_result=report,
+    )
+
+    phases = ("conexión", "paquete", "instalación")
+    rows = [
+        (
+            host.name,
+            results[host.name].status,
+            *(
+                f"{timings[host.name][phase]:.1f}"
+                if phase in timings[host.name]
+                else "-"
+                for phase in phases
+            ),
+            f"{results[host.name].duration:.1f}",
+        )
+        for host in hosts
+    ]
+    _print_table(("equipo", "estado", *(f"{p} (s)" for p in phases), "total (s)"), rows)
+    failed = [name for name, result in results.items() if result.status != "ok"]
+    info(f"Registros de cada equipo en {log_dir}.")
+    if failed:
+        error(f"Equipos con errores: {', '.join(failed)}")
+        return 1
+    return 0
+
+
+def fetch_command(args) -> int:
+    cache = artifact_cache(args.offline or None)
+    artifacts = []
+    for url in args.urls:
+        try:
+            artifact = cache.fetch(url, args.sha256 if len(args.urls) == 1 else None)
+        except (OfflineCacheMiss, urllib.error.URLError, ValueError, OSError) as e:
+            print(f"\033[1;31m[ERROR]\033[0m {url}: {e}", file=sys.stderr)
+            return 1
+        artifacts.append(artifact)
+    if args.json:
+        print(
+            json.dumps(
+                [{**asdict(a), "path": str(a.path)} for a in artifacts], indent=2
+            )
+        )
+    else:
+        for artifact in artifacts:
+            print(artifact.path)
+    return 0
+
+
+def cached_run_command(args) -> int:
+    argv = args.argv[1:] if args.argv[:1] == ["--"] else args.argv
+    if not argv:
+        error("Falta el comando a ejecutar.")
+        return 2
+    cache = artifact_cache(args.offline or None)
+    with tempfile.TemporaryDirectory(prefix="sentu-run-") as workdir:
+        resolved = []
+        for i, arg in enumerate(argv):
+            if _is_artifact_url(arg):
+                try:
+                    arg = str(_artifact_link(cache, arg, Path(workdir, str(i))))
+                except (
+                    OfflineCacheMiss,
+                    urllib.error.URLError,
+                    ValueError,
+                    OSError,
+                ) as e:
+                    error(f"{arg}: {e}")
+                    return 1
+            resolved.append(arg)
+        return subprocess.run(resolved).returncode
 
+
+def fonts_command(args) -> int:
+    config = (load_yaml(args.repo / CONFIG_RELPATH) or {}).get("sentu_install", {})
+    try:
+        report = install_fonts(config.get("fonts", {}), args.dest)
+    except (
+        OfflineCacheMiss,
+        urllib.error.URLError,
+        zipfile.BadZipFile,
+        subprocess.CalledProcessError,
+        OSError,
+    ) as e:
+        error(f"Error al instalar las fuentes: {e}")
+        return 1
+    for name in report.written:
+        info(f"Fuente instalada: {name}")
+    for name in report.removed:
+        info(f"Fuente eliminada: {name}")
     info(
-        f"Clonando el repositorio '{REPO_NAME}' desde '{REPO_URL}' a '{DOTFILES_DIR}'..."
+        f"Fuentes: {len(report.written)} instaladas, {len(report.unchanged)} sin "
+        f"cambios, {len(report.removed)} eliminadas"
+        + (" (caché de fontconfig actualizada)" if report.cache_refreshed else "")
     )
+    return 0
+
+
+def post_install_command(args) -> int:
+    config = (load_yaml(args.repo / CONFIG_RELPATH) or {}).get("sentu_install", {})
+    if args.spec:
+        commands = json.loads(args.spec)
+    else:
+        variables = {
+            "sentu_dotfiles_dir": str(args.repo.absolute()),
+            "sentu_home": str(Path.home()),
+        }
+        commands = [
+            {
+                k: render_vars(v, variables) if isinstance(v, str) else v
+                for k, v in entry.items()
+            }
+            for entry in config.get("install_post_install_commands", [])
+        ]
+    max_workers = args.jobs or _lookup(config, "post_install.max_workers") or 1
+
+    def report(result: RoleResult):
+        match result.status:
+            case "present":
+                info(f"Presente: {result.role}")
+            case "skipped":
+                error(f"Omitido: {result.role} (falló una dependencia)")
+            case status:
+                log = info if status == "ok" else error
+                label = "Ejecutado" if status == "ok" else "Falló"
+                log(f"{label}: {result.role} ({result.duration:.1f} s)")
+                if result.output:
+                    print(
+                        result.output, end="" if result.output.endswith("\n") else "\n"
+                    )
+
     try:
-        subprocess.run(["git", "clone", REPO_URL, str(DOTFILES_DIR)], check=True)
-        info("Repositorio clonado exitosamente.")
-    except subprocess.CalledProcessError as e:
-        error(f"Error al clonar el repositorio: {e}")
+        results = run_post_install(commands, args.user, max_workers, on_result=report)
+    except (KeyError, ValueError) as e:
+        error(f"Configuración de post-instalación inválida: {e}")
+        return 1
+
+    labels = {
+        "ok": "ejecutado",
+        "present": "omitido (presente)",
+        "failed": "falló",
+        "skipped": "bloqueado",
+    }
+    info("Resumen de post-instalación:")
+    for name, result in results.items():
+        print(f"  {name:<16} {labels[result.status]:<20} {result.duration:6.1f} s")
+    return 0 if all(r.status in ("ok", "present") for r in results.values()) else 1
+
+
+def watch_command(args) -> int:
+    try:
+        report = link_dotfiles(args.repo, profile=args.profile)
+        _print_link_report(report)
+        info(f"Vigilando '{args.repo}' (Ctrl+C para salir)...")
+        watch_dotfiles(
+            args.repo,
+            profile=args.profile,
+            debounce=args.debounce,
+            on_report=_print_link_report,
+        )
+    except KeyboardInterrupt:
+        return 0
+    except KeyError as e:
+        error(e.args[0])
+        return 1
+    except OSError as e:
+        error(f"No se pudo vigilar el checkout: {e}")
+        return 1
+    return 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    match args.command:
+        case "link":
+            sys.exit(link_command(args))
+        case "packages":
+            sys.exit(packages_command(args))
+        case "repos":
+            sys.exit(repos_command(args))
+        case "upgrade":
+            sys.exit(upgrade_command(args))
+        case "bundle":
+            sys.exit(bundle_command(args))
+        case "fleet":
+            sys.exit(fleet_command(args))
+        case "fetch":
+            sys.exit(fetch_command(args))
+        case "cached-run":
+            sys.exit(cached_run_command(args))
+        case "fonts":
+            sys.exit(fonts_command(args))
+        case "post-install":
+            sys.exit(post_install_command(args))
+        case "watch":
+            sys.exit(watch_command(args))
+    if not args.trace:
+        install(args)
+        return
+
+    global _tracer
+    _tracer = Tracer()
+    _tracer.install()
+    try:
+        with trace_span("install"):
+            install(args)
+    finally:
+        _tracer.uninstall()
+        _tracer.write(args.trace)
+        info(f"Traza guardada en {args.trace} (chrome://tracing, Perfetto).")
+        _tracer.print_summary()
+
+
+def unpack_bundle(args, bundle: Path) -> BundleContents:
+    """Prepara la instalación desde ``bundle``: siembra la caché de artefactos,
+    extrae las wheels y el checkout (si no hay uno o con ``--reclone``) y
+    activa el modo sin conexión."""
+    info(f"Usando el paquete sin conexión '{bundle}'.")
+    if DOTFILES_DIR.exists() and args.clone_mode == "reclone":
+        info(f"Eliminando '{DOTFILES_DIR}'...")
+        shutil.rmtree(DOTFILES_DIR)
+    fresh = not DOTFILES_DIR.exists()
+    try:
+        contents = provision_from_bundle(
+            bundle, artifact_cache(True), DOTFILES_DIR if fresh else None
+        )
+        if fresh and args.profile is not None:
+            apply_profile(DOTFILES_DIR, args.profile)
+    except (BundleError, OSError, tarfile.TarError, ValueError) as e:
+        error(f"No se pudo usar el paquete: {e}")
+        sys.exit(1)
+    except (subprocess.CalledProcessError, KeyError) as e:
+        error(f"Error al aplicar el perfil '{args.profile}': {e}")
         sys.exit(1)
+    args.offline = True
+    if fresh:
+        info(
+            f"Checkout extraído en '{DOTFILES_DIR}' (commit {contents.manifest['commit'][:7]})."
+        )
+    else:
+        info(
+            f"Se conserva el checkout existente '{DOTFILES_DIR}' "
+            "(usa --reclone para reemplazarlo por el del paquete)."
+        )
+    info(
+        f"Caché de artefactos: {contents.artifacts} añadidos, "
+        f"{contents.reused} ya presentes."
+    )
+    return contents
 
 
-def check_and_install_ansible():
-    if not check_command("ansible-playbook"):
-        info("Ansible no está instalado. Intentando instalarlo con pip...")
-        os_name = platform.system()
+def install(args):
+    show()
+    os_name = host_snapshot().os_name
+    info(f"Sistema operativo detectado: {os_name}")
+
+    with trace_span("git"):
+        info("Verificando si Git está instalado...")
         match os_name:
             case "Linux":
-                try:
-                    match (
-                        check_command("apt-get"),
-                        check_command("dnf"),
-                        check_command("pacman"),
-                        check_command("yum"),
-                    ):
-                        case (_, True, _, _):
+                if not check_command("git"):
+                    info(
+                        "Git no está instalado. Intentando instalarlo con el gestor de paquetes..."
+                    )
+                    match host_snapshot().package_manager:
+                        case "apt-get":
                             info(
-                                "Gestor de paquetes 'dnf' detectado. Intentando instalar python3-libdnf5..."
+                                "Gestor de paquetes 'apt' detectado. Intentando instalar Git..."
                             )
-                            run_command(
-                                [
-                                    "sudo",
-                                    "dnf",
-                                    "install",
-                                    "-y",
-                                    "python3-libdnf5",
-                                    "python3-pip",
-                                ]
+                            run_command(["sudo", "apt-get", "update"])
+                            run_command(["sudo", "apt-get", "install", "-y", "git"])
+                        case "dnf":
+                            info(
+                                "Gestor de paquetes 'dnf' detectado. Intentando instalar Git..."
                             )
-                            info("python3-libdnf5 instalado exitosamente.")
+                            run_command(["sudo", "dnf", "update", "-y"])
+                            run_command(["sudo", "dnf", "install", "-y", "git"])
+                        case "pacman":
+                            info(
+                                "Gestor de paquetes 'pacman' detectado. Intentando instalar Git..."
+                            )
+                            run_command(["sudo", "pacman", "-Syy", "--noconfirm"])
+                            run_command(["sudo", "pacman", "-S", "--noconfirm", "git"])
+                        case "yum":
+                            info(
+                                "Gestor de paquetes 'yum' detectado. Intentando instalar Git..."
+                            )
+                            run_command(["sudo", "yum", "update", "-y"])
+                            run_command(["sudo", "yum", "install", "-y", "git"])
                         case _:
+                            error(
+                                "Gestor de paquetes no reconocido para la instalación automática de Git."
+                            )
                             info(
-                                "No se detectó un gestor de paquetes conocido que requiera dependencias específicas para Ansible."
+                                "Por favor, instala Git manualmente y vuelve a ejecutar el script."
                             )
-                    subprocess.run(
-                        ["python3", "-m", "pip", "install", "ansible"], check=True
-                    )
-                    info("Ansible instalado exitosamente (pip).")
-
-                    info(
-                        "Verificando gestor de paquetes para dependencias de Ansible..."
-                    )
-                    return True
-                except subprocess.CalledProcessError as e:
-                    error(f"Error al instalar Ansible con pip: {e}")
+                            sys.exit(1)
+                    host_snapshot(refresh=True)
+                else:
+                    info("Git ya está instalado.")
+            case "Darwin":
+                if not check_command("git"):
                     info(
-                        "Asegúrate de tener pip instalado y configurado correctamente."
+                        "Por favor, instala Git en macOS (por ejemplo, usando Xcode Command Line Tools o Homebrew)."
                     )
+                    info("Luego, vuelve a ejecutar este script.")
+                    sys.exit(1)
+                else:
+                    info("Git ya está instalado.")
+            case "Windows":
+                if not check_command("git"):
                     info(
-                        "Si los problemas persisten, intenta instalar Ansible manualmente usando el gestor de paquetes de tu distribución."
+                        "Por favor, instala Git en Windows (por ejemplo, desde https://git-scm.com/download/win)."
                     )
-                    return False
-            case "Darwin":
-                info(
-                    "Por favor, instala Ansible en macOS usando pip: `pip3 install ansible`."
-                )
-                info("Luego, vuelve a ejecutar este script.")
-                return False
-            case "Windows":
-                info(
-                    "Por favor, instala Ansible en Windows usando pip: `pip install ansible`."
-                )
-                info("Luego, vuelve a ejecutar este script.")
-                return False
+                    info("Luego, vuelve a ejecutar este script.")
+                    sys.exit(1)
+                else:
+                    info("Git ya está instalado.")
             case _:
                 error(
-                    f"Sistema operativo '{os_name}' no reconocido para la instalación automática de Ansible."
-                )
-                info(
-                    "Por favor, instala Ansible manualmente (preferiblemente con pip) y vuelve a ejecutar este script."
-                )
-                return False
-    else:
-        info("Ansible ya está instalado.")
-        return True
-
-
-def main():
-    show()
-    os_name = platform.system()
-    info(f"Sistema operativo detectado: {os_name}")
-
-    info("Verificando si Git está instalado...")
-    match os_name:
-        case "Linux":
-            if not check_command("git"):
-                info(
-                    "Git no está instalado. Intentando instalarlo con el gestor de paquetes..."
-                )
-                match (
-                    check_command("apt-get"),
-                    check_command("dnf"),
-                    check_command("pacman"),
-                    check_command("yum"),
-                ):
-                    case (True, _, _, _):
-                        info(
-                            "Gestor de paquetes 'apt' detectado. Intentando instalar Git..."
-                        )
-                        run_command(["sudo", "apt-get", "update"])
-                        run_command(["sudo", "apt-get", "install", "-y", "git"])
-                    case (_, True, _, _):
-                        info(
-                            "Gestor de paquetes 'dnf' detectado. Intentando instalar Git..."
-                        )
-                        run_command(["sudo", "dnf", "update", "-y"])
-                        run_command(["sudo", "dnf", "install", "-y", "git"])
-                    case (_, _, True, _):
-                        info(
-                            "Gestor de paquetes 'pacman' detectado. Intentando instalar Git..."
-                        )
-                        run_command(["sudo", "pacman", "-Syy", "--noconfirm"])
-                        run_command(["sudo", "pacman", "-S", "--noconfirm", "git"])
-                    case (_, _, _, True):
-                        info(
-                            "Gestor de paquetes 'yum' detectado. Intentando instalar Git..."
-                        )
-                        run_command(["sudo", "yum", "update", "-y"])
-                        run_command(["sudo", "yum", "install", "-y", "git"])
-                    case _:
-                        error(
-                            "Gestor de paquetes no reconocido para la instalación automática de Git."
-                        )
-                        info(
-                            "Por favor, instala Git manualmente y vuelve a ejecutar el script."
-                        )
-                        sys.exit(1)
-            else:
-                info("Git ya está instalado.")
-        case "Darwin":
-            if not check_command("git"):
-                info(
-                    "Por favor, instala Git en macOS (por ejemplo, usando Xcode Command Line Tools o Homebrew)."
+                    f"Sistema operativo '{os_name}' no reconocido para la instalación automática de Git."
                 )
-                info("Luego, vuelve a ejecutar este script.")
-                sys.exit(1)
-            else:
-                info("Git ya está instalado.")
-        case "Windows":
-            if not check_command("git"):
                 info(
-                    "Por favor, instala Git en Windows (por ejemplo, desde https://git-scm.com/download/win)."
+                    "Por favor, instala Git manualmente y vuelve a ejecutar este script."
                 )
-                info("Luego, vuelve a ejecutar este script.")
                 sys.exit(1)
-            else:
-                info("Git ya está instalado.")
-        case _:
-            error(
-                f"Sistema operativo '{os_name}' no reconocido para la instalación automática de Git."
-            )
-            info("Por favor, instala Git manualmente y vuelve a ejecutar este script.")
-            sys.exit(1)
 
-    clone_repo()
+    bundle = find_bundle(args.bundle)
+    contents = None
+    if bundle is not None:
+        with trace_span("bundle"):
+            contents = unpack_bundle(args, bundle)
+    else:
+        with trace_span("clone"):
+            clone_repo(args.clone_mode, args.repo_url, profile=args.profile)
     show("💾 Clonación de dotfiles terminada")
 
-    inventory_file_path = str(DOTFILES_DIR / "ansible" / "inventory.ini")
-
-    if check_and_install_ansible() and os.path.exists(inventory_file_path):
-        ansible_dir = DOTFILES_DIR / "ansible"
-        playbook_path = ansible_dir / "playbook.yml"
+    with trace_span("fingerprints"):
+        fingerprints = role_fingerprints(DOTFILES_DIR, args.profile)
+    roles = list(fingerprints)
+    if not args.force:
+        roles = changed_roles(fingerprints, load_state())
+        if not roles:
+            info("Ningún role tiene cambios desde la última ejecución (usa --force).")
+            show("✅ Configuración completa")
+            return
+        if len(roles) < len(fingerprints):
+            info(f"Roles con cambios: {', '.join(roles)}")
 
-        if playbook_path.exists():
-            info("Ejecutando Ansible Playbook...")
-            try:
-                subprocess.run(
-                    [
-                        "ansible-playbook",
-                        "--ask-become-pass",
-                        str(playbook_path),
-                        "-i",
-                        inventory_file_path,
-                        "-v",
-                    ],
-                    cwd=str(ansible_dir),
-                    check=True,
+    playbook = None
+    if args.engine != "ansible":
+        try:
+            with trace_span("native executor load"):
+                playbook = NativePlaybook(
+                    DOTFILES_DIR / "ansible", playbook_extra_vars(args)
                 )
-                info("Ansible Playbook ejecutado exitosamente.")
-            except subprocess.CalledProcessError as e:
-                error(f"Error al ejecutar Ansible Playbook: {e}")
+        except NativeUnsupported as e:
+            if args.engine == "native":
+                error(f"El ejecutor nativo no puede ejecutar el playbook: {e}")
                 sys.exit(1)
-        else:
-            error(f"No se encontró el playbook de Ansible en: {playbook_path}")
-            sys.exit(1)
+            info(f"Ejecutor nativo no disponible ({e}); se usará ansible-playbook.")
+
+    if playbook is not None:
+        # Sin Ansible: no hace falta instalarlo en equipos recién instalados.
+        with trace_span("playbook", engine="native"):
+            ok = run_native(args, playbook, roles)
     else:
-        error(
-            "No se puede continuar sin Ansible instalado o sin el archivo de inventario."
-        )
+        with trace_span("ansible bootstrap"):
+            ok = check_and_install_ansible(contents.wheels if contents else None)
+        if not ok:
+            error("No se puede continuar sin Ansible instalado.")
+            sys.exit(1)
+        with trace_span("playbook", engine="ansible"):
+            ok = run_playbook(args, roles, all_roles=len(roles) == len(fingerprints))
+    if not ok:
         sys.exit(1)
 
     show("✅ Configuración completa")
@@ -0,0 +1,34 @@
+"""Configuración común: permite importar ``sentu_install`` desde la raíz."""
+
+import sys
+import threading
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture
+def http_server():
+    """Arranca servidores HTTP locales: ``http_server(Handler, **atributos)``.
+
+    Los atributos quedan en el servidor (``self.server`` en el manejador) y
+    ``url`` apunta a su puerto. Se detienen al terminar la prueba.
+    """
+    servers = []
+
+    def start(handler, **attributes):
+        httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        for name, value in attributes.items():
+            setattr(httpd, name, value)
+        httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}"
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        servers.append(httpd)
+        return httpd
+
+    yield start
+    for httpd in servers:
+        httpd.shutdown()
+        httpd.server_close()
@@ -0,0 +1,184 @@
+"""Rutas sin conexión, ``ETag`` y expulsión LRU de :class:`ArtifactCache`."""
+
+import hashlib
+import io
+import threading
+import urllib.error
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+import sentu_install as si
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Sirve ``server.files`` con ``ETag``, 304 si no cambió y 416 a todo ``Range``."""
+
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        body = self.server.files.get(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+        if "Range" in self.headers:
+            self.send_error(416)
+            return
+        etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(http_server):
+    return http_server(Handler, files={}, requests=[])
+
+
+def sha(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def test_download_then_conditional_revalidation(tmp_path, server):
+    server.files["/tool.tar.gz"] = b"v1" * 1000
+    cache = si.ArtifactCache(tmp_path)
+    url = server.url + "/tool.tar.gz"
+
+    first = cache.fetch(url)
+    assert first.status == "downloaded"
+    assert first.path == tmp_path / "objects" / sha(b"v1" * 1000)
+    assert first.path.read_bytes() == b"v1" * 1000
+
+    second = cache.fetch(url)
+    assert second.status == "revalidated"
+    assert second.path == first.path
+    assert server.requests[-1]["If-None-Match"].startswith('"')
+
+    server.files["/tool.tar.gz"] = b"v2"
+    third = cache.fetch(url)
+    assert third.status == "downloaded"
+    assert third.sha256 == sha(b"v2")
+
+
+def test_unsatisfiable_range_restarts_the_download(tmp_path, server):
+    server.files["/a"] = b"completo"
+    url = server.url + "/a"
+    cache = si.ArtifactCache(tmp_path)
+    url_key = hashlib.sha256(url.encode()).hexdigest()
+    (tmp_path / "partial").mkdir()
+    (tmp_path / "partial" / f"{url_key}.part").write_bytes(b"parcial-caducado")
+    (tmp_path / "partial" / f"{url_key}.json").write_text('{"etag": "\\"viejo\\""}')
+
+    result = []
+    thread = threading.Thread(
+        target=lambda: result.append(cache.fetch(url)), daemon=True
+    )
+    thread.start()
+    thread.join(timeout=10)
+    assert not thread.is_alive(), "fetch se bloqueó al reintentar tras un 416"
+
+    assert result[0].status == "downloaded"
+    assert result[0].path.read_bytes() == b"completo"
+    assert [r.get("Range") for r in server.requests] == ["bytes=16-", None]
+    assert not list((tmp_path / "partial").glob(f"{url_key}.*"))
+
+
+def test_known_sha256_is_served_without_network(tmp_path, server):
+    server.files["/a"] = b"contenido"
+    cache = si.ArtifactCache(tmp_path)
+    cache.fetch(server.url + "/a")
+    requests = len(server.requests)
+    hit = cache.fetch(server.url + "/otra-url", sha256=sha(b"contenido"))
+    assert hit.status == "cached"
+    assert len(server.requests) == requests
+
+
+def test_sha256_mismatch_is_rejected(tmp_path, server):
+    server.files["/a"] = b"contenido"
+    cache = si.ArtifactCache(tmp_path)
+    with pytest.raises(ValueError):
+        cache.fetch(server.url + "/a", sha256="0" * 64)
+    assert not list((tmp_path / "objects").glob("*"))
+    assert not list((tmp_path / "partial").glob("*"))
+
+
+def test_http_errors_propagate(tmp_path, server):
+    with pytest.raises(urllib.error.HTTPError):
+        si.ArtifactCache(tmp_path).fetch(server.url + "/no-existe")
+
+
+def test_offline_serves_cached_and_misses_loudly(tmp_path, server):
+    server.files["/a"] = b"contenido"
+    si.ArtifactCache(tmp_path).fetch(server.url + "/a")
+    requests = len(server.requests)
+
+    offline = si.ArtifactCache(tmp_path, offline=True)
+    hit = offline.fetch(server.url + "/a")
+    assert hit.status == "cached"
+    assert hit.path.read_bytes() == b"contenido"
+    with pytest.raises(si.OfflineCacheMiss):
+        offline.fetch(server.url + "/b")
+    assert len(server.requests) == requests
+
+
+def test_offline_miss_when_object_was_removed(tmp_path):
+    cache = si.ArtifactCache(tmp_path)
+    artifact = cache.put("https://example.invalid/a", io.BytesIO(b"a"))
+    artifact.path.unlink()
+    with pytest.raises(si.OfflineCacheMiss):
+        si.ArtifactCache(tmp_path, offline=True).fetch("https://example.invalid/a")
+
+
+def test_put_seeds_the_cache_and_checks_the_hash(tmp_path):
+    cache = si.ArtifactCache(tmp_path, offline=True)
+    artifact = cache.put("https://example.invalid/a", io.BytesIO(b"datos"))
+    assert artifact.sha256 == sha(b"datos")
+    assert cache.fetch("https://example.invalid/a").path == artifact.path
+    with pytest.raises(ValueError):
+        cache.put("https://example.invalid/b", io.BytesIO(b"x"), sha256="0" * 64)
+    assert not list((tmp_path / "objects").glob(".put-*"))
+
+
+def test_eviction_drops_least_recently_used(tmp_path, monkeypatch):
+    clock = iter(range(1, 1000))
+    monkeypatch.setattr(si.time, "time", lambda: next(clock))
+    cache = si.ArtifactCache(tmp_path, max_bytes=25)
+    urls = {name: f"https://example.invalid/{name}" for name in "abc"}
+
+    a = cache.put(urls["a"], io.BytesIO(b"a" * 10))
+    b = cache.put(urls["b"], io.BytesIO(b"b" * 10))
+    cache.fetch(urls["a"], sha256=a.sha256)  # ``a`` pasa a ser el más reciente.
+    c = cache.put(urls["c"], io.BytesIO(b"c" * 10))
+
+    assert a.path.exists() and c.path.exists()
+    assert not b.path.exists()
+    assert set(cache._read_index()) == {urls["a"], urls["c"]}
+    assert cache.evict() == []
+
+
+def test_eviction_never_drops_the_object_just_stored(tmp_path, server):
+    server.files["/grande"] = b"g" * 100
+    cache = si.ArtifactCache(tmp_path, max_bytes=50)
+
+    big = cache.put("https://example.invalid/grande", io.BytesIO(b"p" * 100))
+    assert big.path.exists()
+    fetched = cache.fetch(server.url + "/grande")
+    assert fetched.path.exists()
+    assert not big.path.exists()
+
+
+def test_eviction_keeps_the_new_object_on_timestamp_ties(tmp_path, monkeypatch):
+    monkeypatch.setattr(si.time, "time", lambda: 1000.0)
+    cache = si.ArtifactCache(tmp_path, max_bytes=15)
+    cache.put("https://example.invalid/z", io.BytesIO(b"z" * 10))
+    new = cache.put("https://example.invalid/a", io.BytesIO(b"a" * 10))
+    assert new.path.exists()
+    assert set(cache._read_index()) == {"https://example.invalid/a"}
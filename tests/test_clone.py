@@ -0,0 +1,148 @@
+"""Clon superficial y actualización fast-forward contra un origen ``file://``."""
+
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+import sentu_install as si
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None, reason="requiere git")
+
+
+def git(*args, cwd=None) -> str:
+    return subprocess.run(
+        ["git", *args], cwd=cwd, check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+
+class Origin:
+    """Repositorio bare con un árbol de trabajo para publicar commits."""
+
+    def __init__(self, root):
+        self.bare = root / "origin.git"
+        self.work = root / "work"
+        self.url = f"file://{self.bare}"
+        git("init", "--quiet", "--bare", "--initial-branch=main", str(self.bare))
+        git("-C", str(self.bare), "config", "uploadpack.allowFilter", "true")
+        git("init", "--quiet", "--initial-branch=main", str(self.work))
+
+    def commit(self, files: dict, message: str) -> str:
+        for name, content in files.items():
+            path = self.work / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(content)
+        git("add", "-A", cwd=self.work)
+        git("commit", "--quiet", "-m", message, cwd=self.work)
+        git("push", "--quiet", self.url, "HEAD:refs/heads/main", cwd=self.work)
+        return git("rev-parse", "HEAD", cwd=self.work)
+
+
+@pytest.fixture
+def origin(tmp_path, monkeypatch):
+    monkeypatch.setenv("GIT_CONFIG_GLOBAL", str(tmp_path / "gitconfig"))
+    monkeypatch.setenv("GIT_CONFIG_NOSYSTEM", "1")
+    for role in ("AUTHOR", "COMMITTER"):
+        monkeypatch.setenv(f"GIT_{role}_NAME", "Sentu")
+        monkeypatch.setenv(f"GIT_{role}_EMAIL", "sentu@example.invalid")
+    repo = Origin(tmp_path)
+    repo.commit({"README.md": b"v1\n", "config/nvim/init.lua": b"-- v1\n"}, "v1")
+    repo.commit({"README.md": b"v2\n", "config/nvim/init.lua": b"-- v2\n"}, "v2")
+    return repo
+
+
+def missing_objects(dest) -> set:
+    """Objetos alcanzables que no están en el clon (no los descarga)."""
+    out = git("-C", str(dest), "rev-list", "--objects", "--missing=print", "HEAD")
+    return {line[1:] for line in out.splitlines() if line.startswith("?")}
+
+
+def test_fresh_clone_is_shallow_and_blob_filtered(origin, tmp_path):
+    dest = tmp_path / "dotfiles"
+    transferred = si.fresh_clone(origin.url, dest, sparse=True)
+
+    assert transferred == si._object_store_size(dest) > 0
+    assert git("-C", str(dest), "rev-list", "--count", "HEAD") == "1"
+    assert (dest / ".git" / "shallow").exists()
+    assert git("-C", str(dest), "config", "remote.origin.partialclonefilter") == (
+        "blob:none"
+    )
+    # Con --sparse solo se descargan los blobs de la raíz.
+    assert (dest / "README.md").read_bytes() == b"v2\n"
+    assert not (dest / "config").exists()
+    init_lua = git("-C", str(dest), "rev-parse", "HEAD:config/nvim/init.lua")
+    assert missing_objects(dest) == {init_lua}
+
+
+def test_update_checkout_fast_forwards_and_reports_growth(origin, tmp_path):
+    dest = tmp_path / "dotfiles"
+    si.fresh_clone(origin.url, dest)
+    assert si.update_checkout(dest) == 0
+
+    head = origin.commit({"README.md": b"v3\n" * 4096}, "v3")
+    before = si._object_store_size(dest)
+    transferred = si.update_checkout(dest)
+
+    assert transferred == si._object_store_size(dest) - before > 0
+    assert git("-C", str(dest), "rev-parse", "HEAD") == head
+    assert (dest / "README.md").read_bytes() == b"v3\n" * 4096
+    # El límite superficial se conserva: solo llegó el commit nuevo.
+    assert git("-C", str(dest), "rev-list", "--count", "HEAD") == "2"
+
+
+def test_update_checkout_refuses_to_rewrite_diverged_history(origin, tmp_path):
+    dest = tmp_path / "dotfiles"
+    si.fresh_clone(origin.url, dest)
+    (dest / "local.txt").write_text("cambio local\n")
+    git("-C", str(dest), "add", "local.txt")
+    git("-C", str(dest), "commit", "--quiet", "-m", "local")
+    local = git("-C", str(dest), "rev-parse", "HEAD")
+    origin.commit({"README.md": b"v3\n"}, "v3")
+
+    with pytest.raises(subprocess.CalledProcessError):
+        si.update_checkout(dest)
+    assert git("-C", str(dest), "rev-parse", "HEAD") == local
+    assert (dest / "local.txt").exists()
+
+
+def test_clone_repo_clones_then_updates(origin, tmp_path, capsys):
+    dest = tmp_path / "dotfiles"
+    si.clone_repo("update", origin.url, dest)
+    assert "Repositorio clonado exitosamente" in capsys.readouterr().out
+
+    head = origin.commit({"README.md": b"v3\n"}, "v3")
+    si.clone_repo("update", origin.url, dest)
+    assert "Repositorio actualizado" in capsys.readouterr().out
+    assert git("-C", str(dest), "rev-parse", "HEAD") == head
+
+    (dest / "extra").write_text("x")
+    si.clone_repo("reclone", origin.url, dest)
+    assert not (dest / "extra").exists()
+    assert git("-C", str(dest), "rev-parse", "HEAD") == head
+
+
+REPO = Path(si.__file__).resolve().parent
+
+
+@pytest.mark.skipif(not (REPO / ".git").exists(), reason="requiere el repositorio git")
+def test_every_declared_profile_applies(tmp_path):
+    config = si.load_yaml(REPO / si.CONFIG_RELPATH)["sentu_install"]
+    profiles = config["profiles"]
+    dest = tmp_path / "dotfiles"
+    si.fresh_clone(f"file://{REPO}", dest, sparse=True)
+    listing = git("-C", str(dest), "ls-tree", "--name-only", "HEAD:config")
+    available = set(listing.split())
+
+    for name, profile in profiles.items():
+        si.clone_repo("skip", f"file://{REPO}", dest, profile=name)
+        checked_out = {path.name for path in (dest / "config").iterdir()}
+        wanted = profile["config"]
+        if wanted == "*":
+            assert checked_out == available, name
+        else:
+            # Los archivos sueltos de config/ (konsolerc) llegan en modo cono.
+            assert set(wanted) & available <= checked_out, name
+            assert checked_out <= set(wanted) | {
+                entry for entry in available if (dest / "config" / entry).is_file()
+            }, name
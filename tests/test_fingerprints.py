@@ -0,0 +1,38 @@
+"""Entradas del manifiesto de estado de :func:`role_fingerprints`."""
+
+import shutil
+from pathlib import Path
+
+import sentu_install as si
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def make_repo(tmp_path):
+    shutil.copytree(REPO_ROOT / "ansible", tmp_path / "ansible")
+    shutil.copy(REPO_ROOT / "sentu_install.py", tmp_path / "sentu_install.py")
+    return tmp_path
+
+
+def changed(before, after):
+    return {role for role in before if before[role] != after[role]}
+
+
+def test_installer_changes_invalidate_script_roles(tmp_path):
+    repo = make_repo(tmp_path)
+    config = si.load_yaml(repo / si.CONFIG_RELPATH)["sentu_install"]["roles"]
+    script_roles = {role for role, inputs in config.items() if inputs.get("script")}
+    assert "install_fonts" in script_roles
+
+    before = si.role_fingerprints(repo)
+    with open(repo / "sentu_install.py", "a", encoding="utf-8") as f:
+        f.write("\n# cambio\n")
+    assert changed(before, si.role_fingerprints(repo)) == script_roles & set(before)
+
+
+def test_role_files_invalidate_only_their_role(tmp_path):
+    repo = make_repo(tmp_path)
+    before = si.role_fingerprints(repo)
+    tasks = repo / "ansible" / "roles" / "install_uv" / "tasks" / "main.yml"
+    tasks.write_text(tasks.read_text(encoding="utf-8") + "\n", encoding="utf-8")
+    assert changed(before, si.role_fingerprints(repo)) == {"install_uv"}
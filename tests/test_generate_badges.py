@@ -0,0 +1,164 @@
+"""Capa de red de ``generate_badges.py`` contra un stub local de la API."""
+
+import hashlib
+import importlib.util
+import json
+from http.server import BaseHTTPRequestHandler
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+pytest.importorskip("requests")
+
+SCRIPT = Path(__file__).resolve().parent.parent / ".github/scripts/generate_badges.py"
+REPO = "sentu/dotfiles"
+
+GRAPHQL_DATA = {
+    "repository": {
+        "latestRelease": None,
+        "licenseInfo": {"spdxId": "MIT"},
+        "stargazerCount": 7,
+        "diskUsage": 1234,
+        "issues": {"totalCount": 2},
+        "defaultBranchRef": {
+            "target": {
+                "oid": "0123456789abcdef",
+                "statusCheckRollup": {"state": "FAILURE"},
+            }
+        },
+    }
+}
+
+RUNS = [
+    # El más reciente: este mismo workflow, aún en curso.
+    {"head_branch": "main", "status": "in_progress", "conclusion": None},
+    {"head_branch": "develop", "status": "completed", "conclusion": "failure"},
+    {"head_branch": "main", "status": "completed", "conclusion": "success"},
+]
+
+
+class Handler(BaseHTTPRequestHandler):
+    """API mínima: REST con ETags (304) y GraphQL configurable."""
+
+    def reply(self, status, body=None, etag=None):
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        if etag:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self.server.requests.append(("GET", self.path, dict(self.headers)))
+        url = urlsplit(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if url.path == f"/repos/{REPO}":
+            body = {
+                "license": {"spdx_id": "MIT"},
+                "stargazers_count": 7,
+                "size": 1234,
+                "default_branch": "main",
+            }
+        elif url.path == f"/repos/{REPO}/actions/runs":
+            runs = [
+                run
+                for run in RUNS
+                if run["head_branch"] == query.get("branch", run["head_branch"])
+                and run["status"] == query.get("status", run["status"])
+            ]
+            body = {"workflow_runs": runs[: int(query.get("per_page", 30))]}
+        elif url.path == "/search/issues":
+            body = {"total_count": 2}
+        elif url.path == f"/repos/{REPO}/commits":
+            body = [{"sha": "0123456789abcdef"}]
+        else:
+            self.reply(404, {"message": "Not Found"})
+            return
+        data = json.dumps(body, sort_keys=True).encode()
+        etag = f'"{hashlib.sha256(data).hexdigest()[:16]}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.reply(304)
+        else:
+            self.reply(200, body, etag)
+
+    def do_POST(self):
+        length = int(self.headers["Content-Length"])
+        payload = json.loads(self.rfile.read(length))
+        self.server.requests.append(("POST", self.path, payload))
+        self.reply(200, self.server.graphql)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def api(http_server):
+    return http_server(Handler, requests=[], graphql={"data": GRAPHQL_DATA})
+
+
+@pytest.fixture
+def badges(monkeypatch):
+    spec = importlib.util.spec_from_file_location("generate_badges", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    monkeypatch.setattr(module, "REPO_NAME", REPO)
+    return module
+
+
+def client(badges, api, tmp_path):
+    return badges.GitHubClient("token", tmp_path / "cache.json", base_url=api.url)
+
+
+def test_conditional_requests_reuse_cached_bodies(badges, api, tmp_path):
+    first = client(badges, api, tmp_path)
+    assert first.get(f"/repos/{REPO}")[1]["stargazers_count"] == 7
+    first.save()
+
+    second = client(badges, api, tmp_path)
+    status, body = second.get(f"/repos/{REPO}")
+    assert (status, body["default_branch"]) == (200, "main")
+    assert second.stats == {"requests": 1, "not_modified": 1}
+    assert api.requests[-1][2]["If-None-Match"].startswith('"')
+
+
+def test_missing_resources_are_not_errors(badges, api, tmp_path):
+    assert badges.fetch_latest_release(client(badges, api, tmp_path)) == "No releases"
+
+
+def test_graphql_metrics_in_one_request(badges, api, tmp_path):
+    metrics = badges.collect_metrics(client(badges, api, tmp_path))
+    assert metrics == {
+        "release": "No releases",
+        "commit": "0123456",
+        "license": "MIT",
+        "stars": 7,
+        "size": "1234 KB",
+        "issues": 2,
+        "ci": "failing",
+    }
+    assert [method for method, *_ in api.requests] == ["POST"]
+    assert api.requests[0][2]["variables"] == {"owner": "sentu", "name": "dotfiles"}
+
+
+def test_graphql_errors_fall_back_to_rest(badges, api, tmp_path):
+    api.graphql = {"errors": [{"message": "Resource not accessible"}]}
+    metrics = badges.collect_metrics(
+        client(badges, api, tmp_path), badges.REMOTE_METRICS
+    )
+    assert metrics == {"stars": 7, "issues": 2, "ci": "passing"}
+    paths = [path for method, path, _ in api.requests if method == "GET"]
+    assert paths.count(f"/repos/{REPO}") == 1
+
+
+def test_ci_ignores_runs_in_progress_and_other_branches(badges, api, tmp_path):
+    assert badges.fetch_ci_status(client(badges, api, tmp_path)) == "passing"
+    runs = [path for _, path, _ in api.requests if "/actions/runs" in path]
+    query = parse_qs(urlsplit(runs[0]).query)
+    assert query["status"] == ["completed"]
+    assert query["branch"] == ["main"]
+    assert badges.fetch_ci_status(client(badges, api, tmp_path), "develop") == (
+        "failing"
+    )
@@ -0,0 +1,238 @@
+"""Inventarios INI con :func:`load_inventory` y aprovisionamiento de flotas."""
+
+import json
+import os
+import sys
+import textwrap
+from pathlib import Path
+
+import pytest
+
+import sentu_install as si
+
+INVENTORY = """\
+# Equipos de prueba
+solo ansible_connection=local
+
+[workstations]
+desk ansible_host=10.0.0.5 ansible_user=ana ansible_port=2222
+laptop ansible_ssh_private_key_file="~/.ssh/id laptop" ; clave con espacio
+
+[containers]
+box ansible_connection=podman ansible_python_interpreter=/usr/bin/python3.12
+desk
+
+[workstations:vars]
+ansible_connection=winrm
+
+[all:children]
+workstations
+"""
+
+
+def write(tmp_path, text):
+    path = tmp_path / "hosts.ini"
+    path.write_text(textwrap.dedent(text), encoding="utf-8")
+    return path
+
+
+def test_hosts_and_variables(tmp_path):
+    hosts = {h.name: h for h in si.load_inventory(write(tmp_path, INVENTORY))}
+    assert list(hosts) == ["solo", "desk", "laptop", "box"]
+    assert hosts["solo"].connection == "local"
+    assert hosts["desk"] == si.FleetHost("desk", "10.0.0.5", "ssh", "ana", 2222)
+    assert hosts["laptop"].address == "laptop"
+    assert hosts["laptop"].key_file == "~/.ssh/id laptop"
+    assert hosts["box"].connection == "podman"
+    assert hosts["box"].python == "/usr/bin/python3.12"
+
+
+def test_limit_by_host_or_group(tmp_path):
+    path = write(tmp_path, INVENTORY)
+
+    def names(limit):
+        return [h.name for h in si.load_inventory(path, limit)]
+
+    assert names(["workstations"]) == ["desk", "laptop"]
+    assert names(["box", "solo"]) == ["solo", "box"]
+    # ``desk`` también está en ``containers``: se incluye una sola vez.
+    assert names(["containers", "workstations"]) == ["desk", "laptop", "box"]
+    assert names(["ungrouped"]) == ["solo"]
+    assert names(["nadie"]) == []
+
+
+def test_malformed_pair_reports_the_line(tmp_path):
+    path = write(tmp_path, "[g]\nhost ansible_user\n")
+    with pytest.raises(ValueError, match=r"hosts\.ini:2"):
+        si.load_inventory(path)
+
+
+def test_unsupported_connection_is_rejected(tmp_path):
+    path = write(tmp_path, "[win]\npc ansible_connection=winrm\n")
+    with pytest.raises(ValueError, match="winrm"):
+        si.load_inventory(path)
+    # Fuera del ``--limit`` no importa.
+    assert si.load_inventory(path, ["otro"]) == []
+
+
+def test_missing_file(tmp_path):
+    with pytest.raises(OSError):
+        si.load_inventory(tmp_path / "no-existe.ini")
+
+
+# -- flota ---------------------------------------------------------------------
+
+# ``ssh`` falso: registra las opciones y ejecuta el comando remoto en
+# ``$SENTU_TEST_REMOTES/<equipo>`` (su HOME). ``caido`` no responde y en
+# ``sinsudo`` el usuario no es root y sudo pide contraseña.
+SSH = """
+import json, os, subprocess, sys
+
+args, options = sys.argv[1:], {}
+while args[0].startswith("-"):
+    flag, value = args.pop(0), args.pop(0)
+    key, _, option = value.partition("=")
+    options.update({key: option} if flag == "-o" else {flag: value})
+host, command = args
+with open(os.environ["SENTU_TEST_LOG"], "a") as log:
+    log.write(json.dumps({"host": host, "options": options}) + "\\n")
+if host == "caido":
+    sys.exit("ssh: connect to host caido port 22: Connection refused")
+path = os.environ["PATH"]
+if host == "sinsudo":
+    os.environ["PATH"] = os.pathsep.join([os.environ["SENTU_TEST_NOSUDO"], path])
+home = os.path.join(os.environ["SENTU_TEST_REMOTES"], host)
+os.makedirs(home, exist_ok=True)
+sys.exit(subprocess.run(["sh", "-c", command], cwd=home).returncode)
+"""
+
+# Ocupa el lugar de ``python3 -``: lee el script y muestra sus argumentos.
+INSTALLER = """#!/bin/sh
+cat > /dev/null
+echo "instalado: $*"
+"""
+
+
+def test_ssh_command_shares_a_control_master():
+    host = si.FleetHost("desk", "10.0.0.5", "ssh", "ana", 2222, "~/.ssh/id")
+    command = host.command(["echo", "a b"], Path("/tmp/ctl"), 7)
+    assert command[-2:] == ["10.0.0.5", "echo 'a b'"]
+    assert command[command.index("-p") + 1] == "2222"
+    assert command[command.index("-l") + 1] == "ana"
+    assert command[command.index("-i") + 1] == os.path.expanduser("~/.ssh/id")
+    options = {command[i + 1] for i, arg in enumerate(command) if arg == "-o"}
+    assert {
+        "BatchMode=yes",
+        "ControlMaster=auto",
+        "ControlPath=/tmp/ctl/%C",
+        "ControlPersist=10m",
+        "ConnectTimeout=7",
+    } <= options
+
+
+def test_local_and_container_commands():
+    argv = ["python3", "-"]
+    assert si.FleetHost("a", "a", "local").command(argv, Path("/c"), 1) == argv
+    box = si.FleetHost("box", "ctr", "podman", "ana")
+    assert box.command(argv, Path("/c"), 1) == [
+        "podman",
+        "exec",
+        "-i",
+        "-u",
+        "ana",
+        "ctr",
+        *argv,
+    ]
+
+
+def test_fleet_isolates_failures_and_reports_each_host(tmp_path, monkeypatch, capsys):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "ssh").write_text(f"#!{sys.executable}\n{textwrap.dedent(SSH)}")
+    installer = bin_dir / "installer"
+    installer.write_text(INSTALLER)
+    nosudo = tmp_path / "nosudo"
+    nosudo.mkdir()
+    (nosudo / "id").write_text("#!/bin/sh\necho 1000\n")
+    (nosudo / "sudo").write_text(
+        "#!/bin/sh\necho 'sudo: a password is required'\nexit 1\n"
+    )
+    for stub in (bin_dir / "ssh", installer, nosudo / "id", nosudo / "sudo"):
+        stub.chmod(0o755)
+    remotes, log = tmp_path / "remotes", tmp_path / "ssh.log"
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("SENTU_TEST_REMOTES", str(remotes))
+    monkeypatch.setenv("SENTU_TEST_LOG", str(log))
+    monkeypatch.setenv("SENTU_TEST_NOSUDO", str(nosudo))
+    monkeypatch.setattr(si, "CACHE_DIR", tmp_path / "cache")
+    bundle = tmp_path / si.BUNDLE_NAME
+    bundle.write_bytes(b"paquete")
+    inventory = write(
+        tmp_path,
+        f"""\
+        bien ansible_user=ana ansible_port=2222 ansible_python_interpreter={installer}
+        caido ansible_python_interpreter={installer}
+        roto ansible_python_interpreter=/bin/false
+        sinsudo ansible_python_interpreter={installer}
+        aqui ansible_connection=local ansible_python_interpreter={installer}
+        """,
+    )
+    repo = Path(si.__file__).resolve().parent
+    args = si.parse_args(
+        ["--bundle", str(bundle), "fleet", str(inventory), "--repo", str(repo)]
+    )
+
+    assert si.fleet_command(args) == 1
+
+    out = capsys.readouterr().out
+    lines = out.splitlines()
+    header = next(i for i, line in enumerate(lines) if line.startswith("equipo "))
+    rows = dict(line.split()[:2] for line in lines[header + 1 : header + 6])
+    assert rows == {
+        "bien": "ok",
+        "caido": "failed",
+        "roto": "failed",
+        "sinsudo": "failed",
+        "aqui": "ok",
+    }
+    assert "Equipos con errores: caido, roto, sinsudo" in out
+
+    logs = tmp_path / "cache" / "fleet"
+    assert "Connection refused" in (logs / "caido.log").read_text()
+    assert "sudo pide contraseña" in (logs / "sinsudo.log").read_text()
+    # Falla antes de subir nada.
+    assert not (remotes / "sinsudo" / si.BUNDLE_NAME).exists()
+    assert "--bundle sentu-bundle.tar.gz" in (logs / "bien.log").read_text()
+    assert f"--bundle {bundle}" in (logs / "aqui.log").read_text()
+    # El paquete se borra solo donde la instalación terminó bien.
+    assert not (remotes / "bien" / si.BUNDLE_NAME).exists()
+    assert (remotes / "roto" / si.BUNDLE_NAME).read_bytes() == b"paquete"
+
+    calls = [json.loads(line) for line in log.read_text().splitlines()]
+    assert {call["host"] for call in calls} == {"bien", "caido", "roto", "sinsudo"}
+    paths = {call["options"]["ControlPath"] for call in calls}
+    assert len(paths) == 1 and paths.pop().endswith("/%C")
+    bien = [call["options"] for call in calls if call["host"] == "bien"]
+    # Conexión, sudo, comprobación del paquete, subida, instalación y limpieza.
+    assert len(bien) == 6
+    assert all(o["-p"] == "2222" and o["-l"] == "ana" for o in bien)
+
+
+@pytest.mark.parametrize(
+    ("euid", "sudo_status", "tty", "needed"),
+    [
+        (0, 1, True, False),
+        (1000, 0, True, False),  # NOPASSWD.
+        (1000, 1, False, False),  # Sin terminal no se puede preguntar.
+        (1000, 1, True, True),
+    ],
+)
+def test_become_password_is_asked_only_when_possible_and_needed(
+    tmp_path, monkeypatch, euid, sudo_status, tty, needed
+):
+    (tmp_path / "sudo").write_text(f"#!/bin/sh\nexit {sudo_status}\n")
+    (tmp_path / "sudo").chmod(0o755)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setattr(si.os, "geteuid", lambda: euid)
+    monkeypatch.setattr(si.sys.stdin, "isatty", lambda: tty, raising=False)
+    assert si.become_password_needed() is needed
@@ -0,0 +1,320 @@
+"""Evaluador de expresiones Jinja y semántica de ``when``/``loop`` nativas."""
+
+import textwrap
+from pathlib import Path
+
+import pytest
+
+import sentu_install as si
+
+
+def scope(**variables):
+    return si._Scope([(variables, False)])
+
+
+# -- expresiones ---------------------------------------------------------------
+
+
+@pytest.mark.parametrize(
+    ("expression", "expected"),
+    [
+        ("1 + 2 * 3", 7),
+        ("(1 + 2) * 3", 9),
+        ("7 // 2 ~ 'x'", "3x"),
+        ("-n + 1", -1),
+        ("n > 1 and n < 3", True),
+        ("not n == 2 or false", False),
+        ("'b' in ['a', 'b']", True),
+        ("'c' not in ['a', 'b']", True),
+        ("'yes' if n == 2 else 'no'", "yes"),
+        ("data.key", "value"),
+        ("data['key'] | upper", "VALUE"),
+        ("items.1", "b"),
+        ("items | join(',')", "a,b"),
+        ("items | length", 2),
+        ("missing | default('x')", "x"),
+        ("missing | d(n)", 2),
+        ("'' | default('x', true)", "x"),
+        ("data | dict2items | first", {"key": "key", "value": "value"}),
+        ("'/a/b.txt' | basename", "b.txt"),
+        ("'yes' | bool", True),
+        ("{'a': n}", {"a": 2}),
+    ],
+)
+def test_expression_values(expression, expected):
+    variables = scope(n=2, data={"key": "value"}, items=["a", "b"])
+    assert variables.template("{{ " + expression + " }}") == expected
+
+
+@pytest.mark.parametrize(
+    ("expression", "expected"),
+    [
+        ("missing is defined", False),
+        ("missing is undefined", True),
+        ("n is not none", True),
+        ("data is mapping", True),
+        ("n is number and name is string", True),
+    ],
+)
+def test_tests(expression, expected):
+    assert scope(n=2, name="x", data={}).evaluate(expression) is expected
+
+
+def test_template_keeps_type_of_single_expression():
+    variables = scope(items=[1, 2])
+    assert variables.template("{{ items }}") == [1, 2]
+    assert variables.template("n={{ items | length }}") == "n=2"
+    assert variables.template({"a": ["{{ items.0 }}"]}) == {"a": [1]}
+
+
+def test_evaluate_strips_braces_and_coerces_strings():
+    variables = scope(flag="yes", n=0)
+    assert variables.evaluate("{{ flag | bool }}") is True
+    assert variables.evaluate("flag") is True
+    assert variables.evaluate("n") is False
+    assert variables.evaluate(True) is True
+
+
+def test_undefined_fails_when_used():
+    variables = scope()
+    with pytest.raises(si.TemplateError, match="missing"):
+        variables.template("{{ missing }}-x")
+    with pytest.raises(si.TemplateError):
+        variables.evaluate("missing == 1")
+    with pytest.raises(si.TemplateError):
+        variables.template("{{ missing | upper }}")
+
+
+def test_non_strict_template_returns_undefined():
+    value = scope().template("{{ missing }}-x", strict=False)
+    assert isinstance(value, si._Undefined)
+
+
+def test_lazy_layers_template_on_lookup_with_precedence():
+    play = {"base": "/opt", "path": "{{ base }}/bin"}
+    extra = {"base": "/usr"}
+    variables = si._Scope([(extra, True), (play, True)])
+    assert variables.template("{{ path }}") == "/usr/bin"
+    assert variables.child({"base": "/srv"}).template("{{ path }}") == "/srv/bin"
+
+
+def test_recursive_definition_is_an_error():
+    variables = si._Scope([({"a": "{{ b }}", "b": "{{ a }}"}, True)])
+    with pytest.raises(si.TemplateError):
+        variables.template("{{ a | upper }}")
+
+
+def test_unsupported_constructs():
+    with pytest.raises(si.TemplateError):
+        si._compile_template("{% if x %}y{% endif %}")
+    with pytest.raises(si.TemplateError):
+        si.compile_expression("1 +")
+    with pytest.raises(si.NativeUnsupported):
+        si._check_expression(si.compile_expression("x | regex_replace('a', 'b')"))
+    with pytest.raises(si.NativeUnsupported):
+        si._check_expression(si.compile_expression("lookup('pipe', 'ls')"))
+
+
+def test_lookup_env(monkeypatch):
+    monkeypatch.setenv("SENTU_TEST_VALUE", "42")
+    variables = scope()
+    assert variables.template("{{ lookup('env', 'SENTU_TEST_VALUE') }}") == "42"
+    assert variables.template("{{ query('env', 'SENTU_TEST_VALUE') }}") == ["42"]
+
+
+# -- when / loop -----------------------------------------------------------------
+
+
+def make_playbook(tmp_path, tasks, extra_vars=None):
+    """Playbook de un solo role ``demo`` con ``tasks`` como su main.yml."""
+    (tmp_path / "playbook.yml").write_text(
+        textwrap.dedent(
+            """\
+            - hosts: localhost
+              gather_facts: false
+              vars:
+                greeting: hola
+                enabled: true
+              roles:
+                - demo
+            """
+        ),
+        encoding="utf-8",
+    )
+    tasks_dir = tmp_path / "roles" / "demo" / "tasks"
+    tasks_dir.mkdir(parents=True)
+    (tasks_dir / "main.yml").write_text(textwrap.dedent(tasks), encoding="utf-8")
+    return si.NativePlaybook(tmp_path, extra_vars)
+
+
+def run(playbook, role="demo"):
+    lines = []
+    ok = playbook.run_role(role, log=lines.append)
+    return ok, lines
+
+
+def test_when_false_skips_and_registers_skipped(tmp_path):
+    playbook = make_playbook(
+        tmp_path,
+        """\
+        - name: Nunca
+          command: echo nunca
+          when: not enabled
+          register: never
+        - name: Siempre
+          set_fact:
+            seen: "{{ never.skipped }}"
+          when:
+            - enabled
+            - greeting == 'hola'
+        """,
+    )
+    ok, lines = run(playbook)
+    assert ok
+    assert "skipping: [localhost]" in lines
+    assert playbook.host_vars["seen"] is True
+    assert playbook.stats["skipped"] == 1
+
+
+def test_loop_evaluates_when_per_item(tmp_path):
+    playbook = make_playbook(
+        tmp_path,
+        """\
+        - name: Eco
+          command: echo {{ item }}
+          loop: "{{ numbers }}"
+          when: item > 1
+          register: echoed
+        """,
+        extra_vars={"numbers": [1, 2, 3]},
+    )
+    ok, lines = run(playbook)
+    assert ok
+    results = playbook.host_vars["echoed"]["results"]
+    assert [r.get("skipped", False) for r in results] == [True, False, False]
+    assert [r.get("stdout") for r in results[1:]] == ["2", "3"]
+    assert "skipping: [localhost] => (item=1)" in lines
+    assert playbook.host_vars["echoed"]["changed"] is True
+
+
+def test_loop_control_and_empty_loop(tmp_path):
+    playbook = make_playbook(
+        tmp_path,
+        """\
+        - name: Pares
+          debug:
+            msg: "{{ idx }}={{ pair.key }}"
+          loop: "{{ mapping | dict2items }}"
+          loop_control:
+            loop_var: pair
+            index_var: idx
+            label: "{{ pair.key }}"
+          register: pairs
+        - name: Vacío
+          command: "false"
+          loop: []
+          register: empty
+        """,
+        extra_vars={"mapping": {"a": 1, "b": 2}},
+    )
+    ok, lines = run(playbook)
+    assert ok
+    shown = [r["debug"]["msg"] for r in playbook.host_vars["pairs"]["results"]]
+    assert shown == ["0=a", "1=b"]
+    assert "ok: [localhost] => (item=b)" in lines
+    assert playbook.host_vars["empty"]["results"] == []
+    assert playbook.host_vars["empty"]["skipped"] is False
+
+
+def test_loop_must_be_a_list(tmp_path):
+    playbook = make_playbook(
+        tmp_path,
+        """\
+        - name: Mal
+          debug:
+            msg: x
+          loop: "{{ greeting }}"
+        """,
+    )
+    ok, _ = run(playbook)
+    assert not ok
+    assert playbook.stats["failed"] == 1
+
+
+def test_changed_and_failed_when_see_the_result(tmp_path):
+    playbook = make_playbook(
+        tmp_path,
+        """\
+        - name: Comprobar
+          command: sh -c 'echo listo; exit 3'
+          register: check
+          changed_when: false
+          failed_when: check.rc not in [0, 3]
+        - name: Falla
+          command: "false"
+          ignore_errors: true
+        - name: Después
+          set_fact:
+            rc: "{{ check.rc }}"
+        """,
+    )
+    ok, _ = run(playbook)
+    assert ok
+    assert playbook.host_vars["check"]["changed"] is False
+    assert playbook.host_vars["rc"] == 3
+    assert playbook.stats["failed"] == 0
+
+
+def test_failure_stops_the_role(tmp_path):
+    playbook = make_playbook(
+        tmp_path,
+        """\
+        - name: Falla
+          command: "false"
+        - name: No llega
+          set_fact:
+            reached: true
+        """,
+    )
+    ok, lines = run(playbook)
+    assert not ok
+    assert "reached" not in playbook.host_vars
+    assert any(line.startswith("fatal: [localhost]") for line in lines)
+
+
+def test_unsupported_playbooks_are_rejected_up_front(tmp_path):
+    with pytest.raises(si.NativeUnsupported, match="copy"):
+        make_playbook(
+            tmp_path,
+            """\
+            - name: Copia
+              copy:
+                src: a
+                dest: b
+            """,
+        )
+
+
+@pytest.mark.parametrize(
+    "task",
+    [
+        "file:\n    path: /tmp/x\n    owner: root",
+        "file:\n    path: /tmp/x\n    state: hard\n    src: /tmp/y",
+        "file:\n    path: /tmp/x\n    state: link",
+        "file:\n    state: directory",
+        "dnf:\n    name: git\n    state: latest",
+        'dnf:\n    name: git\n    state: "{{ wanted }}"',
+        "dnf:\n    name: git\n    enablerepo: updates",
+        "command:\n    chdir: /tmp",
+        "shell:\n    cmd: ls\n    stdin: x",
+        "debug:\n    msg: x\n    when: y",
+    ],
+)
+def test_unsupported_module_arguments_are_rejected_up_front(tmp_path, task):
+    with pytest.raises(si.NativeUnsupported):
+        make_playbook(tmp_path, f"- name: Tarea\n  {task}\n")
+
+
+def test_repository_playbook_is_native():
+    playbook = si.NativePlaybook(Path(__file__).resolve().parent.parent / "ansible")
+    assert "install_fonts" in playbook.roles
@@ -0,0 +1,335 @@
+"""Plan de paquetes y repositorios contra ``rpm`` y ``dnf`` falsos en ``PATH``."""
+
+import io
+import json
+import os
+import sys
+import textwrap
+from pathlib import Path
+
+import pytest
+
+import sentu_install as si
+
+# Base RPM simulada: ``state.json`` con paquetes instalados (y sus
+# capacidades), archivos con dueño y lo que ofrecen los repositorios. Los
+# stubs responden en español salvo con ``LC_ALL=C``.
+RPM = """
+import json, os, sys
+
+state = json.load(open(os.environ["SENTU_TEST_STATE"]))
+args = sys.argv[1:]
+if args[0] == "-qa":
+    for provides in state["installed"].values():
+        print("\\n".join(provides))
+elif args[0] == "-qf":
+    status = 0
+    for path in args[3:]:
+        if path in state["owned"]:
+            print(state["owned"][path])
+        elif os.environ.get("LC_ALL") == "C":
+            print(f"file {path} is not owned by any package")
+            status = 1
+        else:
+            print(f"el archivo {path} no pertenece a ningún paquete")
+            status = 1
+    sys.exit(status)
+elif args[0] == "-q":
+    status = 0
+    for name in args[3:]:
+        if name in state["installed"]:
+            print(f"{name} 0:1.0-1.x86_64")
+        elif os.environ.get("LC_ALL") == "C":
+            print(f"package {name} is not installed")
+            status = 1
+        else:
+            print(f"el paquete {name} no está instalado")
+            status = 1
+    sys.exit(status)
+"""
+
+DNF = """
+import json, os, sys
+
+state = json.load(open(os.environ["SENTU_TEST_STATE"]))
+with open(os.environ["SENTU_TEST_LOG"], "a") as log:
+    log.write(json.dumps(sys.argv[1:]) + "\\n")
+english = os.environ.get("LC_ALL") == "C"
+command, args = sys.argv[1], sys.argv[2:]
+if command == "upgrade":
+    if not state["upgrades"]:
+        print("Nothing to do." if english else "Nada para hacer.")
+    elif english:
+        print("Total download size: 12 M\\nComplete!")
+    else:
+        print("Tamaño total de la descarga: 12 M\\n¡Listo!")
+elif command == "install":
+    for arg in args:
+        if arg.endswith(".rpm"):
+            name = open(arg).read().removeprefix("Name: ").strip()
+            state["installed"][name] = [name]
+    json.dump(state, open(os.environ["SENTU_TEST_STATE"], "w"))
+    print("Complete!")
+elif state["offline"]:
+    sys.exit("Error: Failed to download metadata for repo 'fedora'")
+elif "--whatprovides" in args:
+    wanted = args[args.index("--whatprovides") + 1].split(",")
+    for package, provides in state["available"].items():
+        names = {p.split(" ")[0] for p in provides}
+        if any(c in names or f"/usr/bin/{c}" in names for c in wanted):
+            print("@" + package)
+            print("\\n".join(provides))
+else:
+    names = [a for i, a in enumerate(args) if a[0] != "-" and args[i - 1] != "--qf"]
+    print("\\n".join(name for name in names if name in state["available"]))
+"""
+
+# Como el sudo real con env_reset: el idioma del usuario no pasa.
+SUDO = """
+import os, sys
+
+os.environ.pop("LC_ALL", None)
+argv = sys.argv[1:]
+while argv[0].startswith("-"):
+    argv.pop(0)
+os.execvp(argv[0], argv)
+"""
+
+
+@pytest.fixture
+def rpmdb(tmp_path, monkeypatch):
+    """Estado de la base simulada; se reescribe al modificarlo con ``save``."""
+    tmp_path = tmp_path.resolve()
+    bin_dir = tmp_path / "bin"
+    for directory in (bin_dir, tmp_path / "usr-bin", tmp_path / "cargo-bin"):
+        directory.mkdir()
+    for name, body in (("rpm", RPM), ("dnf", DNF), ("sudo", SUDO)):
+        stub = bin_dir / name
+        stub.write_text(f"#!{sys.executable}\n{textwrap.dedent(body)}")
+        stub.chmod(0o755)
+
+    class State(dict):
+        log = tmp_path / "dnf.log"
+        bin = bin_dir
+
+        def save(self):
+            (tmp_path / "state.json").write_text(json.dumps(self))
+
+        def dnf_calls(self):
+            if not self.log.exists():
+                return []
+            return [json.loads(line) for line in self.log.read_text().splitlines()]
+
+    state = State(
+        installed={}, owned={}, available={}, upgrades=False, offline=False
+    )
+    state.save()
+    path = os.pathsep.join(str(tmp_path / d) for d in ("bin", "usr-bin", "cargo-bin"))
+    monkeypatch.setenv("PATH", f"{path}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("SENTU_TEST_STATE", str(tmp_path / "state.json"))
+    monkeypatch.setenv("SENTU_TEST_LOG", str(state.log))
+    monkeypatch.setenv("LC_ALL", "es_ES.UTF-8")
+    monkeypatch.delenv("SENTU_RUN_ID", raising=False)
+    return state
+
+
+def executable(state, name: str, directory: str = "usr-bin"):
+    """Crea ``<tmp>/<directory>/<name>`` (ya en ``PATH``) y devuelve su ruta."""
+    path = state.bin.parent / directory / name
+    path.write_text("#!/bin/sh\n")
+    path.chmod(0o755)
+    return str(path)
+
+
+def test_installed_capabilities_come_from_one_query(rpmdb):
+    rpmdb["installed"] = {"git": ["git", "git-core"], "vim": ["vim-enhanced"]}
+    rpmdb.save()
+    assert si.installed_capabilities() == {"git", "git-core", "vim-enhanced"}
+
+
+def test_unowned_executables_do_not_count_under_any_locale(rpmdb):
+    gxx = executable(rpmdb, "g++")
+    executable(rpmdb, "cargo", directory="cargo-bin")  # Instalado con rustup.
+    rpmdb["owned"] = {gxx: "gcc-c++"}
+    rpmdb.save()
+    assert si.rpm_owned_executables(["g++", "cargo", "no-existe"]) == {"g++"}
+
+
+def test_available_packages_match_by_name_capability_or_executable(rpmdb):
+    rpmdb["available"] = {
+        "ripgrep": ["ripgrep"],
+        "gcc-c++": ["gcc-c++", "/usr/bin/g++"],
+        "java-21-openjdk": ["java-21-openjdk", "java = 21"],
+    }
+    rpmdb.save()
+    found = si.available_packages(["ripgrep", "g++", "java", "no-existe"])
+    assert found == {"ripgrep", "g++", "java"}
+    first, second = rpmdb.dnf_calls()
+    assert first[0] == second[0] == "repoquery"
+    assert second[second.index("--whatprovides") + 1] == "g++,java,no-existe"
+
+
+def test_available_packages_skip_capability_query_when_names_match(rpmdb):
+    rpmdb["available"] = {"ripgrep": ["ripgrep"]}
+    rpmdb.save()
+    assert si.available_packages(["ripgrep"]) == {"ripgrep"}
+    assert len(rpmdb.dnf_calls()) == 1
+    assert si.available_packages([]) == set()
+    assert len(rpmdb.dnf_calls()) == 1
+
+
+def test_installed_versions_ignore_packages_that_are_not_installed(rpmdb):
+    rpmdb["installed"] = {"git": ["git"]}
+    rpmdb.save()
+    assert si._installed_versions({"git", "zz"}) == {"git": ["0:1.0-1.x86_64"]}
+
+
+def test_dnf_metadata_is_stamped_fresh_only_after_a_successful_query(
+    rpmdb, tmp_path, monkeypatch
+):
+    monkeypatch.setenv("SENTU_RUN_ID", "run-1")
+    monkeypatch.setattr(si.os, "geteuid", lambda: 0)
+    monkeypatch.setattr(si, "DNF_RUN_MARKER", tmp_path / "dnf-metadata")
+    rpmdb["available"] = {"ripgrep": ["ripgrep"]}
+    rpmdb["offline"] = True
+    rpmdb.save()
+    assert si.available_packages(["ripgrep"]) == set()
+    assert si.dnf_metadata_options() == []
+
+    rpmdb["offline"] = False
+    rpmdb.save()
+    assert si.available_packages(["ripgrep"]) == {"ripgrep"}
+    assert si.dnf_metadata_options() == ["--setopt=metadata_expire=never"]
+
+
+def test_plan_packages_diffs_against_the_rpm_database(rpmdb):
+    gxx = executable(rpmdb, "g++")
+    executable(rpmdb, "cargo", directory="cargo-bin")
+    rpmdb["installed"] = {"git": ["git"], "gcc-c++": ["gcc-c++"]}
+    rpmdb["owned"] = {gxx: "gcc-c++"}
+    rpmdb["available"] = {"ripgrep": ["ripgrep"], "cargo": ["cargo"]}
+    rpmdb.save()
+    config = {
+        "packages": {"core": ["git", "g++", "ripgrep"], "dev": ["git", "cargo", "zz"]},
+        "package_plan": [
+            {"name": "core", "lists": ["packages.core"]},
+            {"name": "dev", "lists": ["packages.dev"], "options": ["--best"]},
+        ],
+    }
+
+    core, dev = si.plan_packages(config)
+    assert (core.group, core.present) == ("core", ["git", "g++"])
+    assert (core.to_install, core.unavailable) == (["ripgrep"], [])
+    assert (dev.present, dev.to_install, dev.unavailable) == ([], ["cargo"], ["zz"])
+    assert (dev.options, dev.duplicates) == (["--best"], ["git"])
+    assert [plan.group for plan in si.plan_packages(config, groups=["dev"])] == ["dev"]
+
+
+@pytest.mark.parametrize("euid", [0, 1000])
+def test_system_upgrade_reads_dnf_output_in_english(rpmdb, tmp_path, monkeypatch, euid):
+    monkeypatch.setattr(si.os, "geteuid", lambda: euid)
+    monkeypatch.setattr(si, "UPGRADE_STAMP", tmp_path / "upgrade.json")
+    assert si.system_upgrade({"policy": "full"}).status == "current"
+
+    rpmdb["upgrades"] = True
+    rpmdb.save()
+    report = si.system_upgrade({"policy": "full"}, force=True)
+    assert (report.status, report.download_size) == ("upgraded", "12 M")
+
+
+@pytest.mark.parametrize("become", [False, True])
+def test_native_dnf_upgrade_reports_changed_from_english_output(
+    rpmdb, tmp_path, monkeypatch, become
+):
+    monkeypatch.setattr(si.os, "geteuid", lambda: 1000)
+    (tmp_path / "playbook.yml").write_text("- hosts: localhost\n  roles: []\n")
+    playbook = si.NativePlaybook(tmp_path)
+    upgrade = {"name": "*", "state": "latest"}
+    assert playbook._dnf(upgrade, become, {})["changed"] is False
+    rpmdb["upgrades"] = True
+    rpmdb.save()
+    assert playbook._dnf(upgrade, become, {})["changed"] is True
+
+
+# -- repositorios ----------------------------------------------------------------
+
+REPOS = {
+    "rpmfusion-free": {
+        "release_rpm": "https://example.invalid/rpmfusion-free-{{ fedora_version }}.rpm",
+        "package": "rpmfusion-free-release",
+        "repos": ["rpmfusion-free"],
+    },
+    "chrome": {
+        "release_rpm": "https://example.invalid/google-chrome.rpm",
+        "package": "google-chrome-stable",
+    },
+    "docker": {
+        "repofile": "https://example.invalid/docker-ce.repo",
+        "repos": ["docker-ce-stable"],
+    },
+    "lazygit": {"copr": "atim/lazygit"},
+}
+COPR_URL = (
+    "https://copr.fedorainfracloud.org/coprs/atim/lazygit/repo/fedora-40/"
+    "atim-lazygit-fedora-40.repo"
+)
+COPR_FILE = "_copr:copr.fedorainfracloud.org:atim:lazygit.repo"
+
+
+@pytest.fixture
+def repos_dir(tmp_path):
+    path = tmp_path / "yum.repos.d"
+    path.mkdir()
+    return path
+
+
+def test_configured_repositories_are_skipped(rpmdb, repos_dir):
+    (repos_dir / "rpmfusion.repo").write_text("[rpmfusion-free]\nname=x\n")
+    (repos_dir / "docker-ce.repo").write_text("# sin secciones\n")
+    rpmdb["installed"] = {"google-chrome-stable": ["google-chrome-stable"]}
+    rpmdb.save()
+    plan = si.plan_repositories(REPOS, repos_dir, {"fedora_version": "40"})
+    assert plan.present == ["rpmfusion-free", "chrome", "docker"]
+    assert plan.release_rpms == {}
+    assert plan.repo_files == {"lazygit": (COPR_URL, COPR_FILE)}
+
+
+def test_copr_resolves_to_its_repo_file(rpmdb, repos_dir):
+    repos = {"lazygit": REPOS["lazygit"]}
+    plan = si.plan_repositories(repos, repos_dir, {"fedora_version": "40"})
+    assert plan.repo_files == {"lazygit": (COPR_URL, COPR_FILE)}
+    (repos_dir / "otro.repo").write_text(
+        "[copr:copr.fedorainfracloud.org:atim:lazygit]\nname=x\n"
+    )
+    again = si.plan_repositories(repos, repos_dir, {"fedora_version": "40"})
+    assert (again.present, again.repo_files) == (["lazygit"], {})
+
+
+def test_release_rpms_go_in_one_transaction(rpmdb, repos_dir, tmp_path):
+    variables = {"fedora_version": "40"}
+    cache = si.ArtifactCache(tmp_path / "cache", offline=True)
+    for name, url in (
+        ("rpmfusion-free-release", "https://example.invalid/rpmfusion-free-40.rpm"),
+        ("google-chrome-stable", "https://example.invalid/google-chrome.rpm"),
+    ):
+        cache.put(url, io.BytesIO(f"Name: {name}\n".encode()))
+    cache.put(REPOS["docker"]["repofile"], io.BytesIO(b"[docker-ce-stable]\n"))
+    cache.put(COPR_URL, io.BytesIO(b"[copr:copr.fedorainfracloud.org:atim:lazygit]\n"))
+
+    plan = si.plan_repositories(REPOS, repos_dir, variables)
+    assert list(plan.release_rpms) == ["rpmfusion-free", "chrome"]
+    assert si.apply_repositories(plan, repos_dir, cache)
+
+    installs = [call for call in rpmdb.dnf_calls() if call[0] == "install"]
+    assert len(installs) == 1
+    assert [Path(arg).name for arg in installs[0] if arg.endswith(".rpm")] == [
+        "rpmfusion-free-40.rpm",
+        "google-chrome.rpm",
+    ]
+    assert (repos_dir / "docker-ce.repo").read_bytes() == b"[docker-ce-stable]\n"
+    assert (repos_dir / COPR_FILE).stat().st_mode & 0o777 == 0o644
+
+    again = si.plan_repositories(REPOS, repos_dir, variables)
+    assert again.present == list(REPOS)
+    assert si.apply_repositories(again, repos_dir, cache)
+    assert len(rpmdb.dnf_calls()) == len(installs)
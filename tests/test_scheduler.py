@@ -0,0 +1,123 @@
+"""Orden de dependencias y exclusiones de :func:`schedule_roles`."""
+
+import threading
+import time
+
+import pytest
+
+import sentu_install as si
+
+
+class Recorder:
+    """``run_role`` que registra el intervalo en que se ejecutó cada role."""
+
+    def __init__(self, fail=(), delay=0.02, raise_in=()):
+        self.fail = set(fail)
+        self.raise_in = set(raise_in)
+        self.delay = delay
+        self.spans = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, role):
+        start = time.monotonic()
+        time.sleep(self.delay)
+        with self.lock:
+            self.spans[role] = (start, time.monotonic())
+        if role in self.raise_in:
+            raise OSError(f"{role} explotó")
+        return role not in self.fail, f"salida de {role}"
+
+    def overlap(self, a, b):
+        (start_a, end_a), (start_b, end_b) = self.spans[a], self.spans[b]
+        return start_a < end_b and start_b < end_a
+
+
+def test_dependencies_run_first():
+    recorder = Recorder()
+    results = si.schedule_roles(
+        ["app", "db", "base"],
+        recorder,
+        depends_on={"app": ["db", "base"], "db": ["base"]},
+    )
+    assert list(results) == ["app", "db", "base"]
+    assert all(r.status == "ok" for r in results.values())
+    assert results["app"].output == "salida de app"
+    assert recorder.spans["base"][1] <= recorder.spans["db"][0]
+    assert recorder.spans["db"][1] <= recorder.spans["app"][0]
+
+
+def test_independent_roles_run_in_parallel():
+    recorder = Recorder(delay=0.1)
+    si.schedule_roles(["a", "b"], recorder, max_workers=2)
+    assert recorder.overlap("a", "b")
+
+
+def test_failed_dependency_skips_dependents_transitively():
+    recorder = Recorder(fail={"base"})
+    seen = []
+    results = si.schedule_roles(
+        ["base", "db", "app", "other"],
+        recorder,
+        depends_on={"db": ["base"], "app": ["db"]},
+        on_result=lambda result: seen.append(result.role),
+    )
+    assert {role: r.status for role, r in results.items()} == {
+        "base": "failed",
+        "db": "skipped",
+        "app": "skipped",
+        "other": "ok",
+    }
+    assert set(recorder.spans) == {"base", "other"}
+    assert sorted(seen) == sorted(results)
+
+
+def test_raising_role_fails_without_stopping_the_others():
+    recorder = Recorder(delay=0.05, raise_in={"base"})
+    seen = []
+    results = si.schedule_roles(
+        ["base", "slow", "db"],
+        recorder,
+        depends_on={"db": ["base"]},
+        on_result=lambda result: seen.append(result.role),
+    )
+    assert {role: r.status for role, r in results.items()} == {
+        "base": "failed",
+        "slow": "ok",
+        "db": "skipped",
+    }
+    assert results["base"].output == "OSError: base explotó\n"
+    assert recorder.overlap("base", "slow")
+    assert sorted(seen) == sorted(results)
+
+
+def test_dependencies_outside_the_run_are_ignored():
+    results = si.schedule_roles(["app"], Recorder(), depends_on={"app": ["db"]})
+    assert results["app"].status == "ok"
+
+
+def test_exclusive_roles_never_overlap():
+    recorder = Recorder(delay=0.05)
+    dnf = {"fonts", "repos", "packages"}
+    si.schedule_roles(
+        ["fonts", "repos", "packages", "links"],
+        recorder,
+        exclusive=dnf,
+        max_workers=4,
+    )
+    for a in dnf:
+        for b in dnf - {a}:
+            assert not recorder.overlap(a, b)
+    # Un role no exclusivo sí puede solaparse con ellos.
+    assert recorder.overlap("fonts", "links")
+
+
+def test_ready_roles_start_in_playbook_order():
+    recorder = Recorder(delay=0.01)
+    si.schedule_roles(["c", "a", "b"], recorder, exclusive={"a", "b", "c"})
+    order = sorted(recorder.spans, key=lambda role: recorder.spans[role][0])
+    assert order == ["c", "a", "b"]
+
+
+def test_cycles_are_rejected():
+    with pytest.raises(ValueError):
+        si.schedule_roles(["a", "b"], Recorder(), depends_on={"a": ["b"], "b": ["a"]})